@@ -3,16 +3,19 @@ from CommonServerPython import *
 from CommonServerUserPython import *
 
 ''' IMPORTS '''
+import codecs
 import csv
-import gzip
+import itertools
+import zlib
 import urllib3
 from dateutil.parser import parse
-from typing import Optional, Pattern, Dict, Any, Tuple, Union, List
+from typing import Optional, Pattern, Dict, Any, Tuple, Union, List, Iterator
 
 # disable insecure warnings
 urllib3.disable_warnings()
 
 # Globals
+CHUNK_SIZE = 1024 * 1024
 
 
 class Client(BaseClient):
@@ -20,7 +23,8 @@ class Client(BaseClient):
                  insecure: bool = False, credentials: dict = None, ignore_regex: str = None, encoding: str = 'latin-1',
                  delimiter: str = ',', doublequote: bool = True, escapechar: str = '',
                  quotechar: str = '"', skipinitialspace: bool = False, polling_timeout: int = 20, proxy: bool = False,
-                 feedTags: Optional[str] = None, tlp_color: Optional[str] = None, value_field: str = 'value', **kwargs):
+                 feedTags: Optional[str] = None, tlp_color: Optional[str] = None, value_field: str = 'value',
+                 max_concurrency: int = 1, conditional_fetch: bool = False, **kwargs):
         """
         :param url: URL of the feed.
         :param feed_url_to_config: for each URL, a configuration of the feed that contains
@@ -62,6 +66,14 @@ class Client(BaseClient):
         :param polling_timeout: timeout of the polling request in seconds. Default: 20
         :param proxy: Sets whether use proxy when sending requests
         :param tlp_color: Traffic Light Protocol color.
+        :param max_concurrency: The maximal number of feed URLs to download concurrently. Default: 1
+            When greater than 1, the URLs are downloaded concurrently to spooled temporary files (see
+            `spool_response`), and parsed in the order of the URLs.
+        :param conditional_fetch: Whether to skip feed URLs which did not change since the last fetch. The ETag
+            and Last-Modified of each URL are kept in the integration context (see `fetch_state`), and a URL is
+            skipped when the server answers 304 Not Modified. When the server sends neither, the content is
+            spooled and hashed (see `spool_response`), and a URL is skipped when its content hash is unchanged.
+            Default: False
         """
         self.tags: List[str] = argToList(feedTags)
         self.tlp_color = tlp_color
@@ -89,6 +101,18 @@ class Client(BaseClient):
             self.polling_timeout = int(polling_timeout)
         except (ValueError, TypeError):
             return_error('Please provide an integer value for "Request Timeout"')
+        try:
+            self.max_concurrency = max(int(max_concurrency), 1)
+        except (ValueError, TypeError):
+            return_error('Please provide an integer value for "Maximum concurrent requests"')
+        # one pooled session is shared by all the feed URLs, and honours the proxy environment variables
+        self._session = build_feed_session(self.max_concurrency)
+        self.conditional_fetch = argToBoolean(conditional_fetch)
+        # the state of the last fetch, and the state of this fetch to save once its indicators were created. The
+        # state of a feed URL is moved from read_fetch_state to new_fetch_state once its content was read to the end
+        self.fetch_state: Dict[str, dict] = {}
+        self.new_fetch_state: Dict[str, dict] = {}
+        self.read_fetch_state: Dict[str, dict] = {}
         self.encoding = encoding
         self.ignore_regex: Optional[Pattern] = None
         if ignore_regex is not None:
@@ -112,43 +136,86 @@ class Client(BaseClient):
 
         return r.prepare()
 
+    def get_feed_response(self, url, **kwargs):
+        """Send the HTTP request of a feed URL.
+
+        Args:
+            url: The feed URL.
+            kwargs: Arguments to send with the request.
+
+        Returns:
+            requests.Response. The response, or None if conditional fetch is used and the feed did not change.
+        """
+        prepreq = self._build_request(url)
+        previous_state = self.fetch_state.get(url, {})
+        if self.conditional_fetch:
+            prepreq.headers.update(conditional_request_headers(previous_state))
+
+        # this is to honour the proxy environment variables
+        kwargs.update(self._session.merge_environment_settings(
+            prepreq.url,
+            {}, None, None, None  # defaults
+        ))
+        kwargs['stream'] = True
+        kwargs['verify'] = self._verify
+        kwargs['timeout'] = self.polling_timeout
+
+        if self.headers:
+            kwargs['headers'] = {**kwargs.get('headers', {}), **self.headers}
+
+        try:
+            r = self._session.send(prepreq, **kwargs)
+        except requests.ConnectionError:
+            raise requests.ConnectionError('Failed to establish a new connection.'
+                                           ' Please make sure your URL is valid.')
+        if self.conditional_fetch and r.status_code == 304:
+            r.close()
+            self.new_fetch_state[url] = previous_state
+            return None
+        try:
+            r.raise_for_status()
+        except Exception:
+            return_error('Exception in request: {} {}'.format(r.status_code, r.content))
+            raise
+
+        state = response_fetch_state(r)
+        if self.conditional_fetch and not (state['etag'] or state['last_modified']):
+            # the server does not support conditional requests, so the body is hashed before it is parsed
+            state['hash'] = spool_response(r)
+            if state['hash'] == previous_state.get('hash'):
+                r.close()
+                self.new_fetch_state[url] = state
+                return None
+        elif self.max_concurrency > 1:
+            # the body is downloaded in the worker thread, while the feed URLs before it are parsed
+            spool_response(r)
+        if self.conditional_fetch:
+            self.read_fetch_state[url] = state
+        return r
+
+    def iter_feed_content(self, url: str, items: Iterator) -> Iterator:
+        """
+        Yield the content of a feed URL, and keep its fetch state once the content was read to the end, so a feed
+        URL which was cut short (e.g. by the fetch limit) is read in full by the next fetch.
+        :param url: The feed URL
+        :param items: The content of the feed URL
+        :return: The content
+        """
+        yield from items
+        if url in self.read_fetch_state:
+            self.new_fetch_state[url] = self.read_fetch_state.pop(url)
+
     def build_iterator(self, **kwargs):
         results = []
         urls = self._base_url
         if not isinstance(urls, list):
             urls = [urls]
-        for url in urls:
-            _session = requests.Session()
-
-            prepreq = self._build_request(url)
-
-            # this is to honour the proxy environment variables
-            kwargs.update(_session.merge_environment_settings(
-                prepreq.url,
-                {}, None, None, None  # defaults
-            ))
-            kwargs['stream'] = True
-            kwargs['verify'] = self._verify
-            kwargs['timeout'] = self.polling_timeout
-
-            if self.headers:
-                if 'headers' in kwargs:
-                    kwargs['headers'].update(self.headers)
-                else:
-                    kwargs['headers'] = self.headers
-
-            try:
-                r = _session.send(prepreq, **kwargs)
-            except requests.ConnectionError:
-                raise requests.ConnectionError('Failed to establish a new connection.'
-                                               ' Please make sure your URL is valid.')
-            try:
-                r.raise_for_status()
-            except Exception:
-                return_error('Exception in request: {} {}'.format(r.status_code, r.content))
-                raise
-
-            response = self.get_feed_content_divided_to_lines(url, r)
+        responses = ordered_concurrent_map(lambda url: self.get_feed_response(url, **kwargs), urls,
+                                           self.max_concurrency)
+        for url, r in zip(urls, responses):
+            if r is None:
+                continue
+            response = self.iter_feed_content(url, self.get_feed_content_divided_to_lines(url, r))
             if self.feed_url_to_config:
                 fieldnames = self.feed_url_to_config.get(url, {}).get('fieldnames', [])
             else:
@@ -170,21 +237,55 @@ class Client(BaseClient):
         return results
 
     def get_feed_content_divided_to_lines(self, url, raw_response):
-        """Fetch feed data and divides its content to lines
+        """Streams feed data and divides its content to lines
 
         Args:
             url: Current feed's url.
             raw_response: The raw response from the feed's url.
 
         Returns:
-            List. List of lines from the feed content.
+            Generator. Lines of the feed content, read from the response one chunk at a time.
         """
+        chunks = raw_response.iter_content(chunk_size=CHUNK_SIZE)
         if self.feed_url_to_config and self.feed_url_to_config.get(url).get('is_zipped_file'):  # type: ignore
-            response_content = gzip.decompress(raw_response.content)
-        else:
-            response_content = raw_response.content
+            chunks = gunzip_chunks(chunks)
+
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        pending = ''
+        for chunk in chunks:
+            pending += decoder.decode(chunk)
+            lines = pending.split('\n')
+            pending = lines.pop()
+            yield from lines
+
+        pending += decoder.decode(b'', final=True)
+        yield from pending.split('\n')
+
+
+def gunzip_chunks(chunks):
+    """Decompresses gzip data given in chunks, without holding the whole file in memory.
 
-        return response_content.decode(self.encoding).split('\n')
+    Args:
+        chunks: Iterable of compressed bytes.
+
+    Returns:
+        Generator. The decompressed bytes.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            chunk = b''
+            if decompressor.eof:
+                # the file may hold several gzip members
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    data = decompressor.flush()
+    if data:
+        yield data
 
 
 def determine_indicator_type(indicator_type, default_indicator_type, auto_detect, value):
@@ -253,9 +354,18 @@ def create_fields_mapping(raw_json: Dict[str, Any], mapping: Dict[str, Union[Tup
     return fields_mapping
 
 
-def fetch_indicators_command(client: Client, default_indicator_type: str, auto_detect: bool, limit: int = 0, **kwargs):
+def generate_indicators(client: Client, default_indicator_type: str, auto_detect: bool, **kwargs):
+    """Lazily creates the indicators of the feed, so they can be submitted in batches while the feed is read.
+
+    Args:
+        client: The feed client.
+        default_indicator_type: The indicator type to use when it is not configured or detected.
+        auto_detect: Whether to auto detect the indicator type.
+
+    Returns:
+        Generator. The feed indicators.
+    """
     iterator = client.build_iterator(**kwargs)
-    indicators = []
     config = client.feed_url_to_config or {}
     for url_to_reader in iterator:
         for url, reader in url_to_reader.items():
@@ -282,12 +392,15 @@ def fetch_indicators_command(client: Client, default_indicator_type: str, auto_d
                     if client.tlp_color:
                         indicator['fields']['trafficlightprotocol'] = client.tlp_color
 
-                    indicators.append(indicator)
-                    # exit the loop if we have more indicators than the limit
-                    if limit and len(indicators) >= limit:
-                        return indicators
+                    yield indicator
 
-    return indicators
+
+def fetch_indicators_command(client: Client, default_indicator_type: str, auto_detect: bool, limit: int = 0, **kwargs):
+    indicators = generate_indicators(client, default_indicator_type, auto_detect, **kwargs)
+    if limit:
+        # stop reading the feed once we have enough indicators
+        indicators = itertools.islice(indicators, int(limit))
+    return list(indicators)
 
 
 def get_indicators_command(client, args: dict, tags: Optional[List[str]] = None):
@@ -322,15 +435,28 @@ def feed_main(feed_name, params=None, prefix=''):
     }
     try:
         if command == 'fetch-indicators':
-            indicators = fetch_indicators_command(
+            indicators_delta = get_indicators_delta(params)
+            if client.conditional_fetch and not (indicators_delta and indicators_delta.is_full_submission):
+                # a full submission reads all the feed URLs, changed or not
+                client.fetch_state = get_fetch_state()
+            indicators = generate_indicators(
                 client,
                 params.get('indicator_type'),
                 params.get('auto_detect_type'),
-                params.get('limit'),
             )
-            # we submit the indicators in batches
+            limit = params.get('limit')
+            if limit:
+                indicators = itertools.islice(indicators, int(limit))
+            if indicators_delta:
+                indicators = indicators_delta.filter(indicators)
+            # we submit the indicators in batches while the feed is read
             for b in batch(indicators, batch_size=2000):
                 demisto.createIndicators(b)  # type: ignore
+            # saved only once all the indicators were created, so a failed fetch is retried in full
+            if client.conditional_fetch:
+                save_fetch_state(client.new_fetch_state)
+            if indicators_delta:
+                save_indicators_delta(indicators_delta)
         else:
             args = demisto.args()
             args['feed_name'] = feed_name
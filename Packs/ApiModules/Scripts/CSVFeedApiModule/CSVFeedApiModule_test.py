@@ -1,3 +1,4 @@
+import gzip
 import requests_mock
 from CSVFeedApiModule import *
 
@@ -146,7 +147,66 @@ def test_get_feed_content():
             m.get(url, content=feed_url_to_config.get(url).get('content'))
             raw_response = requests.get(url)
 
-            assert client.get_feed_content_divided_to_lines(url, raw_response) == expected_output
+            assert list(client.get_feed_content_divided_to_lines(url, raw_response)) == expected_output
+
+
+def test_get_feed_content_in_small_chunks(mocker):
+    """
+    Given:
+    - Zipped and unzipped feed files.
+
+    When:
+    - Reading the response in chunks which split lines and multi-byte characters.
+
+    Then:
+    - Validating the lines are the same as when reading the whole content at once.
+    """
+    import CSVFeedApiModule
+    mocker.patch.object(CSVFeedApiModule, 'CHUNK_SIZE', 7)
+    with open('test_data/ip_ranges.txt', 'rb') as ip_ranges_txt:
+        ip_ranges_unzipped = ip_ranges_txt.read() + '\n# נתונים\n'.encode('utf8')
+    ip_ranges_zipped = gzip.compress(ip_ranges_unzipped[:100]) + gzip.compress(ip_ranges_unzipped[100:])
+    expected_output = ip_ranges_unzipped.decode('utf8').split('\n')
+
+    feed_url_to_config = {
+        'https://ipstack1.com': {'content': ip_ranges_unzipped},
+        'https://ipstack2.com': {'content': ip_ranges_zipped, 'is_zipped_file': True}
+    }
+    with requests_mock.Mocker() as m:
+        for url in feed_url_to_config:
+            client = Client(url=url, feed_url_to_config=feed_url_to_config, encoding='utf8')
+            m.get(url, content=feed_url_to_config.get(url).get('content'))
+            raw_response = requests.get(url, stream=True)
+
+            assert list(client.get_feed_content_divided_to_lines(url, raw_response)) == expected_output
+
+
+def test_feed_main_submits_batches_while_reading(mocker):
+    """
+    Given:
+    - A feed with more indicators than a single createIndicators batch.
+
+    When:
+    - Running fetch-indicators.
+
+    Then:
+    - Validating the indicators are submitted in batches of 2000 and the limit param is honored.
+    """
+    import demistomock as demisto
+    content = '\n'.join('1.1.{}.{}'.format(i // 256, i % 256) for i in range(4500)).encode('utf8')
+    params = {
+        'url': 'https://ipstack.com',
+        'feed_url_to_config': {'https://ipstack.com': {'fieldnames': ['value'], 'indicator_type': 'IP'}},
+        'limit': 4100
+    }
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'createIndicators')
+    with requests_mock.Mocker() as m:
+        m.get('https://ipstack.com', content=content)
+        feed_main('CSV', params=params)
+
+    assert [len(call[0][0]) for call in demisto.createIndicators.call_args_list] == [2000, 2000, 100]
+    assert demisto.createIndicators.call_args_list[0][0][0][0]['value'] == '1.1.0.0'
 
 
 def test_date_format_parsing():
@@ -230,3 +290,169 @@ class TestTagsParam:
             )
             _, _, indicators = get_indicators_command(client, args)
             assert [] == indicators[0]['fields']['tags']
+
+
+def test_build_iterator_concurrent_urls():
+    """
+    Given:
+    - Several CSV feed URLs on a local server, where the first URL is the slowest to answer.
+
+    When:
+    - Fetching indicators with a maximal concurrency of 2.
+
+    Then:
+    - Validating both URLs are downloaded at once and the indicators keep the order of the URLs.
+    """
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    barrier = threading.Barrier(2, timeout=5)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            # both requests must arrive before either is answered
+            barrier.wait()
+            if self.path == '/first':
+                time.sleep(0.1)
+            body = '\n'.join(f'{self.path[1:]}-{i}.example.com' for i in range(3)).encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        urls = [f'http://127.0.0.1:{httpd.server_port}/first', f'http://127.0.0.1:{httpd.server_port}/second']
+        client = Client(url=urls, feed_url_to_config={url: {'fieldnames': ['value']} for url in urls},
+                        max_concurrency=2)
+        indicators = fetch_indicators_command(client, 'Domain', False)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+    assert [indicator['value'] for indicator in indicators] == \
+        [f'{name}-{i}.example.com' for name in ('first', 'second') for i in range(3)]
+
+
+def test_feed_main_conditional_fetch(mocker):
+    """
+    Given:
+    - A feed with conditional fetch, whose server supports Last-Modified.
+
+    When:
+    - Fetching indicators twice.
+
+    Then:
+    - Validating the second fetch sends If-Modified-Since, gets 304 and creates no indicators.
+    """
+    import demistomock as demisto
+    url = 'https://ipstack.com'
+    last_modified = 'Wed, 21 Oct 2020 07:28:00 GMT'
+    integration_context: dict = {}
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    create_indicators = mocker.patch.object(demisto, 'createIndicators')
+    params = {'url': url, 'feed_url_to_config': {url: {'fieldnames': ['value'], 'indicator_type': 'IP'}},
+              'conditional_fetch': True}
+
+    def callback(request, context):
+        if request.headers.get('If-Modified-Since') == last_modified:
+            context.status_code = 304
+            return b''
+        context.headers['Last-Modified'] = last_modified
+        return b'1.1.1.1\n2.2.2.2'
+
+    with requests_mock.Mocker() as m:
+        feed = m.get(url, content=callback)
+        feed_main('CSV', params=params)
+        assert create_indicators.call_count == 1
+        feed_main('CSV', params=params)
+
+    assert feed.last_request.headers['If-Modified-Since'] == last_modified
+    assert create_indicators.call_count == 1
+    assert integration_context['feed_fetch_state'][url]['last_modified'] == last_modified
+
+
+def test_feed_main_conditional_fetch_limit(mocker):
+    """
+    Given:
+    - Two feeds with conditional fetch, and a fetch limit which is reached in the first feed.
+
+    When:
+    - Fetching indicators twice.
+
+    Then:
+    - Validating the fetch state is kept only for the feed which was read to the end, so the second fetch skips it
+      and reads the feed which was cut short.
+    """
+    import demistomock as demisto
+    first_url = 'https://first.test'
+    second_url = 'https://second.test'
+    integration_context: dict = {}
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    create_indicators = mocker.patch.object(demisto, 'createIndicators')
+    config = {'fieldnames': ['value'], 'indicator_type': 'IP'}
+    params = {'url': [first_url, second_url], 'feed_url_to_config': {first_url: config, second_url: config},
+              'conditional_fetch': True, 'limit': 3}
+
+    def feed(content, etag):
+        def callback(request, context):
+            if request.headers.get('If-None-Match') == etag:
+                context.status_code = 304
+                return b''
+            context.headers['ETag'] = etag
+            return content
+        return callback
+
+    with requests_mock.Mocker() as m:
+        m.get(first_url, content=feed(b'1.1.1.1\n2.2.2.2', '"first"'))
+        m.get(second_url, content=feed(b'3.3.3.3\n4.4.4.4', '"second"'))
+        feed_main('CSV', params=params)
+        assert [i['value'] for i in create_indicators.call_args[0][0]] == ['1.1.1.1', '2.2.2.2', '3.3.3.3']
+        assert list(integration_context['feed_fetch_state']) == [first_url]
+
+        feed_main('CSV', params=params)
+
+    assert [i['value'] for i in create_indicators.call_args[0][0]] == ['3.3.3.3', '4.4.4.4']
+    assert list(integration_context['feed_fetch_state']) == [first_url, second_url]
+
+
+def test_feed_main_delta_submission(mocker):
+    """
+    Given:
+    - A feed with delta submission.
+
+    When:
+    - Fetching indicators twice, where an indicator is added to the feed before the second fetch.
+
+    Then:
+    - Validating the first fetch creates all the indicators, and the second creates only the added one.
+    """
+    import demistomock as demisto
+    url = 'https://ipstack.com'
+    integration_context: dict = {}
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    create_indicators = mocker.patch.object(demisto, 'createIndicators')
+    params = {'url': url, 'feed_url_to_config': {url: {'fieldnames': ['value'], 'indicator_type': 'IP'}},
+              'delta_submission': True}
+
+    with requests_mock.Mocker() as m:
+        m.get(url, content=b'1.1.1.1\n2.2.2.2')
+        feed_main('CSV', params=params)
+        assert [i['value'] for i in create_indicators.call_args[0][0]] == ['1.1.1.1', '2.2.2.2']
+
+        create_indicators.reset_mock()
+        m.get(url, content=b'1.1.1.1\n2.2.2.2\n3.3.3.3')
+        feed_main('CSV', params=params)
+
+    assert [i['value'] for i in create_indicators.call_args[0][0]] == ['3.3.3.3']
+    assert integration_context['feed_indicators_delta']['fingerprints']
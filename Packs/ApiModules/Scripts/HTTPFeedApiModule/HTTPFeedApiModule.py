@@ -3,11 +3,13 @@ from CommonServerPython import *
 from CommonServerUserPython import *
 
 ''' IMPORTS '''
+import functools
+import itertools
 import urllib3
 import requests
 import traceback
 from dateutil.parser import parse
-from typing import Optional, Pattern, List
+from typing import Optional, Pattern, Match, List, NamedTuple, Callable, Tuple, Dict, Any, Iterator
 
 # disable insecure warnings
 urllib3.disable_warnings()
@@ -15,13 +17,151 @@ urllib3.disable_warnings()
 ''' GLOBALS '''
 TAGS = 'feedTags'
 TLP_COLOR = 'trafficlightprotocol'
+DATE_FIELDS = ('firstseenbysource', 'lastseenbysource')
+DATE_CONVERTER_CACHE_SIZE = 4096
+TEMPLATE_GROUP_REFERENCE = re.compile(r'\\(?:g<(\w+)>|([1-9][0-9]?))')
+
+
+def compile_template(template: str) -> Callable[[Match], str]:
+    """
+    Compile a transform template (see `re.Match.expand`) into a function, so the template is parsed once
+    instead of on every expansion. Templates with escapes other than group references are expanded by `re`.
+    :param template: The transform template, for example: '\\1/\\2'
+    :return: A function which expands the template for a match
+    """
+    parts: List[Any] = []
+    position = 0
+    for reference in TEMPLATE_GROUP_REFERENCE.finditer(template):
+        parts.append(template[position:reference.start()])
+        group = reference.group(1) or reference.group(2)
+        parts.append(int(group) if group.isdigit() else group)
+        position = reference.end()
+    parts.append(template[position:])
+
+    literals = parts[::2]
+    groups = parts[1::2]
+    if any('\\' in literal for literal in literals) or re.search(r'\\[0-7]{3}', template):
+        return lambda match: match.expand(template)
+
+    if len(groups) == 1 and not any(literals):
+        group = groups[0]
+        return lambda match: match.group(group) or ''
+
+    def expand(match: Match) -> str:
+        expanded = [literals[0]]
+        for group, literal in zip(groups, literals[1:]):
+            expanded.append(match.group(group) or '')
+            expanded.append(literal)
+        return ''.join(expanded)
+
+    return expand
+
+
+class FieldExtractor(NamedTuple):
+    """A compiled extraction dictionary of a single field."""
+    name: str
+    regex: Pattern
+    expand: Callable[[Match], str]
+    converter: Optional[Callable[[Any], Any]]
+
+
+class ExtractionPlan(NamedTuple):
+    """The compiled configuration of a feed URL, applied to every line of the feed."""
+    indicator_regex: Optional[Pattern]
+    expand_indicator: Callable[[Match], str]
+    fields: Tuple[FieldExtractor, ...]
+    indicator_type: Optional[str]
+    raw_json_indicator_type: Optional[str]
+
+    def extract(self, line: str):
+        """
+        Extract the indicator value and attributes from a line of the feed.
+        :param line: The current line in the feed
+        :return: The attributes (None if the line is empty or the indicator regex did not match) and the value
+        """
+        line = line.strip()
+        if not line:
+            return None, ''
+
+        if self.indicator_regex is None:
+            value = line.split(None, 1)[0]
+        else:
+            match = self.indicator_regex.search(line)
+            if match is None:
+                return None, ''
+            value = self.expand_indicator(match)
+
+        attributes: Dict[str, Any] = {}
+        for field in self.fields:
+            m = field.regex.search(line)
+            if m is None:
+                continue
+
+            field_value = field.expand(m)
+            try:
+                field_value = int(field_value)
+            except Exception:
+                pass
+            attributes[field.name] = field_value
+
+        if value:
+            for field in self.fields:
+                if field.converter is not None and field.name in attributes:
+                    attributes[field.name] = field.converter(attributes[field.name])
+
+        attributes['value'] = value
+        attributes['type'] = self.raw_json_indicator_type
+        return attributes, value
+
+
+def build_extraction_plan(feed_config: dict, default_indicator_type: str = '', feed_name: str = 'http') \
+        -> ExtractionPlan:
+    """
+    Compile a feed configuration (see `Client`) into an extraction plan, so the regexes are compiled
+    and the templates are resolved once per feed URL instead of once per line.
+    :param feed_config: The configuration of the feed URL.
+    :param default_indicator_type: The indicator type to use if the configuration does not set one.
+    :param feed_name: The name of the feed.
+    :return: The extraction plan.
+    """
+    feed_config = feed_config or {}
+    indicator_regex = None
+    indicator_transform = r'\g<0>'
+    indicator = feed_config.get('indicator')
+    if indicator:
+        if 'regex' in indicator:
+            indicator_regex = re.compile(indicator['regex'])
+        indicator_transform = indicator.get('transform', indicator_transform)
+
+    # feeds usually repeat the same dates on many lines, so the parsed dates are memoized per plan
+    date_converter = functools.lru_cache(maxsize=DATE_CONVERTER_CACHE_SIZE)(datestring_to_millisecond_timestamp)
+    fields = []
+    for field in feed_config.get('fields', []):
+        for f, fattrs in field.items():
+            if 'regex' not in fattrs:
+                raise ValueError(f'{feed_name} - {f} field does not have a regex')
+            fields.append(FieldExtractor(
+                name=f,
+                regex=re.compile(fattrs['regex']),
+                expand=compile_template(fattrs.get('transform', r'\g<0>')),
+                converter=date_converter if f in DATE_FIELDS else None
+            ))
+
+    return ExtractionPlan(
+        indicator_regex=indicator_regex,
+        expand_indicator=compile_template(indicator_transform),
+        fields=tuple(fields),
+        indicator_type=feed_config.get('indicator_type'),
+        raw_json_indicator_type=feed_config.get('indicator_type', default_indicator_type)
+    )
 
 
 class Client(BaseClient):
     def __init__(self, url: str, feed_name: str = 'http', insecure: bool = False, credentials: dict = None,
                  ignore_regex: str = None, encoding: str = None, indicator_type: str = '',
                  indicator: str = '', fields: str = '{}', feed_url_to_config: dict = None, polling_timeout: int = 20,
-                 headers: dict = None, proxy: bool = False, custom_fields_mapping: dict = None, **kwargs):
+                 headers: dict = None, proxy: bool = False, custom_fields_mapping: dict = None,
+                 max_concurrency: int = 1, conditional_fetch: bool = False, **kwargs):
         """Implements class for miners of plain text feeds over HTTP.
         **Config parameters**
         :param: url: URL of the feed.
@@ -61,6 +201,14 @@ class Client(BaseClient):
             }]
         }
         :param: proxy: Use proxy in requests.
+        :param: max_concurrency: The maximal number of feed URLs to download concurrently. Default: 1.
+            When greater than 1, the URLs are downloaded concurrently to spooled temporary files (see
+            `spool_response`), and parsed in the order of the URLs.
+        :param: conditional_fetch: Whether to skip feed URLs which did not change since the last fetch. The ETag
+            and Last-Modified of each URL are kept in the integration context (see `fetch_state`), and a URL is
+            skipped when the server answers 304 Not Modified. When the server sends neither, the content is
+            spooled and hashed (see `spool_response`), and a URL is skipped when its content hash is unchanged.
+            Default: *false*
         **Extraction dictionary**
             Extraction dictionaries contain the following keys:
             :regex: Python regular expression for searching the text.
@@ -101,6 +249,17 @@ class Client(BaseClient):
             self.polling_timeout = int(polling_timeout)
         except (ValueError, TypeError):
             raise ValueError('Please provide an integer value for "Request Timeout"')
+        try:
+            self.max_concurrency = max(int(max_concurrency), 1)
+        except (ValueError, TypeError):
+            raise ValueError('Please provide an integer value for "Maximum concurrent requests"')
+        self._session = build_feed_session(self.max_concurrency)
+        self.conditional_fetch = argToBoolean(conditional_fetch)
+        # the state of the last fetch, and the state of this fetch to save once its indicators were created. The
+        # state of a feed URL is moved from read_fetch_state to new_fetch_state once its content was read to the end
+        self.fetch_state: Dict[str, dict] = {}
+        self.new_fetch_state: Dict[str, dict] = {}
+        self.read_fetch_state: Dict[str, dict] = {}
 
         self.headers = headers
         self.encoding = encoding
@@ -137,6 +296,19 @@ class Client(BaseClient):
         if custom_fields_mapping is None:
             custom_fields_mapping = {}
         self.custom_fields_mapping = custom_fields_mapping
+        self._extraction_plans: Dict[str, ExtractionPlan] = {}
+
+    def get_extraction_plan(self, url: str) -> ExtractionPlan:
+        """
+        Get the extraction plan of a feed URL, compiling its configuration on first use.
+        :param url: The feed URL
+        :return: The extraction plan
+        """
+        plan = self._extraction_plans.get(url)
+        if plan is None:
+            plan = build_extraction_plan(self.feed_url_to_config.get(url, {}), self.indicator_type, self.feed_name)
+            self._extraction_plans[url] = plan
+        return plan
 
     def get_feed_config(self, fields_json: str = '', indicator_json: str = ''):
         """
@@ -204,30 +376,23 @@ class Client(BaseClient):
 
         if self.username is not None and self.password is not None:
             kwargs['auth'] = (self.username, self.password)
+
+        urls = self._base_url
+        if not isinstance(urls, list):
+            urls = [urls]
         try:
-            urls = self._base_url
-            url_to_response_list: List[dict] = []
-            if not isinstance(urls, list):
-                urls = [urls]
-            for url in urls:
-                r = requests.get(
-                    url,
-                    **kwargs
-                )
-                try:
-                    r.raise_for_status()
-                except Exception:
-                    LOG(f'{self.feed_name!r} - exception in request:'
-                        f' {r.status_code!r} {r.content!r}')
-                    raise
-                url_to_response_list.append({url: r})
+            url_to_response_list: List[dict] = [
+                {url: r} for url, r in zip(urls, ordered_concurrent_map(
+                    lambda url: self.get_feed_response(url, **kwargs), urls, self.max_concurrency))
+                if r is not None
+            ]
         except requests.ConnectionError:
             raise requests.ConnectionError('Failed to establish a new connection. Please make sure your URL is valid.')
 
         results = []
         for url_to_response in url_to_response_list:
             for url, lines in url_to_response.items():
-                result = lines.iter_lines()
+                result = self.iter_feed_content(url, lines.iter_lines())
                 if self.encoding is not None:
                     result = map(
                         lambda x: x.decode(self.encoding).encode('utf_8'),
@@ -246,6 +411,58 @@ class Client(BaseClient):
                 results.append({url: result})
         return results
 
+    def get_feed_response(self, url: str, **kwargs) -> Optional[requests.Response]:
+        """
+        Send the HTTP request of a feed URL.
+        :param url: The feed URL
+        :param kwargs: Arguments to send to the HTTP API endpoint
+        :return: The response, or None if conditional fetch is used and the feed did not change
+        """
+        previous_state = self.fetch_state.get(url, {})
+        if self.conditional_fetch:
+            kwargs['headers'] = {**(kwargs.get('headers') or {}), **conditional_request_headers(previous_state)}
+
+        r = self._session.get(
+            url,
+            **kwargs
+        )
+        if self.conditional_fetch and r.status_code == 304:
+            r.close()
+            self.new_fetch_state[url] = previous_state
+            return None
+        try:
+            r.raise_for_status()
+        except Exception:
+            LOG(f'{self.feed_name!r} - exception in request:'
+                f' {r.status_code!r} {r.content!r}')
+            raise
+        state = response_fetch_state(r)
+        if self.conditional_fetch and not (state['etag'] or state['last_modified']):
+            # the server does not support conditional requests, so the body is hashed before it is parsed
+            state['hash'] = spool_response(r)
+            if state['hash'] == previous_state.get('hash'):
+                r.close()
+                self.new_fetch_state[url] = state
+                return None
+        elif self.max_concurrency > 1:
+            # the body is downloaded in the worker thread, while the feed URLs before it are parsed
+            spool_response(r)
+        if self.conditional_fetch:
+            self.read_fetch_state[url] = state
+        return r
+
+    def iter_feed_content(self, url: str, items: Iterator) -> Iterator:
+        """
+        Yield the content of a feed URL, and keep its fetch state once the content was read to the end, so a feed
+        URL which was cut short (e.g. by the fetch limit) is read in full by the next fetch.
+        :param url: The feed URL
+        :param items: The content of the feed URL
+        :return: The content
+        """
+        yield from items
+        if url in self.read_fetch_state:
+            self.new_fetch_state[url] = self.read_fetch_state.pop(url)
+
     def custom_fields_creator(self, attributes: dict):
         created_custom_fields = {}
         for attribute in attributes.keys():
@@ -273,59 +490,8 @@ def get_indicator_fields(line, url, feed_tags: list, tlp_color: Optional[str], c
     :param tlp_color: Traffic Light Protocol color.
     :return: The indicator
     """
-    attributes = None
-    value: str = ''
-    indicator = None
-    fields_to_extract = []
-    feed_config = client.feed_url_to_config.get(url, {})
-    if feed_config:
-        if 'indicator' in feed_config:
-            indicator = feed_config['indicator']
-            if 'regex' in indicator:
-                indicator['regex'] = re.compile(indicator['regex'])
-            if 'transform' not in indicator:
-                indicator['transform'] = r'\g<0>'
-
-    if 'fields' in feed_config:
-        fields = feed_config['fields']
-        for field in fields:
-            for f, fattrs in field.items():
-                field = {f: {}}
-                if 'regex' in fattrs:
-                    field[f]['regex'] = re.compile(fattrs['regex'])
-                if 'transform' not in fattrs:
-                    field[f]['transform'] = r'\g<0>'
-                else:
-                    field[f]['transform'] = fattrs['transform']
-                fields_to_extract.append(field)
-
-    line = line.strip()
-    if line:
-        extracted_indicator = line.split()[0]
-        if indicator:
-            extracted_indicator = indicator['regex'].search(line)
-            if extracted_indicator is None:
-                return attributes, value
-            if 'transform' in indicator:
-                extracted_indicator = extracted_indicator.expand(indicator['transform'])
-        attributes = {}
-        for field in fields_to_extract:
-            for f, fattrs in field.items():
-                m = fattrs['regex'].search(line)
-
-                if m is None:
-                    continue
-
-                attributes[f] = m.expand(fattrs['transform'])
-
-                try:
-                    i = int(attributes[f])
-                except Exception:
-                    pass
-                else:
-                    attributes[f] = i
-        attributes['value'] = value = extracted_indicator
-        attributes['type'] = feed_config.get('indicator_type', client.indicator_type)
+    attributes, value = client.get_extraction_plan(url).extract(line)
+    if attributes is not None:
         attributes['tags'] = feed_tags
 
         if tlp_color:
@@ -334,23 +500,24 @@ def get_indicator_fields(line, url, feed_tags: list, tlp_color: Optional[str], c
     return attributes, value
 
 
-def fetch_indicators_command(client, feed_tags, tlp_color, itype, auto_detect, **kwargs):
+def generate_indicators(client, feed_tags, tlp_color, itype, auto_detect, **kwargs):
+    """
+    Lazily creates the indicators of the feed, so they can be submitted in batches while the feed is read.
+    :param client: The client
+    :param feed_tags: The indicator tags.
+    :param tlp_color: Traffic Light Protocol color.
+    :param itype: The default indicator type.
+    :param auto_detect: Whether to auto detect the indicator type.
+    :return: Generator of indicators
+    """
     iterators = client.build_iterator(**kwargs)
-    indicators = []
     for iterator in iterators:
         for url, lines in iterator.items():
+            config_indicator_type = client.get_extraction_plan(url).indicator_type
             for line in lines:
                 attributes, value = get_indicator_fields(line, url, feed_tags, tlp_color, client)
                 if value:
-                    if 'lastseenbysource' in attributes.keys():
-                        attributes['lastseenbysource'] = datestring_to_millisecond_timestamp(
-                            attributes['lastseenbysource'])
-
-                    if 'firstseenbysource' in attributes.keys():
-                        attributes['firstseenbysource'] = datestring_to_millisecond_timestamp(
-                            attributes['firstseenbysource'])
-                    indicator_type = determine_indicator_type(
-                        client.feed_url_to_config.get(url, {}).get('indicator_type'), itype, auto_detect, value)
+                    indicator_type = determine_indicator_type(config_indicator_type, itype, auto_detect, value)
                     indicator_data = {
                         "value": value,
                         "type": indicator_type,
@@ -361,8 +528,11 @@ def fetch_indicators_command(client, feed_tags, tlp_color, itype, auto_detect, *
                         custom_fields = client.custom_fields_creator(attributes)
                         indicator_data["fields"] = custom_fields
 
-                    indicators.append(indicator_data)
-    return indicators
+                    yield indicator_data
+
+
+def fetch_indicators_command(client, feed_tags, tlp_color, itype, auto_detect, **kwargs):
+    return list(generate_indicators(client, feed_tags, tlp_color, itype, auto_detect, **kwargs))
 
 
 def determine_indicator_type(indicator_type, default_indicator_type, auto_detect, value):
@@ -389,7 +559,7 @@ def get_indicators_command(client: Client, args):
     feed_tags = args.get('feedTags')
     tlp_color = args.get('tlp_color')
     auto_detect = demisto.params().get('auto_detect_type')
-    indicators_list = fetch_indicators_command(client, feed_tags, tlp_color, itype, auto_detect)[:limit]
+    indicators_list = list(itertools.islice(generate_indicators(client, feed_tags, tlp_color, itype, auto_detect), limit))
     entry_result = camelize(indicators_list)
     hr = tableToMarkdown('Indicators', entry_result, headers=['Value', 'Type', 'Rawjson'])
     return hr, {}, indicators_list
@@ -430,11 +600,22 @@ def feed_main(feed_name, params=None, prefix=''):
     }
     try:
         if command == 'fetch-indicators':
-            indicators = fetch_indicators_command(client, feed_tags, tlp_color, params.get('indicator_type'),
-                                                  params.get('auto_detect_type'))
-            # we submit the indicators in batches
+            indicators_delta = get_indicators_delta(params)
+            if client.conditional_fetch and not (indicators_delta and indicators_delta.is_full_submission):
+                # a full submission reads all the feed URLs, changed or not
+                client.fetch_state = get_fetch_state()
+            indicators = generate_indicators(client, feed_tags, tlp_color, params.get('indicator_type'),
+                                             params.get('auto_detect_type'))
+            if indicators_delta:
+                indicators = indicators_delta.filter(indicators)
+            # we submit the indicators in batches while the feed is read
             for b in batch(indicators, batch_size=2000):
                 demisto.createIndicators(b)
+            # saved only once all the indicators were created, so a failed fetch is retried in full
+            if client.conditional_fetch:
+                save_fetch_state(client.new_fetch_state)
+            if indicators_delta:
+                save_indicators_delta(indicators_delta)
         else:
             args = demisto.args()
             args['feed_name'] = feed_name
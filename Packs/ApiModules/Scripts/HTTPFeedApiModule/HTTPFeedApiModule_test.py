@@ -1,6 +1,8 @@
 from HTTPFeedApiModule import get_indicators_command, Client, datestring_to_millisecond_timestamp, feed_main
 import requests_mock
 import demistomock as demisto
+import os
+import pytest
 
 
 def test_get_indicators():
@@ -292,3 +294,358 @@ def test_feed_main_test_module(mocker, requests_mock):
     assert demisto.results.call_count == 1
     results = demisto.results.call_args[0][0]
     assert results['HumanReadable'] == 'ok'
+
+
+def test_feed_main_fetch_indicators_in_batches(mocker, requests_mock):
+    """
+    Given
+    - A feed with more lines than a single createIndicators batch.
+
+    When
+    - Fetching indicators.
+
+    Then
+    - Ensure the indicators are submitted in batches of 2000, in the feed order.
+    """
+    feed_url = 'https://www.dshield.org/block.txt'
+    mocker.patch.object(demisto, 'params', return_value={'url': feed_url, 'indicator_type': 'IP'})
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'createIndicators')
+    lines = ['1.1.{}.{}'.format(i // 256, i % 256) for i in range(4500)]
+    requests_mock.get(feed_url, content='\n'.join(lines).encode('utf8'))
+
+    feed_main('great_feed_name')
+
+    batches = [call[0][0] for call in demisto.createIndicators.call_args_list]
+    assert [len(b) for b in batches] == [2000, 2000, 500]
+    assert [indicator['value'] for b in batches for indicator in b] == lines
+
+
+DSHIELD_CONFIG = {
+    'indicator_type': 'CIDR',
+    'indicator': {
+        'regex': r'^(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\t[\d.]*\t(\d{1,2})',
+        'transform': '\\1/\\2'
+    },
+    'fields': [
+        {'numberofattacks': {'regex': '^.*\\t.*\\t[0-9]+\\t([0-9]+)', 'transform': '\\1'}},
+        {'networkname': {'regex': '^.*\\t.*\\t[0-9]+\\t[0-9]+\\t([^\\t]+)', 'transform': '\\1'}},
+        {'lastseenbysource': {'regex': '[^\\t]+$'}}
+    ]
+}
+
+
+def test_get_indicator_fields_with_extraction_plan(mocker):
+    """
+    Given
+    - A DShield style feed configuration.
+
+    When
+    - Extracting the indicator fields of several lines.
+
+    Then
+    - Ensure the configuration is compiled once and is not modified.
+    - Ensure numbers are converted to int and dates to millisecond timestamps.
+    - Ensure lines which do not match the indicator regex are skipped.
+    """
+    import copy
+    import HTTPFeedApiModule
+    from HTTPFeedApiModule import get_indicator_fields
+    url = 'https://www.dshield.org/block.txt'
+    feed_url_to_config = {url: copy.deepcopy(DSHIELD_CONFIG)}
+    client = Client(url=url, feed_url_to_config=feed_url_to_config)
+    build_plan = mocker.spy(HTTPFeedApiModule, 'build_extraction_plan')
+
+    attributes, value = get_indicator_fields('1.2.3.0\t1.2.3.255\t24\t15\tEXAMPLE-NET\t2020-01-01T00:00:00Z\n', url,
+                                             ['tag'], 'RED', client)
+    assert value == '1.2.3.0/24'
+    assert attributes == {
+        'numberofattacks': 15,
+        'networkname': 'EXAMPLE-NET',
+        'lastseenbysource': 1577836800000,
+        'value': '1.2.3.0/24',
+        'type': 'CIDR',
+        'tags': ['tag'],
+        'trafficlightprotocol': 'RED'
+    }
+    assert get_indicator_fields('Start\t1.2.3.0\t24', url, [], None, client) == (None, '')
+    assert get_indicator_fields('   ', url, [], None, client) == (None, '')
+    assert build_plan.call_count == 1
+    assert feed_url_to_config[url] == DSHIELD_CONFIG
+
+
+def test_get_indicator_fields_without_config():
+    """
+    Given
+    - A feed with no indicator or fields configuration.
+
+    When
+    - Extracting the indicator fields of a line.
+
+    Then
+    - Ensure the text until the first whitespace is used as the indicator.
+    """
+    from HTTPFeedApiModule import get_indicator_fields
+    url = 'https://example.com/list.txt'
+    client = Client(url=url, indicator_type='URL', feed_url_to_config={url: {}})
+
+    attributes, value = get_indicator_fields(' example.com/a  # comment', url, [], None, client)
+    assert value == 'example.com/a'
+    assert attributes == {'value': 'example.com/a', 'type': 'URL', 'tags': []}
+
+
+@pytest.mark.parametrize('template', [
+    r'\g<0>', r'\1', r'\1/\2', r'AS\g<asn>', r'\2-\1 \g<asn>', r'\3', 'plain', r'\1\t\2', r'\1\\x', r'\0'
+])
+def test_compile_template(template):
+    """
+    Given
+    - A transform template.
+
+    When
+    - Compiling and expanding it for a match with an unmatched group.
+
+    Then
+    - Ensure the result is the same as expanding the template with re.
+    """
+    import re
+    from HTTPFeedApiModule import compile_template
+    match = re.search(r'(?P<asn>[0-9]+)\|([a-z]+)(x)?', 'AS1234|us')
+    assert compile_template(template)(match) == match.expand(template)
+
+
+@pytest.mark.skipif(not os.getenv('CONTENT_BENCHMARK'), reason='benchmark - set CONTENT_BENCHMARK to run')
+def test_get_indicator_fields_benchmark(capfd):
+    """
+    Measures lines per second of extracting a 1M lines (CONTENT_BENCHMARK_SIZE to override) DShield style feed,
+    with the per-line configuration handling used before the extraction plan and with the extraction plan.
+    """
+    import copy
+    import re
+    import time
+    from HTTPFeedApiModule import get_indicator_fields, datestring_to_millisecond_timestamp
+
+    def legacy_get_indicator_fields(line, url, feed_tags, tlp_color, client):
+        attributes = None
+        value = ''
+        indicator = None
+        fields_to_extract = []
+        feed_config = client.feed_url_to_config.get(url, {})
+        if feed_config:
+            if 'indicator' in feed_config:
+                indicator = feed_config['indicator']
+                if 'regex' in indicator:
+                    indicator['regex'] = re.compile(indicator['regex'])
+                if 'transform' not in indicator:
+                    indicator['transform'] = r'\g<0>'
+        if 'fields' in feed_config:
+            for field in feed_config['fields']:
+                for f, fattrs in field.items():
+                    field = {f: {}}
+                    if 'regex' in fattrs:
+                        field[f]['regex'] = re.compile(fattrs['regex'])
+                    field[f]['transform'] = fattrs.get('transform', r'\g<0>')
+                    fields_to_extract.append(field)
+        line = line.strip()
+        if line:
+            extracted_indicator = line.split()[0]
+            if indicator:
+                extracted_indicator = indicator['regex'].search(line)
+                if extracted_indicator is None:
+                    return attributes, value
+                extracted_indicator = extracted_indicator.expand(indicator['transform'])
+            attributes = {}
+            for field in fields_to_extract:
+                for f, fattrs in field.items():
+                    m = fattrs['regex'].search(line)
+                    if m is None:
+                        continue
+                    attributes[f] = m.expand(fattrs['transform'])
+                    try:
+                        attributes[f] = int(attributes[f])
+                    except Exception:
+                        pass
+            attributes['value'] = value = extracted_indicator
+            attributes['type'] = feed_config.get('indicator_type', client.indicator_type)
+            attributes['tags'] = feed_tags
+            if tlp_color:
+                attributes['trafficlightprotocol'] = tlp_color
+            if value and 'lastseenbysource' in attributes:
+                attributes['lastseenbysource'] = datestring_to_millisecond_timestamp(attributes['lastseenbysource'])
+        return attributes, value
+
+    size = int(os.getenv('CONTENT_BENCHMARK_SIZE', 1000000))
+    lines = ['{0}.{1}.{2}.0\t{0}.{1}.{2}.255\t24\t{3}\tNET-{3}\t2020-01-{4:02d}T00:00:00Z'.format(
+        i % 223 + 1, i // 223 % 256, i // 57088 % 256, i, i % 28 + 1) for i in range(size)]
+    url = 'https://www.dshield.org/block.txt'
+    rates = []
+    for get_fields in (legacy_get_indicator_fields, get_indicator_fields):
+        client = Client(url=url, feed_url_to_config={url: copy.deepcopy(DSHIELD_CONFIG)})
+        start = time.time()
+        for line in lines:
+            get_fields(line, url, [], None, client)
+        rates.append(size / (time.time() - start))
+
+    with capfd.disabled():
+        print('\nbefore: {:.0f} lines/s, after: {:.0f} lines/s'.format(*rates))
+
+
+class FeedServer:
+    """
+    A local HTTP server standing in for the feed URLs, which answers /<delay>/<name> at once, and sends the body
+    after <delay> seconds.
+    """
+
+    def __init__(self):
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                import time
+                with server.lock:
+                    server.active += 1
+                    server.max_active = max(server.max_active, server.active)
+                _, delay, name = self.path.split('/')
+                body = '\n'.join(f'{name}-{i}.example.com' for i in range(3)).encode()
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.flush()
+                time.sleep(float(delay))
+                self.wfile.write(body)
+                self.wfile.flush()
+                with server.lock:
+                    server.active -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.mark.parametrize('max_concurrency', [1, 3])
+def test_build_iterator_concurrent_urls(max_concurrency):
+    """
+    Given
+    - Several feed URLs on a local server, where the first URLs are the slowest to send their body.
+
+    When
+    - Fetching indicators with a maximal concurrency.
+
+    Then
+    - Ensure the indicators are returned in the order of the URLs.
+    - Ensure that with a maximal concurrency, no more than it of URLs are downloaded at once, and the bodies are
+      downloaded concurrently rather than one after another.
+    """
+    import time
+    from HTTPFeedApiModule import fetch_indicators_command
+    server = FeedServer()
+    delays = [0.1 * (5 - i) for i in range(5)]
+    try:
+        urls = [f'{server.url}/{delay}/feed{i}' for i, delay in enumerate(delays)]
+        client = Client(url=urls, feed_url_to_config={url: {} for url in urls}, indicator_type='Domain',
+                        max_concurrency=max_concurrency)
+        start = time.time()
+        indicators = fetch_indicators_command(client, [], None, 'Domain', False)
+        elapsed = time.time() - start
+    finally:
+        server.close()
+
+    assert [indicator['value'] for indicator in indicators] == \
+        [f'feed{i}-{j}.example.com' for i in range(5) for j in range(3)]
+    if max_concurrency > 1:
+        assert 1 < server.max_active <= max_concurrency
+        assert elapsed < sum(delays) * 0.75
+
+
+def test_feed_main_conditional_fetch(mocker, requests_mock):
+    """
+    Given
+    - A feed with conditional fetch, whose server supports ETags, and a feed whose server does not.
+
+    When
+    - Fetching indicators three times, where the content of the feeds changes before the third fetch.
+
+    Then
+    - Ensure the second fetch sends If-None-Match, and both feeds are skipped (304 and an unchanged hash).
+    - Ensure the third fetch creates the indicators of the changed feeds.
+    """
+    etag_url = 'https://etag.test/list.txt'
+    plain_url = 'https://plain.test/list.txt'
+    integration_context: dict = {}
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    mocker.patch.object(demisto, 'params', return_value={'url': [etag_url, plain_url], 'indicator_type': 'IP',
+                                                         'feed_url_to_config': {etag_url: {}, plain_url: {}},
+                                                         'conditional_fetch': True})
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    create_indicators = mocker.patch.object(demisto, 'createIndicators')
+
+    def etag_feed(content, etag):
+        def callback(request, context):
+            if request.headers.get('If-None-Match') == etag:
+                context.status_code = 304
+                return b''
+            context.headers['ETag'] = etag
+            return content
+        return callback
+
+    etag_mock = requests_mock.get(etag_url, content=etag_feed(b'1.1.1.1\n2.2.2.2', '"v1"'))
+    requests_mock.get(plain_url, content=b'3.3.3.3')
+    feed_main('great_feed_name')
+    assert [i['value'] for i in create_indicators.call_args[0][0]] == ['1.1.1.1', '2.2.2.2', '3.3.3.3']
+    assert integration_context['feed_fetch_state'][etag_url]['etag'] == '"v1"'
+
+    create_indicators.reset_mock()
+    feed_main('great_feed_name')
+    assert etag_mock.last_request.headers['If-None-Match'] == '"v1"'
+    assert create_indicators.call_count == 0
+    assert integration_context['feed_fetch_state'][plain_url]['hash']
+    assert integration_context['feed_fetch_state'][etag_url]['etag'] == '"v1"'
+
+    requests_mock.get(etag_url, content=etag_feed(b'1.1.1.1\n4.4.4.4', '"v2"'))
+    requests_mock.get(plain_url, content=b'3.3.3.3\n5.5.5.5')
+    feed_main('great_feed_name')
+    assert [i['value'] for i in create_indicators.call_args[0][0]] == ['1.1.1.1', '4.4.4.4', '3.3.3.3', '5.5.5.5']
+    assert integration_context['feed_fetch_state'][etag_url]['etag'] == '"v2"'
+
+
+def test_feed_main_delta_submission(mocker, requests_mock):
+    """
+    Given
+    - A feed with delta submission.
+
+    When
+    - Fetching indicators twice, where an indicator is added to the feed before the second fetch.
+
+    Then
+    - Ensure the first fetch creates all the indicators, and the second creates only the added one.
+    """
+    url = 'https://delta.test/list.txt'
+    integration_context: dict = {}
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    mocker.patch.object(demisto, 'params', return_value={'url': url, 'indicator_type': 'IP', 'delta_submission': True})
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    create_indicators = mocker.patch.object(demisto, 'createIndicators')
+
+    requests_mock.get(url, content=b'1.1.1.1\n2.2.2.2')
+    feed_main('great_feed_name')
+    assert [i['value'] for i in create_indicators.call_args[0][0]] == ['1.1.1.1', '2.2.2.2']
+
+    create_indicators.reset_mock()
+    requests_mock.get(url, content=b'1.1.1.1\n2.2.2.2\n3.3.3.3')
+    feed_main('great_feed_name')
+    assert [i['value'] for i in create_indicators.call_args[0][0]] == ['3.3.3.3']
+    assert integration_context['feed_indicators_delta']['fingerprints']
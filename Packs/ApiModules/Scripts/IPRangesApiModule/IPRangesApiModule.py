@@ -0,0 +1,151 @@
+''' IMPORTS '''
+
+import ipaddress
+import socket
+from typing import Iterable, List, Tuple, Dict
+
+''' GLOBALS '''
+
+IP_VERSION_BITS = {4: 32, 6: 128}
+
+
+''' HELPER FUNCTIONS '''
+
+
+def ip_to_int(ip: str) -> Tuple[int, int]:
+    """Parse an IP address.
+
+    Args:
+        ip (str): An IPv4 or IPv6 address.
+
+    Returns:
+        tuple. The IP version and the IP as an integer.
+    """
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except OSError:
+        address = ipaddress.ip_address(ip)
+        return address.version, int(address)
+
+
+def int_to_ip(version: int, ip: int) -> str:
+    """Format an IP address.
+
+    Args:
+        version (int): The IP version - 4 or 6.
+        ip (int): The IP as an integer.
+
+    Returns:
+        str. The IP address.
+    """
+    if version == 4:
+        return socket.inet_ntoa(ip.to_bytes(4, 'big'))
+    return str(ipaddress.IPv6Address(ip))
+
+
+def parse_ip_interval(value) -> Tuple[int, int, int]:
+    """Parse an IP, a CIDR or an IP range to an interval of integers.
+
+    Args:
+        value: An IP, CIDR or range (first-last) string, or an object which converts to an integer IP and has a
+            version attribute, such as netaddr.IPAddress.
+
+    Returns:
+        tuple. The IP version, the first IP and the last IP of the interval.
+    """
+    if not isinstance(value, str):
+        return value.version, int(value), int(value)
+
+    value = value.strip()
+    if '/' in value:
+        network = ipaddress.ip_network(value, strict=False)
+        return network.version, int(network.network_address), int(network.broadcast_address)
+
+    if '-' in value:
+        first, last = value.split('-', 1)
+        version, first_ip = ip_to_int(first.strip())
+        last_version, last_ip = ip_to_int(last.strip())
+        if version != last_version or first_ip > last_ip:
+            raise ValueError(f'{value} is not a valid IP range')
+        return version, first_ip, last_ip
+
+    version, ip = ip_to_int(value)
+    return version, ip, ip
+
+
+def merge_ip_intervals(intervals: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Merge overlapping and adjacent intervals of IPs of the same version, in a single pass over the sorted intervals.
+
+    Args:
+        intervals (Iterable): (first IP, last IP) integer pairs.
+
+    Returns:
+        list. The sorted, disjoint and non-adjacent intervals.
+    """
+    merged: List[List[int]] = []
+    for first, last in sorted(intervals):
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1][1] = last
+        else:
+            merged.append([first, last])
+    return [(first, last) for first, last in merged]
+
+
+def interval_to_cidrs(first: int, last: int, bits: int) -> List[Tuple[int, int]]:
+    """Get the minimal list of CIDRs which covers exactly an interval of IPs.
+
+    Args:
+        first (int): The first IP of the interval.
+        last (int): The last IP of the interval.
+        bits (int): The number of bits of the IP version - 32 or 128.
+
+    Returns:
+        list. (network IP, prefix length) pairs.
+    """
+    cidrs = []
+    while first <= last:
+        # the largest block aligned to the first IP, which does not pass the last IP
+        size = min((first & -first) or (1 << bits), 1 << ((last - first + 1).bit_length() - 1))
+        cidrs.append((first, bits - size.bit_length() + 1))
+        first += size
+    return cidrs
+
+
+''' MAIN FUNCTION '''
+
+
+def collapse_ip_indicators(values: Iterable, to_cidrs: bool = False) -> List[str]:
+    """Collapse IPs, CIDRs and IP ranges to the minimal list of ranges or CIDRs which covers them.
+
+    The values are sorted as integers and merged in a single pass, so a list of n values is collapsed in O(n log n).
+    IPv4 values are returned before IPv6 values, and values which are not IPs are returned as is, after them.
+
+    Args:
+        values (Iterable): IP, CIDR and range (first-last) strings, or netaddr.IPAddress objects.
+        to_cidrs (bool): Whether to collapse to CIDRs instead of first-last ranges.
+
+    Returns:
+        list. The ranges or CIDRs, where a single IP is returned as the IP.
+    """
+    intervals: Dict[int, List[Tuple[int, int]]] = {4: [], 6: []}
+    invalid = []
+    for value in values:
+        try:
+            version, first, last = parse_ip_interval(value)
+        except ValueError:
+            invalid.append(str(value))
+            continue
+        intervals[version].append((first, last))
+
+    collapsed = []
+    for version, bits in IP_VERSION_BITS.items():
+        for first, last in merge_ip_intervals(intervals[version]):
+            if first == last:
+                collapsed.append(int_to_ip(version, first))
+            elif to_cidrs:
+                collapsed.extend(int_to_ip(version, network) if prefix == bits else f'{int_to_ip(version, network)}/{prefix}'
+                                 for network, prefix in interval_to_cidrs(first, last, bits))
+            else:
+                collapsed.append(f'{int_to_ip(version, first)}-{int_to_ip(version, last)}')
+    return collapsed + invalid
@@ -0,0 +1,121 @@
+import os
+import random
+
+import pytest
+from netaddr import IPAddress, IPSet, IPRange, cidr_merge
+
+from IPRangesApiModule import collapse_ip_indicators, interval_to_cidrs
+
+
+@pytest.mark.parametrize('values, to_cidrs, expected', [
+    (['1.1.1.1', '25.24.23.22', '22.21.20.19', '1.1.1.2', '1.2.3.4', '1.1.1.3', '2.2.2.2', '1.2.3.5'],
+     False, ['1.1.1.1-1.1.1.3', '1.2.3.4-1.2.3.5', '2.2.2.2', '22.21.20.19', '25.24.23.22']),
+    (['1.1.1.1', '25.24.23.22', '22.21.20.19', '1.1.1.2', '1.2.3.4', '1.1.1.3', '2.2.2.2', '1.2.3.5'],
+     True, ['1.1.1.1', '1.1.1.2/31', '1.2.3.4/31', '2.2.2.2', '22.21.20.19', '25.24.23.22']),
+    (['10.0.0.0/25', '10.0.0.128-10.0.0.255', '10.0.1.0', '10.0.0.7'], True, ['10.0.0.0/24', '10.0.1.0']),
+    (['10.0.0.0/25', '10.0.0.128-10.0.0.255', '10.0.1.0'], False, ['10.0.0.0-10.0.1.0']),
+    (['2001:db8::1', '2001:db8::/127', '1.1.1.1', '2001:db8::3'], True,
+     ['1.1.1.1', '2001:db8::/127', '2001:db8::3']),
+    ([IPAddress('1.1.1.2'), IPAddress('1.1.1.3'), '0.0.0.0/0'], True, ['0.0.0.0/0']),
+    (['1.1.1.1', 'not an ip', '1.1.1.3-1.1.1.1'], False, ['1.1.1.1', 'not an ip', '1.1.1.3-1.1.1.1']),
+    ([], False, []),
+])
+def test_collapse_ips(values, to_cidrs, expected):
+    """
+    Given
+    - IPs, CIDRs and ranges, some overlapping or adjacent, and some which are not valid.
+
+    When
+    - Collapsing them to ranges or CIDRs.
+
+    Then
+    - Ensure the IPs are merged to the minimal sorted list of ranges or CIDRs, and the invalid values are kept.
+    """
+    assert collapse_ip_indicators(values, to_cidrs) == expected
+
+
+def test_interval_to_cidrs_is_minimal():
+    """
+    Given
+    - Random intervals of IPv4 and IPv6 addresses.
+
+    When
+    - Covering them with CIDRs.
+
+    Then
+    - Ensure the CIDRs are the same as the minimal cover calculated by netaddr.
+    """
+    rand = random.Random(0)
+    for bits in (32, 128):
+        for _ in range(200):
+            first = rand.getrandbits(bits)
+            last = min(first + rand.getrandbits(rand.randint(1, 24)), 2 ** bits - 1)
+            version = 4 if bits == 32 else 6
+            expected = [(int(cidr.network), cidr.prefixlen)
+                        for cidr in IPRange(IPAddress(first, version), IPAddress(last, version)).cidrs()]
+            assert interval_to_cidrs(first, last, bits) == expected
+
+
+def test_collapse_ips_covers_the_same_ips():
+    """
+    Given
+    - Random clustered IPs.
+
+    When
+    - Collapsing them to CIDRs.
+
+    Then
+    - Ensure the CIDRs cover exactly the given IPs, as merged by netaddr.
+    """
+    ips = random_ips(5000, clustered=True, seed=1)
+    collapsed = collapse_ip_indicators(ips, to_cidrs=True)
+    assert IPSet(collapsed) == IPSet(ips)
+    assert len(collapsed) == len(cidr_merge(ips))
+
+
+def random_ips(size, clustered, seed=0):
+    rand = random.Random(seed)
+    if not clustered:
+        return ['{}.{}.{}.{}'.format(*rand.getrandbits(32).to_bytes(4, 'big')) for _ in range(size)]
+    ips = []
+    while len(ips) < size:
+        base = rand.getrandbits(24) << 8
+        ips.extend('{}.{}.{}.{}'.format(*(base + offset).to_bytes(4, 'big'))
+                   for offset in rand.sample(range(256), rand.randint(1, 200)))
+    return ips[:size]
+
+
+@pytest.mark.skipif(not os.getenv('CONTENT_BENCHMARK'), reason='benchmark - set CONTENT_BENCHMARK to run')
+def test_collapse_ips_benchmark(capfd):
+    """
+    Measures IPs per second of collapsing 1M (CONTENT_BENCHMARK_SIZE to override) random and clustered IPs to CIDRs.
+    The pairwise grouping used before is quadratic, so it is measured on the first 2000 IPs only.
+    """
+    import time
+
+    def legacy_group_ips(ips):
+        ips = sorted(ips)
+        groups = [[ips[0]]]
+        for ip in ips[1:]:
+            appended = False
+            for group in groups:
+                if IPAddress(int(ip) + 1) in group or IPAddress(int(ip) - 1) in group:
+                    group.append(ip)
+                    appended = True
+            if not appended:
+                groups.append([ip])
+        return groups
+
+    size = int(os.getenv('CONTENT_BENCHMARK_SIZE', 1000000))
+    for clustered in (False, True):
+        ips = random_ips(size, clustered)
+        legacy_ips = [IPAddress(ip) for ip in ips[:2000]]
+        start = time.time()
+        legacy_group_ips(legacy_ips)
+        legacy_rate = len(legacy_ips) / (time.time() - start)
+        start = time.time()
+        collapsed = collapse_ip_indicators(ips, to_cidrs=True)
+        rate = size / (time.time() - start)
+        with capfd.disabled():
+            print('\n{}: before: {:.0f} IPs/s ({} IPs), after: {:.0f} IPs/s ({} IPs to {} CIDRs)'.format(
+                'clustered' if clustered else 'random', legacy_rate, len(legacy_ips), rate, size, len(collapsed)))
@@ -0,0 +1,86 @@
+''' IMPORTS '''
+
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+''' GLOBALS '''
+
+OUTPUTS_CACHE_SIZE: int = 32
+OUTPUTS_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+# larger outputs are served without being cached
+OUTPUTS_CACHE_MAX_OUTPUT_BYTES: int = 8 * 1024 * 1024
+
+
+''' OUTPUTS CACHE CLASS '''
+
+
+class OutputsCache:
+    """
+    A bounded LRU cache of the outputs of the recently requested request arguments, so clients which poll with
+    different arguments do not recompute each other's outputs. Every output is kept with the version of the IOCs it
+    was created from - the time of the search in which they were found.
+    The cache is bounded by the number of outputs and by their total size, where the size of an output is its length
+    - its size in bytes for ASCII outputs. Outputs larger than max_output_bytes are not cached.
+    The request arguments are keyed by their cache_key() method.
+    """
+
+    def __init__(self, max_size: int = OUTPUTS_CACHE_SIZE, max_bytes: int = OUTPUTS_CACHE_MAX_BYTES,
+                 max_output_bytes: int = OUTPUTS_CACHE_MAX_OUTPUT_BYTES):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.max_output_bytes = min(max_output_bytes, max_bytes)
+        self._outputs: OrderedDict = OrderedDict()
+        self._bytes = 0
+
+    def get(self, request_args: Any) -> Tuple[Optional[str], Optional[int]]:
+        """
+        Gets the cached output of request arguments
+
+        Returns:
+            The output and the version of its IOCs, or None and None if it is not cached
+        """
+        key = request_args.cache_key()
+        if key not in self._outputs:
+            return None, None
+        self._outputs.move_to_end(key)
+        return self._outputs[key]
+
+    def set(self, request_args: Any, output: str, version: Optional[int]):
+        """
+        Caches the output of request arguments, and evicts the least recently used outputs if the cache is full
+        """
+        key = request_args.cache_key()
+        if key in self._outputs:
+            self._bytes -= len(self._outputs.pop(key)[0])
+        if len(output) > self.max_output_bytes:
+            return
+        self._outputs[key] = (output, version)
+        self._bytes += len(output)
+        while len(self._outputs) > self.max_size or self._bytes > self.max_bytes:
+            evicted_output, _ = self._outputs.popitem(last=False)[1]
+            self._bytes -= len(evicted_output)
+
+    def clear(self):
+        self._outputs.clear()
+        self._bytes = 0
+
+
+''' HELPER FUNCTIONS '''
+
+
+def normalize_request_arg(value: Any) -> Any:
+    """
+    Normalizes a request argument, so arguments given as query parameters and as integration parameters are equal
+    """
+    if isinstance(value, list):
+        return tuple(value)
+    if isinstance(value, str) and value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    return value
+
+
+def accepts_gzip(headers) -> bool:
+    """
+    Checks whether the client accepts a gzip compressed response
+    """
+    return 'gzip' in headers.get('Accept-Encoding', '').lower()
@@ -0,0 +1,79 @@
+import pytest
+
+from IndicatorsOutputsApiModule import OutputsCache, accepts_gzip, normalize_request_arg
+
+
+class RequestArguments:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def cache_key(self) -> tuple:
+        return tuple((name, normalize_request_arg(value)) for name, value in sorted(vars(self).items()))
+
+
+def test_outputs_cache_lru():
+    """
+    Given
+    - An outputs cache which is bounded by the number of outputs.
+
+    When
+    - Caching more outputs than the bound.
+
+    Then
+    - Ensure the least recently used output is evicted.
+    """
+    cache = OutputsCache(max_size=2)
+    first, second, third = (RequestArguments(limit=limit) for limit in (1, 2, 3))
+    cache.set(first, 'first', 1)
+    cache.set(second, 'second', 1)
+    assert cache.get(first) == ('first', 1)
+    cache.set(third, 'third', 1)
+    assert cache.get(second) == (None, None)
+    assert cache.get(first) == ('first', 1)
+    assert cache.get(third) == ('third', 1)
+
+
+def test_outputs_cache_max_bytes():
+    """
+    Given
+    - An outputs cache which is bounded by the total size of the outputs.
+
+    When
+    - Caching outputs whose total size passes the bound, and an output larger than the size of a single output.
+
+    Then
+    - Ensure the least recently used outputs are evicted, and the large output is not cached.
+    """
+    cache = OutputsCache(max_bytes=10, max_output_bytes=6)
+    first, second, third = (RequestArguments(limit=limit) for limit in (1, 2, 3))
+    cache.set(first, '1' * 4, 1)
+    cache.set(second, '2' * 4, 1)
+    cache.set(third, '3' * 4, 1)
+    assert cache.get(first) == (None, None)
+    assert cache.get(second) == ('2' * 4, 1)
+    cache.set(second, '2' * 7, 2)
+    assert cache.get(second) == (None, None)
+    assert cache.get(third) == ('3' * 4, 1)
+    cache.clear()
+    assert cache.get(third) == (None, None)
+
+
+@pytest.mark.parametrize('value, expected', [
+    (['a', 'b'], ('a', 'b')),
+    ('True', True),
+    ('false', False),
+    ('1', '1'),
+    (None, None),
+])
+def test_normalize_request_arg(value, expected):
+    assert normalize_request_arg(value) == expected
+
+
+@pytest.mark.parametrize('headers, expected', [
+    ({'Accept-Encoding': 'gzip, deflate'}, True),
+    ({'Accept-Encoding': 'GZIP'}, True),
+    ({'Accept-Encoding': 'deflate'}, False),
+    ({}, False),
+])
+def test_accepts_gzip(headers, expected):
+    assert accepts_gzip(headers) is expected
@@ -1,9 +1,10 @@
 from CommonServerPython import *
 
 ''' IMPORTS '''
+import itertools
 import urllib3
 import jmespath
-from typing import List, Dict, Union, Optional
+from typing import List, Dict, Union, Optional, Iterator
 
 # disable insecure warnings
 urllib3.disable_warnings()
@@ -14,7 +15,7 @@ class Client:
                  feed_name_to_config: Dict[str, dict] = None, source_name: str = 'JSON',
                  extractor: str = '', indicator: str = 'indicator',
                  insecure: bool = False, cert_file: str = None, key_file: str = None, headers: dict = None,
-                 tlp_color: Optional[str] = None, **_):
+                 tlp_color: Optional[str] = None, max_concurrency: int = 1, conditional_fetch: bool = False, **_):
         """
         Implements class for miners of JSON feeds over http/https.
         :param url: URL of the feed.
@@ -32,6 +33,10 @@ class Client:
         Example: headers = {'user-agent': 'my-app/0.0.1'} or Authorization: Bearer
         (curl -H "Authorization: Bearer " "https://api-url.com/api/v1/iocs?first_seen_since=2016-1-1")
         :param tlp_color: Traffic Light Protocol color.
+        :param max_concurrency: The maximal number of feed URLs to download concurrently. Default: 1
+        :param conditional_fetch: Whether to skip feed URLs which did not change since the last fetch. The ETag,
+        Last-Modified and content hash of each URL are kept in the integration context (see `fetch_state`),
+        and a URL is skipped when the server answers 304 Not Modified or the content hash is unchanged.
 
          Example:
             Example feed config:
@@ -75,26 +80,68 @@ class Client:
         self.cert = (cert_file, key_file) if cert_file and key_file else None
         self.tlp_color = tlp_color
 
+        try:
+            self.max_concurrency = max(int(max_concurrency), 1)
+        except (ValueError, TypeError):
+            raise ValueError('Please provide an integer value for "Maximum concurrent requests"')
+        # one pooled session is shared by all the feed URLs
+        self.session = build_feed_session(self.max_concurrency)
+
+        self.conditional_fetch = argToBoolean(conditional_fetch)
+        # the state of the last fetch, and the state of this fetch to save once its indicators were created
+        self.fetch_state: Dict[str, dict] = {}
+        self.new_fetch_state: Dict[str, dict] = {}
+
+    def get_feed_data(self, url: str, **kwargs):
+        """
+        Send the HTTP request of a feed URL.
+        :param url: The feed URL
+        :param kwargs: Arguments to send with the request
+        :return: The parsed JSON response, or None if conditional fetch is used and the feed did not change
+        """
+        headers = self.headers
+        previous_state = self.fetch_state.get(url, {})
+        if self.conditional_fetch:
+            headers = {**(headers or {}), **conditional_request_headers(previous_state)}
+
+        r = self.session.get(
+            url=url,
+            verify=self.verify,
+            auth=self.auth,
+            cert=self.cert,
+            headers=headers,
+            **kwargs
+        )
+        if self.conditional_fetch and r.status_code == 304:
+            self.new_fetch_state[url] = previous_state
+            return None
+
+        try:
+            r.raise_for_status()
+            if self.conditional_fetch:
+                # the response is parsed as a whole, so its content is hashed for servers without ETag and
+                # Last-Modified
+                self.new_fetch_state[url] = state = response_fetch_state(r, r.content)
+                if state['hash'] == previous_state.get('hash'):
+                    return None
+            return r.json()
+
+        except ValueError as VE:
+            raise ValueError(f'Could not parse returned data to Json. \n\nError massage: {VE}')
+
     def build_iterator(self, **kwargs) -> List:
+        feeds = list(self.feed_name_to_config.items())
+        # feeds which share a URL (e.g. the services of a cloud provider) are downloaded once
+        urls = list(dict.fromkeys(feed.get('url', self.url) for _, feed in feeds))
+        url_to_data = dict(zip(urls, ordered_concurrent_map(lambda url: self.get_feed_data(url, **kwargs), urls,
+                                                            self.max_concurrency)))
         results = []
-        for feed_name, feed in self.feed_name_to_config.items():
-            r = requests.get(
-                url=feed.get('url', self.url),
-                verify=self.verify,
-                auth=self.auth,
-                cert=self.cert,
-                headers=self.headers,
-                **kwargs
-            )
-
-            try:
-                r.raise_for_status()
-                data = r.json()
-                result = jmespath.search(expression=feed.get('extractor'), data=data)
-                results.append({feed_name: result})
-
-            except ValueError as VE:
-                raise ValueError(f'Could not parse returned data to Json. \n\nError massage: {VE}')
+        for feed_name, feed in feeds:
+            data = url_to_data[feed.get('url', self.url)]
+            if data is None:
+                continue
+            result = jmespath.search(expression=feed.get('extractor'), data=data)
+            results.append({feed_name: result})
 
         return results
 
@@ -104,15 +151,14 @@ def test_module(client, params) -> str:
     return 'ok'
 
 
-def fetch_indicators_command(client: Client, indicator_type: str, feedTags: list, auto_detect: bool, **kwargs) \
-        -> Union[Dict, List[Dict]]:
+def generate_indicators(client: Client, indicator_type: str, feedTags: list, auto_detect: bool, **kwargs) \
+        -> Iterator[Dict]:
     """
-    Fetches the indicators from client.
+    Lazily creates the indicators from client, so they can be submitted in batches.
     :param client: Client of a JSON Feed
     :param indicator_type: the default indicator type
     :param feedTags: the indicator tags
     """
-    indicators = []
     for result in client.build_iterator(**kwargs):
         for service_name, items in result.items():
             feed_config = client.feed_name_to_config.get(service_name, {})
@@ -152,9 +198,18 @@ def fetch_indicators_command(client: Client, indicator_type: str, feedTags: list
 
                 indicator['rawJSON'] = item
 
-                indicators.append(indicator)
+                yield indicator
+
 
-    return indicators
+def fetch_indicators_command(client: Client, indicator_type: str, feedTags: list, auto_detect: bool, **kwargs) \
+        -> Union[Dict, List[Dict]]:
+    """
+    Fetches the indicators from client.
+    :param client: Client of a JSON Feed
+    :param indicator_type: the default indicator type
+    :param feedTags: the indicator tags
+    """
+    return list(generate_indicators(client, indicator_type, feedTags, auto_detect, **kwargs))
 
 
 def determine_indicator_type(indicator_type, auto_detect, value):
@@ -224,16 +279,29 @@ def feed_main(params, feed_name, prefix):
             return_outputs(test_module(client, params))
 
         elif command == 'fetch-indicators':
-            indicators = fetch_indicators_command(client, params.get('indicator_type'), feedTags,
-                                                  params.get('auto_detect_type'))
+            indicators_delta = get_indicators_delta(params)
+            if client.conditional_fetch and not (indicators_delta and indicators_delta.is_full_submission):
+                # a full submission reads all the feed URLs, changed or not
+                client.fetch_state = get_fetch_state()
+            indicators = generate_indicators(client, params.get('indicator_type'), feedTags,
+                                             params.get('auto_detect_type'))
+            if indicators_delta:
+                indicators = indicators_delta.filter(indicators)
+            # we submit the indicators in batches while they are created
             for b in batch(indicators, batch_size=2000):
                 demisto.createIndicators(b)
+            # saved only once all the indicators were created, so a failed fetch is retried in full
+            if client.conditional_fetch:
+                save_fetch_state(client.new_fetch_state)
+            if indicators_delta:
+                save_indicators_delta(indicators_delta)
 
         elif command == f'{prefix}get-indicators':
             # dummy command for testing
             limit = int(demisto.args().get('limit', 10))
             auto_detect = params.get('auto_detect_type')
-            indicators = fetch_indicators_command(client, indicator_type, feedTags, auto_detect)[:limit]
+            indicators = list(itertools.islice(generate_indicators(client, indicator_type, feedTags, auto_detect),
+                                               limit))
             hr = tableToMarkdown('Indicators', indicators, headers=['value', 'type', 'rawJSON'])
             return_outputs(hr, {}, indicators)
 
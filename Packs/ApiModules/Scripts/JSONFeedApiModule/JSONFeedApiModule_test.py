@@ -121,3 +121,97 @@ def test_list_of_indicators_with_no_json_object():
         assert indicators[0].get('value') == '1.1.1.1'
         assert indicators[0].get('type') == 'IP'
         assert indicators[1].get('rawJSON') == {'indicator': '2.2.2.2'}
+
+
+def test_json_feed_concurrent_urls_shared_url_downloaded_once():
+    """
+    Given
+    - Several feeds, two of them sharing the same URL.
+
+    When
+    - Fetching indicators with a maximal concurrency of 2.
+
+    Then
+    - Ensure each URL is requested once.
+    - Ensure the indicators are returned in the order of the feeds.
+    """
+    feed_name_to_config = {
+        'AMAZON': {'url': 'https://aws.test/ip-ranges.json', 'extractor': "prefixes[?service=='AMAZON']",
+                   'indicator': 'ip_prefix'},
+        'OTHER': {'url': 'https://other.test/ips.json', 'extractor': 'ips', 'indicator': 'ip'},
+        'EC2': {'url': 'https://aws.test/ip-ranges.json', 'extractor': "prefixes[?service=='EC2']",
+                'indicator': 'ip_prefix'},
+    }
+    aws_data = {'prefixes': [{'ip_prefix': '1.1.1.0/24', 'service': 'AMAZON'},
+                             {'ip_prefix': '2.2.2.0/24', 'service': 'EC2'}]}
+
+    with requests_mock.Mocker() as m:
+        aws = m.get('https://aws.test/ip-ranges.json', json=aws_data)
+        other = m.get('https://other.test/ips.json', json={'ips': [{'ip': '3.3.3.3'}]})
+        client = Client(feed_name_to_config=feed_name_to_config, max_concurrency=2)
+        indicators = fetch_indicators_command(client=client, indicator_type='IP', feedTags=[], auto_detect=False)
+
+    assert aws.call_count == other.call_count == 1
+    assert [indicator['value'] for indicator in indicators] == ['1.1.1.0/24', '3.3.3.3', '2.2.2.0/24']
+
+
+def test_feed_main_conditional_fetch(mocker):
+    """
+    Given
+    - A JSON feed with conditional fetch, whose server does not support conditional requests.
+
+    When
+    - Fetching indicators twice, with the same content.
+
+    Then
+    - Ensure the second fetch creates no indicators, as the content hash did not change.
+    """
+    from JSONFeedApiModule import feed_main
+    url = 'https://ips.test/ips.json'
+    integration_context: dict = {}
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    create_indicators = mocker.patch.object(demisto, 'createIndicators')
+    params = {'url': url, 'extractor': 'ips', 'indicator': 'ip', 'indicator_type': 'IP', 'conditional_fetch': True}
+
+    with requests_mock.Mocker() as m:
+        m.get(url, json={'ips': [{'ip': '1.1.1.1'}]})
+        feed_main(params, 'JSON', 'json')
+        feed_main(params, 'JSON', 'json')
+
+    assert create_indicators.call_count == 1
+    assert integration_context['feed_fetch_state'][url]['hash']
+
+
+def test_feed_main_delta_submission(mocker):
+    """
+    Given
+    - A JSON feed with delta submission.
+
+    When
+    - Fetching indicators twice, where an indicator is added to the feed before the second fetch.
+
+    Then
+    - Ensure the first fetch creates all the indicators, and the second creates only the added one.
+    """
+    from JSONFeedApiModule import feed_main
+    url = 'https://ips.test/ips.json'
+    integration_context: dict = {}
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    create_indicators = mocker.patch.object(demisto, 'createIndicators')
+    params = {'url': url, 'extractor': 'ips', 'indicator': 'ip', 'indicator_type': 'IP', 'delta_submission': True}
+
+    with requests_mock.Mocker() as m:
+        m.get(url, json={'ips': [{'ip': '1.1.1.1'}, {'ip': '2.2.2.2'}]})
+        feed_main(params, 'JSON', 'json')
+        assert [i['value'] for i in create_indicators.call_args[0][0]] == ['1.1.1.1', '2.2.2.2']
+
+        create_indicators.reset_mock()
+        m.get(url, json={'ips': [{'ip': '1.1.1.1'}, {'ip': '2.2.2.2'}, {'ip': '3.3.3.3'}]})
+        feed_main(params, 'JSON', 'json')
+
+    assert [i['value'] for i in create_indicators.call_args[0][0]] == ['3.3.3.3']
+    assert integration_context['feed_indicators_delta']['fingerprints']
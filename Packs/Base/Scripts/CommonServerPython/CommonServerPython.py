@@ -6,12 +6,17 @@ Note that adding code to CommonServerUserPython can override functions in Common
 from __future__ import print_function
 
 import base64
+import hashlib
+import io
+import itertools
 import json
 import logging
 import os
 import re
 import socket
+import struct
 import sys
+import tempfile
 import time
 import traceback
 from random import randint
@@ -25,7 +30,7 @@ import demistomock as demisto
 # imports something that can be missed from docker image
 try:
     import requests
-    from requests.adapters import HTTPAdapter
+    from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
     from urllib3.util import Retry
     from typing import Optional, List, Any
 except Exception:
@@ -277,66 +282,146 @@ class FeedIndicatorType(object):
             return None
 
 
-def auto_detect_indicator_type(indicator_value):
+_TLD_EXTRACTOR = None
+
+
+def _get_tld_extractor(tldextract):
     """
-      Infer the type of the indicator.
+      Returns the module-level suffix extractor, creating it on first use. Building a ``TLDExtract``
+      parses the whole public suffix list, so it is shared between all indicator type lookups.
 
-      :type indicator_value: ``str``
-      :param indicator_value: The indicator whose type we want to check. (required)
+      :type tldextract: ``module``
+      :param tldextract: The imported tldextract module. (required)
 
-      :return: The type of the indicator.
-      :rtype: ``str``
+      :return: The shared suffix extractor.
+      :rtype: ``tldextract.TLDExtract``
     """
-    try:
-        import tldextract
-    except Exception:
-        raise Exception("Missing tldextract module, In order to use the auto detect function please use a docker"
-                        " image with it installed such as: demisto/jmespath")
+    global _TLD_EXTRACTOR
+    if _TLD_EXTRACTOR is None:
+        _TLD_EXTRACTOR = tldextract.TLDExtract(cache_file=False, suffix_list_urls=None)
+    return _TLD_EXTRACTOR
 
-    if re.match(ipv4cidrRegex, indicator_value):
-        return FeedIndicatorType.CIDR
 
-    if re.match(ipv6cidrRegex, indicator_value):
-        return FeedIndicatorType.IPv6CIDR
+class IndicatorTypeClassifier(object):
+    """
+      Infers indicator types using precompiled patterns and the shared suffix extractor.
+      Results are identical to ``auto_detect_indicator_type``, which uses a default instance of this class.
 
-    if re.match(ipv4Regex, indicator_value):
-        return FeedIndicatorType.IP
+      :type cache_size: ``int``
+      :param cache_size: Maximum number of values to memoize in an LRU cache. 0 disables the cache.
 
-    if re.match(ipv6Regex, indicator_value):
-        return FeedIndicatorType.IPv6
+      :return: No data returned
+      :rtype: ``None``
+    """
+    def __init__(self, cache_size=0):
+        try:
+            import tldextract
+        except Exception:
+            raise Exception("Missing tldextract module, In order to use the auto detect function please use a docker"
+                            " image with it installed such as: demisto/jmespath")
+        self._tldextract = tldextract
+        # Order matters - the first matching pattern determines the indicator type.
+        self._patterns = [
+            (re.compile(ipv4cidrRegex), FeedIndicatorType.CIDR),
+            (re.compile(ipv6cidrRegex), FeedIndicatorType.IPv6CIDR),
+            (re.compile(ipv4Regex), FeedIndicatorType.IP),
+            (re.compile(ipv6Regex), FeedIndicatorType.IPv6),
+            (sha256Regex, FeedIndicatorType.File),
+            (re.compile(urlRegex), FeedIndicatorType.URL),
+            (md5Regex, FeedIndicatorType.File),
+            (sha1Regex, FeedIndicatorType.File),
+            (re.compile(emailRegex), FeedIndicatorType.Email),
+            (re.compile(cveRegex), FeedIndicatorType.CVE),
+            (sha512Regex, FeedIndicatorType.File),
+        ]
+        self.cache_size = max(int(cache_size or 0), 0)
+        self._cache = OrderedDict()  # type: ignore
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _detect(self, indicator_value):
+        for pattern, indicator_type in self._patterns:
+            if pattern.match(indicator_value):
+                return indicator_type
 
-    if re.match(sha256Regex, indicator_value):
-        return FeedIndicatorType.File
+        try:
+            if _get_tld_extractor(self._tldextract)(indicator_value).suffix:
+                if '*' in indicator_value:
+                    return FeedIndicatorType.DomainGlob
+                return FeedIndicatorType.Domain
 
-    if re.match(urlRegex, indicator_value):
-        return FeedIndicatorType.URL
+        except Exception:
+            pass
 
-    if re.match(md5Regex, indicator_value):
-        return FeedIndicatorType.File
+        return None
 
-    if re.match(sha1Regex, indicator_value):
-        return FeedIndicatorType.File
+    def classify(self, indicator_value):
+        """
+          Infer the type of the indicator.
 
-    if re.match(emailRegex, indicator_value):
-        return FeedIndicatorType.Email
+          :type indicator_value: ``str``
+          :param indicator_value: The indicator whose type we want to check. (required)
 
-    if re.match(cveRegex, indicator_value):
-        return FeedIndicatorType.CVE
+          :return: The type of the indicator.
+          :rtype: ``str``
+        """
+        if not self.cache_size:
+            return self._detect(indicator_value)
 
-    if re.match(sha512Regex, indicator_value):
-        return FeedIndicatorType.File
+        try:
+            indicator_type = self._cache.pop(indicator_value)
+            self.cache_hits += 1
+        except KeyError:
+            indicator_type = self._detect(indicator_value)
+            self.cache_misses += 1
+            if len(self._cache) >= self.cache_size:
+                self._cache.popitem(last=False)
+        self._cache[indicator_value] = indicator_type
+        return indicator_type
+
+    def classify_many(self, indicator_values):
+        """
+          Infer the types of several indicators.
 
-    try:
-        no_cache_extract = tldextract.TLDExtract(cache_file=False, suffix_list_urls=None)
-        if no_cache_extract(indicator_value).suffix:
-            if '*' in indicator_value:
-                return FeedIndicatorType.DomainGlob
-            return FeedIndicatorType.Domain
+          :type indicator_values: ``iterable``
+          :param indicator_values: The indicators whose types we want to check. (required)
 
-    except Exception:
-        pass
+          :return: The types of the indicators, in the order of the given values.
+          :rtype: ``list``
+        """
+        classify = self.classify
+        return [classify(indicator_value) for indicator_value in indicator_values]
+
+    def clear_cache(self):
+        """
+          Empties the LRU cache and resets its statistics.
+
+          :return: No data returned
+          :rtype: ``None``
+        """
+        self._cache.clear()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+_DEFAULT_INDICATOR_TYPE_CLASSIFIER = None
+
+
+def auto_detect_indicator_type(indicator_value):
+    """
+      Infer the type of the indicator.
 
-    return None
+      :type indicator_value: ``str``
+      :param indicator_value: The indicator whose type we want to check. (required)
+
+      :return: The type of the indicator.
+      :rtype: ``str``
+    """
+    global _DEFAULT_INDICATOR_TYPE_CLASSIFIER
+    if _DEFAULT_INDICATOR_TYPE_CLASSIFIER is None:
+        _DEFAULT_INDICATOR_TYPE_CLASSIFIER = IndicatorTypeClassifier()
+
+    return _DEFAULT_INDICATOR_TYPE_CLASSIFIER.classify(indicator_value)
 
 
 def handle_proxy(proxy_param_name='proxy', checkbox_default_value=False, handle_insecure=True,
@@ -1805,6 +1890,68 @@ def xml2json(xmlstring, options={}, strip_ns=1, strip=1):
     return elem2json(elem, options, strip_ns=strip_ns, strip=strip)
 
 
+def xml2dict(xmlstring, strip_ns=1, strip=1):
+    """
+       Convert an XML string into a dictionary, the same as ``json.loads(xml2json(xmlstring))``
+       but without serializing to JSON and parsing it back.
+
+       :type xmlstring: ``str``
+       :param xmlstring: The string to be converted (required)
+
+       :type strip_ns: ``bool``
+       :param strip_ns: Whether to strip the namespaces from the tags (optional)
+
+       :type strip: ``bool``
+       :param strip: Whether to strip leading and trailing whitespace from the texts (optional)
+
+       :return: The converted dictionary
+       :rtype: ``dict``
+    """
+    return elem_to_internal(ET.fromstring(xmlstring), strip_ns=strip_ns, strip=strip)
+
+
+def iter_xml2dict(xml, path, strip_ns=1, strip=1):
+    """
+       Iterate over the elements at a path of an XML document, each converted as by ``xml2dict``.
+       The document is parsed incrementally and every element is dropped once it is converted,
+       so the repeated elements of a large document are not held in memory together.
+
+       :type xml: ``str`` or ``bytes`` or ``file``
+       :param xml: The XML string, or a file-like object to read it from (required)
+
+       :type path: ``str``
+       :param path: The path of the elements from the root element, e.g. ``result/log/logs/entry`` (required)
+
+       :type strip_ns: ``bool``
+       :param strip_ns: Whether to strip the namespaces from the tags (optional)
+
+       :type strip: ``bool``
+       :param strip: Whether to strip leading and trailing whitespace from the texts (optional)
+
+       :return: A generator of the converted elements, without their tag
+       :rtype: ``generator``
+    """
+    if isinstance(xml, bytes):
+        xml = io.BytesIO(xml)
+    elif isinstance(xml, STRING_OBJ_TYPES):
+        xml = io.StringIO(xml) if IS_PY3 else io.BytesIO(xml.encode('utf-8'))
+
+    path_tags = path.strip('/').split('/')
+    tags = []  # type: list
+    elems = []  # type: list
+    for event, elem in ET.iterparse(xml, events=('start', 'end')):
+        if event == 'start':
+            tags.append(strip_tag(elem.tag) if strip_ns else elem.tag)
+            elems.append(elem)
+            continue
+
+        if len(tags) == len(path_tags) + 1 and tags[1:] == path_tags:
+            yield elem_to_internal(elem, strip_ns=strip_ns, strip=strip)[tags[-1]]
+            elems[-2].remove(elem)
+        tags.pop()
+        elems.pop()
+
+
 def json2xml(json_data, factory=ET.Element):
     """Convert a JSON string into an XML string.
     Whatever Element implementation we could import will be used by
@@ -4080,6 +4227,8 @@ if 'requests' in sys.modules:
 
 def batch(iterable, batch_size=1):
     """Gets an iterable and yields slices of it.
+    Sequences (e.g. ``list``) are sliced in place, any other iterable (e.g. a generator) is consumed lazily,
+    holding at most ``batch_size`` items in memory at a time.
 
     :type iterable: ``list``
     :param iterable: list or other iterable object.
@@ -4090,12 +4239,317 @@ def batch(iterable, batch_size=1):
     :rtype: ``list``
     :return:: Iterable slices of given
     """
-    current_batch = iterable[:batch_size]
-    not_batched = iterable[batch_size:]
-    while current_batch:
+    if hasattr(iterable, '__getitem__') and hasattr(iterable, '__len__'):
+        for i in range(0, len(iterable), batch_size):
+            yield iterable[i:i + batch_size]
+        return
+
+    iterator = iter(iterable)
+    while True:
+        current_batch = list(itertools.islice(iterator, batch_size))
+        if not current_batch:
+            return
         yield current_batch
-        current_batch = not_batched[:batch_size]
-        not_batched = not_batched[batch_size:]
+
+
+def ordered_concurrent_map(func, iterable, max_workers=1):
+    """Calls a function on each item of an iterable in a thread pool, and yields the results in the order of
+    the items. At most ``max_workers`` calls run at once, and at most ``max_workers`` results wait to be consumed,
+    so a long or lazy iterable is not submitted all at once. An exception raised by a call is raised when its
+    result is reached.
+
+    :type func: ``callable``
+    :param func: the function to call with each item.
+
+    :type iterable: ``iterable``
+    :param iterable: the items to call the function with.
+
+    :type max_workers: ``int``
+    :param max_workers: the maximum number of concurrent calls. 1 calls the function in the current thread.
+
+    :rtype: ``iterable``
+    :return:: The results of the calls, in the order of the items.
+    """
+    if max_workers <= 1:
+        for item in iterable:
+            yield func(item)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+    from collections import deque
+
+    items = iter(iterable)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque(executor.submit(func, item) for item in itertools.islice(items, max_workers))
+        while pending:
+            future = pending.popleft()
+            try:
+                result = future.result()
+            except BaseException:
+                for not_started in pending:
+                    not_started.cancel()
+                raise
+            for item in itertools.islice(items, 1):
+                pending.append(executor.submit(func, item))
+            yield result
+
+
+class FeedIndicatorsDelta(object):
+    """
+      Filters the indicators of a feed fetch to the new and changed ones, by the fingerprints of the indicators
+      submitted by the previous fetches. A fingerprint is a pair of 64-bit hashes - one of the indicator value and
+      type, and one of its value, type and fields. The fingerprints are kept as a sorted array in the integration
+      context, and all the indicators are submitted again once every ``full_refresh_interval`` hours, so they do
+      not expire and indicators which were removed from the feed stop being refreshed.
+
+      :type state: ``dict``
+      :param state: The state saved by the previous fetch (see ``to_context``). None for the first fetch.
+
+      :type full_refresh_interval: ``int``
+      :param full_refresh_interval: Hours between fetches which submit all the indicators. 0 always submits them.
+
+      :return: No data returned
+      :rtype: ``None``
+    """
+    def __init__(self, state=None, full_refresh_interval=24):
+        state = state or {}
+        self._previous = self._decode(state.get('fingerprints'))
+        self._current = {}  # type: ignore
+        last_full_submission = state.get('last_full_submission') or 0
+        self.is_full_submission = not state or \
+            time.time() - last_full_submission >= float(full_refresh_interval) * 3600
+        self._last_full_submission = time.time() if self.is_full_submission else last_full_submission
+        self.submitted = 0
+        self.skipped = 0
+
+    @staticmethod
+    def fingerprint(indicator):
+        """
+          Calculates the fingerprint of an indicator.
+
+          :type indicator: ``dict``
+          :param indicator: The indicator object, as sent to ``demisto.createIndicators``.
+
+          :return: The hash of the indicator value and type, and the hash of its value, type and fields.
+          :rtype: ``tuple``
+        """
+        key = json.dumps([indicator.get('value'), indicator.get('type')])
+        record = json.dumps([key, indicator.get('fields')], sort_keys=True, default=str)
+        return (struct.unpack('>Q', hashlib.md5(key.encode('utf-8')).digest()[:8])[0],
+                struct.unpack('>Q', hashlib.md5(record.encode('utf-8')).digest()[:8])[0])
+
+    def filter(self, indicators):
+        """
+          Yields the indicators to submit - all of them in a full submission, and otherwise the new and changed ones.
+
+          :type indicators: ``iterable``
+          :param indicators: The indicator objects of the fetch.
+
+          :return: The indicator objects to submit.
+          :rtype: ``iterable``
+        """
+        for indicator in indicators:
+            key, record = self.fingerprint(indicator)
+            self._current[key] = record
+            if self.is_full_submission or self._previous.get(key) != record:
+                self.submitted += 1
+                yield indicator
+            else:
+                self.skipped += 1
+
+    @property
+    def removed(self):
+        """
+          The number of indicators which were submitted before and were not seen in this fetch.
+
+          :return: The number of removed indicators.
+          :rtype: ``int``
+        """
+        return sum(1 for key in self._previous if key not in self._current)
+
+    def to_context(self):
+        """
+          The state to save in the integration context, to be used by the next fetch.
+
+          :return: The fingerprints of the submitted indicators and the time of the last full submission.
+          :rtype: ``dict``
+        """
+        fingerprints = self._current
+        if not self.is_full_submission:
+            # indicators which were not seen were not submitted either, they are kept until the next full submission
+            fingerprints = dict(self._previous)
+            fingerprints.update(self._current)
+        return {
+            'fingerprints': self._encode(fingerprints),
+            'last_full_submission': self._last_full_submission
+        }
+
+    @staticmethod
+    def _encode(fingerprints):
+        flat = [number for key in sorted(fingerprints) for number in (key, fingerprints[key])]
+        return base64.b64encode(struct.pack('>%dQ' % len(flat), *flat)).decode('ascii')
+
+    @staticmethod
+    def _decode(encoded):
+        if not encoded:
+            return {}
+        raw = base64.b64decode(encoded)
+        flat = struct.unpack('>%dQ' % (len(raw) // 8), raw)
+        return dict(zip(flat[::2], flat[1::2]))
+
+
+FEED_INDICATORS_DELTA_CONTEXT_KEY = 'feed_indicators_delta'
+
+
+def get_indicators_delta(params):
+    """
+      Gets the fingerprints of the indicators submitted by the previous fetches of a feed, if delta submission is
+      used (the ``delta_submission`` and ``delta_full_refresh_interval`` integration parameters).
+
+      :type params: ``dict``
+      :param params: The integration parameters.
+
+      :return: The delta of this fetch, or None if all the indicators are submitted.
+      :rtype: ``FeedIndicatorsDelta``
+    """
+    if not argToBoolean(params.get('delta_submission', False)):
+        return None
+    return FeedIndicatorsDelta(get_integration_context().get(FEED_INDICATORS_DELTA_CONTEXT_KEY),
+                               full_refresh_interval=int(params.get('delta_full_refresh_interval') or 24))
+
+
+def save_indicators_delta(delta):
+    """
+      Saves the fingerprints of the submitted indicators in the integration context, to be used by the next fetch.
+
+      :type delta: ``FeedIndicatorsDelta``
+      :param delta: The delta of this fetch.
+
+      :return: No data returned
+      :rtype: ``None``
+    """
+    demisto.debug('Submitted {} indicators, skipped {} unchanged indicators, {} indicators were removed from the '
+                  'feed'.format(delta.submitted, delta.skipped, delta.removed))
+    integration_context = get_integration_context()
+    integration_context[FEED_INDICATORS_DELTA_CONTEXT_KEY] = delta.to_context()
+    set_integration_context(integration_context)
+
+
+FEED_FETCH_STATE_CONTEXT_KEY = 'feed_fetch_state'
+# the size of a spooled feed response which is kept in memory, larger responses are written to a temporary file
+FEED_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+FEED_SPOOL_CHUNK_SIZE = 1024 * 1024
+
+
+def build_feed_session(max_concurrency=1):
+    """
+      Builds the session shared by the requests to all the URLs of a feed, with a connection pool large enough for
+      the concurrent requests. Like ``requests.get``, the session honours the proxy environment variables.
+
+      :type max_concurrency: ``int``
+      :param max_concurrency: The maximal number of concurrent requests.
+
+      :return: The session.
+      :rtype: ``requests.Session``
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=max(max_concurrency, DEFAULT_POOLSIZE))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def spool_response(response, max_size=FEED_SPOOL_MAX_SIZE):
+    """
+      Downloads the body of a streamed response to a spooled temporary file, which is kept in memory up to
+      ``max_size`` bytes and written to disk beyond it. The response then reads its body from the file, so
+      ``iter_content`` and ``iter_lines`` work as before. It lets worker threads download the feed URLs concurrently
+      while the feed URLs before them are parsed, and the body is hashed while it is downloaded, so a feed URL
+      whose server does not support conditional requests is skipped before it is parsed if it did not change.
+
+      :type response: ``requests.Response``
+      :param response: The streamed response.
+
+      :type max_size: ``int``
+      :param max_size: The size of the body which is kept in memory.
+
+      :return: The sha256 of the body.
+      :rtype: ``str``
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=max_size)
+    content_hash = hashlib.sha256()
+    for chunk in response.iter_content(chunk_size=FEED_SPOOL_CHUNK_SIZE):
+        content_hash.update(chunk)
+        spooled.write(chunk)
+    spooled.seek(0)
+    # the body was decoded while it was downloaded, and it is read again from the file
+    response.raw = spooled
+    response._content_consumed = False
+    return content_hash.hexdigest()
+
+
+def conditional_request_headers(state):
+    """
+      Gets the headers of a conditional request for a feed URL.
+
+      :type state: ``dict``
+      :param state: The state of the feed URL in the last fetch (see ``response_fetch_state``).
+
+      :return: The If-None-Match and If-Modified-Since headers.
+      :rtype: ``dict``
+    """
+    headers = {}
+    if state.get('etag'):
+        headers['If-None-Match'] = state['etag']
+    if state.get('last_modified'):
+        headers['If-Modified-Since'] = state['last_modified']
+    return headers
+
+
+def response_fetch_state(response, content=None):
+    """
+      Gets the state of a feed URL to use in the next conditional fetch. The content is hashed only when it is
+      given, so a streamed response is not downloaded to be hashed (see ``spool_response``).
+
+      :type response: ``requests.Response``
+      :param response: The response of the feed URL.
+
+      :type content: ``bytes``
+      :param content: The content of the response, if it was already read.
+
+      :return: The ETag, Last-Modified and content hash of the response.
+      :rtype: ``dict``
+    """
+    return {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'hash': hashlib.sha256(content).hexdigest() if content is not None else None
+    }
+
+
+def get_fetch_state():
+    """
+      Gets the state of the last fetch of a feed from the integration context.
+
+      :return: The state of each feed URL.
+      :rtype: ``dict``
+    """
+    return get_integration_context().get(FEED_FETCH_STATE_CONTEXT_KEY) or {}
+
+
+def save_fetch_state(fetch_state):
+    """
+      Saves the state of a feed fetch in the integration context, to be used by the next conditional fetch.
+
+      :type fetch_state: ``dict``
+      :param fetch_state: The state of each feed URL.
+
+      :return: No data returned
+      :rtype: ``None``
+    """
+    integration_context = get_integration_context()
+    integration_context[FEED_FETCH_STATE_CONTEXT_KEY] = fetch_state
+    set_integration_context(integration_context)
 
 
 def dict_safe_get(dict_object, keys, default_return_value=None, return_type=None, raise_return_type=True):
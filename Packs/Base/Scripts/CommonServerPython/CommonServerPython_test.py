@@ -15,7 +15,8 @@ from CommonServerPython import xml2json, json2xml, entryTypes, formats, tableToM
     IntegrationLogger, parse_date_string, IS_PY3, DebugLogger, b64_encode, parse_date_range, return_outputs, \
     argToBoolean, ipv4Regex, ipv4cidrRegex, ipv6cidrRegex, ipv6Regex, batch, FeedIndicatorType, \
     encode_string_results, safe_load_json, remove_empty_elements, aws_table_to_markdown, is_demisto_version_ge, \
-    appendContext, auto_detect_indicator_type, handle_proxy, get_demisto_version_as_str, get_x_content_info_headers
+    appendContext, auto_detect_indicator_type, handle_proxy, get_demisto_version_as_str, get_x_content_info_headers, \
+    IndicatorTypeClassifier, ordered_concurrent_map, xml2dict, iter_xml2dict
 
 try:
     from StringIO import StringIO
@@ -65,6 +66,48 @@ def test_xml():
     assert xmlActual == xml, "expected:\n{}\nto equal:\n{}".format(xml, xmlActual)
 
 
+XML_LOGS = b'<response status="success"><result><log><logs count="3" progress="100">' \
+           b'<entry logid="1"><src>1.1.1.1</src></entry>' \
+           b'<entry logid="2"><src>2.2.2.2</src><entry>nested</entry></entry>' \
+           b'<entry logid="3"/></logs></log></result></response>'
+
+
+@pytest.mark.parametrize('xml', [
+    XML_LOGS,
+    b'<ns:work xmlns:ns="urn:test"><ns:employee id="1"> foo <ns:name>bar</ns:name></ns:employee>'
+    b'<ns:employee/></ns:work>',
+])
+def test_xml2dict(xml):
+    """
+    Given
+    - An XML document with attributes, namespaces and repeated elements.
+
+    When
+    - Converting it to a dictionary.
+
+    Then
+    - Ensure the dictionary is the same as the JSON which xml2json converts it to.
+    """
+    assert xml2dict(xml) == json.loads(xml2json(xml))
+
+
+@pytest.mark.parametrize('xml', [XML_LOGS, XML_LOGS.decode('utf-8'), StringIO(XML_LOGS.decode('utf-8'))])
+def test_iter_xml2dict(xml):
+    """
+    Given
+    - An XML document with repeated elements, one of which has a nested element with the same tag.
+
+    When
+    - Iterating over the elements at their path.
+
+    Then
+    - Ensure only the elements at the path are returned, each converted as by xml2dict.
+    """
+    entries = list(iter_xml2dict(xml, 'result/log/logs/entry'))
+    assert entries == xml2dict(XML_LOGS)['response']['result']['log']['logs']['entry']
+    assert entries[1] == {'@logid': '2', 'src': '2.2.2.2', 'entry': 'nested'}
+
+
 def toEntry(table):
     return {
 
@@ -2072,6 +2115,179 @@ def test_batch(iterable, sz, expected):
         assert expected[i] == item
 
 
+@pytest.mark.parametrize('iterable, sz, expected', batch_params)
+def test_batch_lazy_iterable(iterable, sz, expected):
+    """
+        Given
+            - A generator over the items to batch.
+
+        When
+        - Batching it.
+
+        Then
+        -  The same batches are yielded as for the list, and the generator is consumed one batch at a time.
+    """
+    consumed = []
+
+    def generate():
+        for item in iterable:
+            consumed.append(item)
+            yield item
+
+    batches = batch(generate(), sz)
+    for i, item in enumerate(batches):
+        assert expected[i] == item
+        assert len(consumed) <= (i + 1) * sz
+    assert len(consumed) == len(iterable)
+
+
+@pytest.mark.parametrize('max_workers', [1, 3])
+def test_ordered_concurrent_map(max_workers):
+    """
+        Given
+            - Calls which finish in reverse order.
+
+        When
+        - Mapping them with ordered_concurrent_map.
+
+        Then
+        -  The results are yielded in the order of the items, with at most max_workers calls running at once.
+    """
+    import threading
+    import time
+    lock = threading.Lock()
+    running = []
+    max_running = []
+
+    def slow_square(x):
+        with lock:
+            running.append(x)
+            max_running.append(len(running))
+        time.sleep(0.01 * (10 - x))
+        with lock:
+            running.remove(x)
+        return x * x
+
+    assert list(ordered_concurrent_map(slow_square, iter(range(10)), max_workers)) == [x * x for x in range(10)]
+    assert max(max_running) <= max_workers
+
+
+def test_ordered_concurrent_map_raises_in_order():
+    """
+        Given
+            - A call which raises an exception.
+
+        When
+        - Mapping the items with ordered_concurrent_map.
+
+        Then
+        -  The results of the previous items are yielded and then the exception is raised.
+    """
+    def func(x):
+        if x == 2:
+            raise ValueError('bad item')
+        return x
+
+    results = []
+    with raises(ValueError, match='bad item'):
+        for result in ordered_concurrent_map(func, range(5), max_workers=2):
+            results.append(result)
+    assert results == [0, 1]
+
+
+def test_feed_indicators_delta(mocker):
+    """
+        Given
+            - The fingerprints saved by a full submission of 3 indicators.
+
+        When
+        - Fetching the feed again, with one indicator changed, one removed and one added, and once the full refresh
+          interval has passed.
+
+        Then
+        -  Only the changed and added indicators are submitted, and all of them are submitted on the full refresh.
+    """
+    from CommonServerPython import FeedIndicatorsDelta
+    mocker.patch('CommonServerPython.time.time', return_value=1000000)
+    indicators = [{'value': value, 'type': 'IP', 'fields': {'tags': ['a']}} for value in ('1.1.1.1', '2.2.2.2', '3.3.3.3')]
+    delta = FeedIndicatorsDelta(None, full_refresh_interval=24)
+    assert delta.is_full_submission
+    assert list(delta.filter(indicators)) == indicators
+    state = delta.to_context()
+
+    changed = {'value': '2.2.2.2', 'type': 'IP', 'fields': {'tags': ['b']}}
+    added = {'value': '4.4.4.4', 'type': 'IP', 'fields': {}}
+    delta = FeedIndicatorsDelta(state, full_refresh_interval=24)
+    assert not delta.is_full_submission
+    assert list(delta.filter([indicators[0], changed, added])) == [changed, added]
+    assert (delta.submitted, delta.skipped, delta.removed) == (2, 1, 1)
+    state = delta.to_context()
+    assert state['last_full_submission'] == 1000000
+
+    # the removed indicator is kept until the next full submission
+    delta = FeedIndicatorsDelta(state, full_refresh_interval=24)
+    assert list(delta.filter([indicators[2]])) == []
+
+    mocker.patch('CommonServerPython.time.time', return_value=1000000 + 24 * 3600)
+    delta = FeedIndicatorsDelta(state, full_refresh_interval=24)
+    assert delta.is_full_submission
+    assert list(delta.filter([indicators[0], changed])) == [indicators[0], changed]
+    assert len(FeedIndicatorsDelta._decode(delta.to_context()['fingerprints'])) == 2
+
+
+def test_spool_response():
+    """
+        Given
+            - A streamed response whose body is larger than the size which is kept in memory.
+
+        When
+        - Spooling the response.
+
+        Then
+        -  The body is hashed and written to disk, and the response reads the same lines from it.
+    """
+    import io
+    import hashlib
+    from CommonServerPython import spool_response
+    body = b'\n'.join(b'%d.example.com' % i for i in range(1000))
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = io.BytesIO(body)
+
+    content_hash = spool_response(response, max_size=100)
+
+    assert content_hash == hashlib.sha256(body).hexdigest()
+    assert response.raw._rolled
+    assert b'\n'.join(response.iter_lines()) == body
+
+
+def test_feed_fetch_state(mocker):
+    """
+        Given
+            - A streamed feed response with an ETag, and a feed response whose content was read.
+
+        When
+        - Saving their fetch state, and building the headers of the next conditional requests.
+
+        Then
+        -  Only the read content is hashed, and the next requests send If-None-Match and If-Modified-Since.
+    """
+    from CommonServerPython import response_fetch_state, save_fetch_state, get_fetch_state, \
+        conditional_request_headers
+    integration_context = {}
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    streamed = mocker.Mock(headers={'ETag': '"v1"'})
+    read = mocker.Mock(headers={'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+    save_fetch_state({'streamed': response_fetch_state(streamed), 'read': response_fetch_state(read, b'1.1.1.1')})
+
+    fetch_state = get_fetch_state()
+    assert fetch_state['streamed'] == {'etag': '"v1"', 'last_modified': None, 'hash': None}
+    assert fetch_state['read']['hash']
+    assert conditional_request_headers(fetch_state['streamed']) == {'If-None-Match': '"v1"'}
+    assert conditional_request_headers(fetch_state['read']) == {'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+
+
 regexes_test = [
     (ipv4Regex, '192.168.1.1', True),
     (ipv4Regex, '192.168.1.1/24', False),
@@ -2301,6 +2517,99 @@ def test_auto_detect_indicator_type(indicator_value, indicatory_type):
                              " use a docker image with it installed such as: demisto/jmespath"
 
 
+def _tldextract_available():
+    try:
+        import tldextract  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+@pytest.mark.skipif(not _tldextract_available(), reason='tldextract is not installed')
+def test_indicator_type_classifier_matches_auto_detect():
+    """
+        Given
+            - Indicator values of all supported types.
+
+        When
+        - Classifying them in bulk with an IndicatorTypeClassifier, with and without a cache.
+
+        Then
+        -  The detected types are identical to auto_detect_indicator_type.
+    """
+    values = [value for value, _ in INDICATOR_VALUE_AND_TYPE]
+    expected = [auto_detect_indicator_type(value) for value in values]
+    assert IndicatorTypeClassifier().classify_many(values) == expected
+    assert IndicatorTypeClassifier(cache_size=5).classify_many(values + values) == expected + expected
+
+
+@pytest.mark.skipif(not _tldextract_available(), reason='tldextract is not installed')
+def test_indicator_type_classifier_lru_cache():
+    """
+        Given
+            - An IndicatorTypeClassifier with a cache of 2 values.
+
+        When
+        - Classifying values which are repeated and values which were evicted.
+
+        Then
+        -  Hits and misses are counted and the cache never holds more than 2 values.
+    """
+    classifier = IndicatorTypeClassifier(cache_size=2)
+    classifier.classify_many(['1.1.1.1', 'joe@gmail.com', '1.1.1.1', 'CVE-0000-0000', 'joe@gmail.com'])
+    assert classifier.cache_hits == 1
+    assert classifier.cache_misses == 4
+    assert list(classifier._cache.keys()) == ['CVE-0000-0000', 'joe@gmail.com']
+    classifier.clear_cache()
+    assert classifier.cache_hits == classifier.cache_misses == 0
+    assert not classifier._cache
+
+
+@pytest.mark.skipif(not os.getenv('CONTENT_BENCHMARK'), reason='benchmark - set CONTENT_BENCHMARK to run')
+def test_indicator_type_classifier_benchmark(capfd):
+    """
+    Times classifying 1M mixed indicators (CONTENT_BENCHMARK_SIZE to override) with a single
+    IndicatorTypeClassifier versus the former per-call implementation.
+    """
+    import random
+    import time
+    import tldextract
+    from CommonServerPython import sha256Regex, urlRegex, md5Regex, sha1Regex, emailRegex, cveRegex, sha512Regex
+
+    legacy_patterns = [ipv4cidrRegex, ipv6cidrRegex, ipv4Regex, ipv6Regex, sha256Regex, urlRegex, md5Regex, sha1Regex,
+                       emailRegex, cveRegex, sha512Regex]
+
+    def legacy_auto_detect_indicator_type(indicator_value):
+        for pattern in legacy_patterns:
+            if re.match(pattern, indicator_value):
+                return pattern
+        return tldextract.TLDExtract(cache_file=False, suffix_list_urls=None)(indicator_value).suffix
+
+    size = int(os.getenv('CONTENT_BENCHMARK_SIZE', 1000000))
+    pool = [value for value, _ in INDICATOR_VALUE_AND_TYPE] + ['{}.{}.{}.{}'.format(*random.sample(range(256), 4))
+                                                               for _ in range(1000)] + \
+        ['host{}.example.com'.format(i) for i in range(1000)]
+    values = [random.choice(pool) for _ in range(size)]
+    legacy_sample = values[:max(size // 100, 1)]
+
+    start = time.time()
+    for value in legacy_sample:
+        legacy_auto_detect_indicator_type(value)
+    legacy_rate = len(legacy_sample) / (time.time() - start)
+
+    start = time.time()
+    IndicatorTypeClassifier().classify_many(values)
+    classifier_rate = size / (time.time() - start)
+
+    start = time.time()
+    IndicatorTypeClassifier(cache_size=4096).classify_many(values)
+    cached_rate = size / (time.time() - start)
+
+    with capfd.disabled():
+        print('\nlegacy: {:.0f}/s, classifier: {:.0f}/s, classifier with cache: {:.0f}/s'.format(
+            legacy_rate, classifier_rate, cached_rate))
+
+
 def test_handle_proxy(mocker):
     os.environ['REQUESTS_CA_BUNDLE'] = '/test1.pem'
     mocker.patch.object(demisto, 'params', return_value={'insecure': True})
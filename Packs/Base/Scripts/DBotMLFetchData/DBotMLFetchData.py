@@ -1,3 +1,7 @@
+import multiprocessing
+import multiprocessing.connection
+import os
+import tempfile
 import uuid
 from itertools import combinations
 
@@ -14,7 +18,6 @@ import string
 from bs4 import BeautifulSoup
 from collections import Counter
 import pandas as pd
-import signal
 import numpy as np
 import zlib
 from base64 import b64encode
@@ -53,9 +56,11 @@ DOMAIN_TO_RANK_PATH = '/var/domain_to_rank.p'
 WORD_TO_NGRAM_PATH = '/var/word_to_ngram.p'
 WORD_TO_REGEX_PATH = '/var/word_to_regex.p'
 
-EMBEDDING_DICT_GLOVE_50 = None
-EMBEDDING_DICT_GLOVE_100 = None
-EMBEDDING_DICT_FASTTEXT = None
+EMBEDDINGS_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'dbot_ml_fetch_data')
+
+EMBEDDING_GLOVE_50 = None
+EMBEDDING_GLOVE_100 = None
+EMBEDDING_FASTTEXT = None
 DOMAIN_TO_RANK = None
 WORD_TO_REGEX = None
 WORD_TO_NGRAMS = None
@@ -67,6 +72,8 @@ MAX_INCIDENTS_TO_FETCH_FIRST_EXECUTION = 3000
 FROM_DATA_FIRST_EXECUTION = FROM_DATA_PERIODIC_EXECUTION = '30 days ago'
 DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
 FIRST_EXECUTION_ARGUMENTS = {'limit': MAX_INCIDENTS_TO_FETCH_FIRST_EXECUTION, 'fromDate': FROM_DATA_FIRST_EXECUTION}
+INCIDENT_TIMEOUT_SECONDS = 5
+TASK_DONE, TASK_SHORT_TEXT, TASK_ERROR, TASK_TIMEOUT = 'done', 'short_text', 'error', 'timeout'
 
 IMG_FORMATS = ['.jpeg', '.gif', '.bmp', '.png', '.jfif', '.tiff', '.eps', '.indd', '.jpg']
 
@@ -75,24 +82,6 @@ ENVELOP_FROM_REGEX = r'(?<=envelope-from )<?[a-zA-Z0-9@_\.\+\-]+>?'
 
 IP_DOMAIN_TOKEN = 'IP_DOMAIN'
 
-'''
-Define time out functionality
-'''
-
-
-class TimeoutException(Exception):  # Custom exception class
-    pass
-
-
-def timeout_handler(signum, frame):  # Custom signal handler
-    if signum or frame:
-        pass
-    raise TimeoutException
-
-
-# Change the behavior of SIGALRM
-signal.signal(signal.SIGALRM, timeout_handler)
-
 
 class ShortTextException(Exception):
     pass
@@ -289,15 +278,46 @@ def get_html_features(soup):
     return html_counter
 
 
+def load_embedding(path):
+    """
+    Loads a pickled word to vector dictionary as a word to row index and a matrix of the vectors.
+    On the first load the matrix and the words are cached as .npy files in EMBEDDINGS_CACHE_DIR, so later loads memory
+    map the matrix instead of unpickling the dictionary, and the processes which use it share its pages.
+    """
+    try:
+        stat = os.stat(path)
+        cache_path = os.path.join(EMBEDDINGS_CACHE_DIR, '{}_{}_{}'.format(os.path.basename(path), stat.st_size,
+                                                                          int(stat.st_mtime)))
+    except OSError:
+        cache_path = None
+    if cache_path and os.path.exists(cache_path + '.npy') and os.path.exists(cache_path + '.words.npy'):
+        words = np.load(cache_path + '.words.npy').tolist()
+        matrix = np.load(cache_path + '.npy', mmap_mode='r')
+        return {w: i for i, w in enumerate(words)}, matrix
+
+    with open(path, 'rb') as file:
+        embedding_dict = pickle.load(file)
+    words = list(embedding_dict)
+    matrix = np.asarray([embedding_dict[w] for w in words])
+    if cache_path:
+        try:
+            os.makedirs(EMBEDDINGS_CACHE_DIR, exist_ok=True)
+            # write to temporary files and rename, so a concurrent load never maps a partial file
+            suffix = '.{}.tmp.npy'.format(os.getpid())
+            np.save(cache_path + '.words' + suffix, np.asarray(words))
+            np.save(cache_path + suffix, matrix)
+            os.replace(cache_path + '.words' + suffix, cache_path + '.words.npy')
+            os.replace(cache_path + suffix, cache_path + '.npy')
+        except OSError as e:
+            demisto.debug('Could not cache the embedding {}: {}'.format(path, str(e)))
+    return {w: i for i, w in enumerate(words)}, matrix
+
+
 def load_external_resources():
-    global EMBEDDING_DICT_GLOVE_50, EMBEDDING_DICT_GLOVE_50, EMBEDDING_DICT_GLOVE_100, EMBEDDING_DICT_FASTTEXT, \
-        DOMAIN_TO_RANK, DOMAIN_TO_RANK_PATH, WORD_TO_NGRAMS, WORD_TO_REGEX
-    with open(GLOVE_50_PATH, 'rb') as file:
-        EMBEDDING_DICT_GLOVE_50 = pickle.load(file)
-    with open(GLOVE_100_PATH, 'rb') as file:
-        EMBEDDING_DICT_GLOVE_100 = pickle.load(file)
-    with open(FASTTEXT_PATH, 'rb') as file:
-        EMBEDDING_DICT_FASTTEXT = pickle.load(file)
+    global EMBEDDING_GLOVE_50, EMBEDDING_GLOVE_100, EMBEDDING_FASTTEXT, DOMAIN_TO_RANK, WORD_TO_NGRAMS, WORD_TO_REGEX
+    EMBEDDING_GLOVE_50 = load_embedding(GLOVE_50_PATH)
+    EMBEDDING_GLOVE_100 = load_embedding(GLOVE_100_PATH)
+    EMBEDDING_FASTTEXT = load_embedding(FASTTEXT_PATH)
     with open(DOMAIN_TO_RANK_PATH, 'rb') as file:
         DOMAIN_TO_RANK = pickle.load(file)
     with open(WORD_TO_NGRAM_PATH, 'rb') as file:
@@ -306,20 +326,22 @@ def load_external_resources():
         WORD_TO_REGEX = pickle.load(file)
 
 
-def get_avg_embedding_vector_for_text(tokenized_text, embedding_dict, size, prefix):
-    vectors = [embedding_dict[w] for w in tokenized_text if w in embedding_dict]
-    if len(vectors) == 0:
+def get_avg_embedding_vector_for_text(tokenized_text, embedding, size, prefix):
+    word_to_index, matrix = embedding
+    indices = np.fromiter((word_to_index.get(w, -1) for w in tokenized_text), dtype=np.int64, count=len(tokenized_text))
+    indices = indices[indices >= 0]
+    if len(indices) == 0:
         mean_vector = np.zeros(size)
     else:
-        mean_vector = np.mean(vectors, axis=0)
-    res = {'{}_{}'.format(prefix, str(i)): mean_vector[i].item() for i in range(len(mean_vector))}
+        mean_vector = matrix[indices].mean(axis=0)
+    res = {'{}_{}'.format(prefix, i): value for i, value in enumerate(mean_vector.tolist())}
     return res
 
 
 def get_embedding_features(tokenized_text):
-    res_glove_50 = get_avg_embedding_vector_for_text(tokenized_text, EMBEDDING_DICT_GLOVE_50, 50, 'glove50')
-    res_glove_100 = get_avg_embedding_vector_for_text(tokenized_text, EMBEDDING_DICT_GLOVE_100, 100, 'glove100')
-    res_fasttext = get_avg_embedding_vector_for_text(tokenized_text, EMBEDDING_DICT_FASTTEXT, 300, 'fasttext')
+    res_glove_50 = get_avg_embedding_vector_for_text(tokenized_text, EMBEDDING_GLOVE_50, 50, 'glove50')
+    res_glove_100 = get_avg_embedding_vector_for_text(tokenized_text, EMBEDDING_GLOVE_100, 100, 'glove100')
+    res_fasttext = get_avg_embedding_vector_for_text(tokenized_text, EMBEDDING_FASTTEXT, 300, 'fasttext')
     return {**res_glove_50, **res_glove_100, **res_fasttext}
 
 
@@ -585,36 +607,108 @@ def extract_features_from_incident(row, label_fields):
     return res
 
 
-def extract_features_from_all_incidents(incidents_df, label_fields):
-    X = []
-    exceptions_log = []
-    exception_indices = set()
-    timeout_indices = set()
-    short_text_indices = set()
-    durations = []
-    for index, row in incidents_df.iterrows():
-        signal.alarm(5)
+def extract_features_worker(connection, label_fields):
+    """
+    Extracts the features of the incidents received from the connection until it is closed, and sends back the
+    status, the features (or the traceback) and the duration of each.
+    """
+    while True:
+        try:
+            row = connection.recv()
+        except EOFError:
+            break
         try:
             start = time.time()
             X_i = extract_features_from_incident(row, label_fields)
             end = time.time()
-            X.append(X_i)
-            durations.append(end - start)
-        except TimeoutException:
-            timeout_indices.add(index)
+            connection.send((TASK_DONE, X_i, end - start))
         except ShortTextException:
-            short_text_indices.add(index)
+            connection.send((TASK_SHORT_TEXT, None, None))
         except Exception:
-            exception_indices.add(index)
-            exceptions_log.append(traceback.format_exc())
-            if len(exception_indices) == MAX_ALLOWED_EXCEPTIONS:
-                break
-        finally:
-            signal.alarm(0)
+            connection.send((TASK_ERROR, traceback.format_exc(), None))
+
+
+def extract_features_from_all_incidents(incidents_df, label_fields, max_workers=None):
+    """
+    Extracts the features of the incidents in max_workers (the number of CPUs by default) forked processes, which
+    share the loaded resources. An incident is sent to a worker only when it is idle, and a worker which takes more
+    than INCIDENT_TIMEOUT_SECONDS on an incident is killed and replaced.
+    The results are handled in the order of the incidents, as if they were extracted one by one.
+    """
+    X = []
+    exceptions_log = []
+    exception_indices = set()
+    timeout_indices = set()
+    short_text_indices = set()
+    durations = []
+    rows = [row for _, row in incidents_df.iterrows()]
+    context = multiprocessing.get_context('fork')
+
+    def start_worker():
+        connection, worker_connection = context.Pipe()
+        worker = context.Process(target=extract_features_worker, args=(worker_connection, label_fields), daemon=True)
+        worker.start()
+        worker_connection.close()
+        return worker, connection
+
+    def stop_worker(worker, connection):
+        # the worker is joined so it does not stay as a zombie, and the parent's end of its pipe is closed
+        worker.kill()
+        worker.join()
+        connection.close()
+
+    idle = [start_worker() for _ in range(min(max_workers or os.cpu_count() or 1, len(rows)))]
+    running = {}  # type: ignore
+    outcomes = {}  # type: ignore
+    next_to_send = next_to_handle = 0
+    try:
+        while next_to_handle < len(rows):
+            while idle and next_to_send < len(rows):
+                worker, connection = idle.pop()
+                connection.send(rows[next_to_send])
+                running[connection] = (worker, next_to_send, time.time())
+                next_to_send += 1
+            for connection in multiprocessing.connection.wait(list(running), timeout=0.1):
+                worker, task_id, _ = running.pop(connection)
+                try:
+                    outcomes[task_id] = connection.recv()
+                    idle.append((worker, connection))
+                except EOFError:
+                    stop_worker(worker, connection)
+                    outcomes[task_id] = (TASK_ERROR, 'The worker process exited unexpectedly', None)
+                    idle.append(start_worker())
+            now = time.time()
+            for connection, (worker, task_id, started) in list(running.items()):
+                if now - started > INCIDENT_TIMEOUT_SECONDS:
+                    stop_worker(worker, connection)
+                    del running[connection]
+                    outcomes[task_id] = (TASK_TIMEOUT, None, None)
+                    idle.append(start_worker())
+
+            while next_to_handle in outcomes:
+                index = incidents_df.index[next_to_handle]
+                status, value, duration = outcomes.pop(next_to_handle)
+                next_to_handle += 1
+                if status == TASK_DONE:
+                    X.append(value)
+                    durations.append(duration)
+                elif status == TASK_SHORT_TEXT:
+                    short_text_indices.add(index)
+                elif status == TASK_TIMEOUT:
+                    timeout_indices.add(index)
+                else:
+                    exception_indices.add(index)
+                    exceptions_log.append(value)
+                    if len(exception_indices) == MAX_ALLOWED_EXCEPTIONS:
+                        next_to_handle = len(rows)
+                        break
+    finally:
+        for worker, connection in idle + [(worker, connection) for connection, (worker, _, _) in running.items()]:
+            stop_worker(worker, connection)
     return X, Counter(exceptions_log).most_common(), short_text_indices, exception_indices, timeout_indices, durations
 
 
-def extract_data_from_incidents(incidents, input_label_field=None):
+def extract_data_from_incidents(incidents, input_label_field=None, max_workers=None):
     incidents_df = pd.DataFrame(incidents)
     if 'created' in incidents_df:
         incidents_df['created'] = incidents_df['created'].apply(lambda x: dateutil.parser.parse(x))  # type: ignore
@@ -661,7 +755,7 @@ def extract_data_from_incidents(incidents, input_label_field=None):
     else:
         load_external_resources()
         X, exceptions_log, short_text_indices, exception_indices, timeout_indices, durations \
-            = extract_features_from_all_incidents(incidents_df, label_fields)
+            = extract_features_from_all_incidents(incidents_df, label_fields, max_workers)
 
     return {'X': X,
             'n_fetched_incidents': len(X),
@@ -759,7 +853,8 @@ def main():
         demisto.results('No results were found')
     else:
         tag_field = demisto.args().get('tagField', None)
-        data = extract_data_from_incidents(incidents, tag_field)
+        max_workers = int(demisto.args()['maxWorkers']) if demisto.args().get('maxWorkers') else None
+        data = extract_data_from_incidents(incidents, tag_field, max_workers)
         data_str = json.dumps(data)
         compress = demisto.args().get('compress', 'True') == 'True'
         if compress:
@@ -6,6 +6,13 @@ import string
 from bs4 import BeautifulSoup
 import math
 import pandas as pd
+import pytest
+import DBotMLFetchData
+
+
+@pytest.fixture(autouse=True)
+def embeddings_cache_dir(mocker, tmp_path):
+    mocker.patch.object(DBotMLFetchData, 'EMBEDDINGS_CACHE_DIR', str(tmp_path / 'cache'))
 
 
 def test_find_label_fields_candidates():
@@ -39,6 +46,103 @@ def test_get_ml_features(mocker):
     assert featurs['glove50_1'] == -0.5
 
 
+def test_load_embedding_memory_maps_cached_matrix(tmp_path):
+    """
+    Given
+    - A pickled word to vector dictionary.
+
+    When
+    - Loading it twice.
+
+    Then
+    - Ensure the vectors are loaded to the same rows, and the second load memory maps the cached matrix.
+    """
+    embedding_dict = {'hello': np.array([1.0, 0], dtype=np.float32), 'world': np.array([2.0, -1.0], dtype=np.float32)}
+    path = str(tmp_path / 'embedding.p')
+    with open(path, 'wb') as file:
+        pickle.dump(embedding_dict, file)
+
+    for _ in range(2):
+        word_to_index, matrix = load_embedding(path)
+        assert matrix.dtype == np.float32
+        for word, vector in embedding_dict.items():
+            assert (matrix[word_to_index[word]] == vector).all()
+    assert isinstance(matrix, np.memmap)
+
+
+def test_extract_features_from_all_incidents(mocker):
+    """
+    Given
+    - Incidents, where one of them is short, one fails and one hangs.
+
+    When
+    - Extracting their features in two worker processes.
+
+    Then
+    - Ensure the features are returned in the order of the incidents, and the hanging incident is timed out.
+    """
+    def extract_features_from_incident(row, label_fields):
+        if row['emailbody'] == 'hang':
+            time.sleep(60)
+        if row['emailbody'] == 'short':
+            raise ShortTextException()
+        if row['emailbody'] == 'fail':
+            raise ValueError('failed')
+        return {'id': row['emailbody']}
+
+    mocker.patch.object(DBotMLFetchData, 'extract_features_from_incident', side_effect=extract_features_from_incident)
+    mocker.patch.object(DBotMLFetchData, 'INCIDENT_TIMEOUT_SECONDS', 1)
+    incidents_df = pd.DataFrame([{'emailbody': body} for body in ['1', 'hang', '2', 'short', '3', 'fail', '4']])
+
+    X, exceptions, short_text_indices, exception_indices, timeout_indices, durations = \
+        extract_features_from_all_incidents(incidents_df, [], max_workers=2)
+
+    assert [x['id'] for x in X] == ['1', '2', '3', '4']
+    assert len(durations) == 4
+    assert short_text_indices == {3}
+    assert exception_indices == {5}
+    assert 'failed' in exceptions[0][0]
+    assert timeout_indices == {1}
+
+
+def test_extract_features_from_all_incidents_joins_stopped_workers(mocker):
+    """
+    Given
+    - Incidents, where the worker of one of them exits and the worker of another one hangs.
+
+    When
+    - Extracting their features in two worker processes.
+
+    Then
+    - Ensure every started worker, including the ones which exited or were killed, is joined.
+    """
+    from multiprocessing.process import BaseProcess
+
+    def extract_features_from_incident(row, label_fields):
+        if row['emailbody'] == 'hang':
+            time.sleep(60)
+        if row['emailbody'] == 'exit':
+            os._exit(1)
+        return {'id': row['emailbody']}
+
+    mocker.patch.object(DBotMLFetchData, 'extract_features_from_incident', side_effect=extract_features_from_incident)
+    mocker.patch.object(DBotMLFetchData, 'INCIDENT_TIMEOUT_SECONDS', 1)
+    start = mocker.spy(BaseProcess, 'start')
+    join = mocker.spy(BaseProcess, 'join')
+    incidents_df = pd.DataFrame([{'emailbody': body} for body in ['1', 'hang', 'exit', '2']])
+
+    X, _, _, exception_indices, timeout_indices, _ = extract_features_from_all_incidents(incidents_df, [],
+                                                                                         max_workers=2)
+
+    assert [x['id'] for x in X] == ['1', '2']
+    assert exception_indices == {2}
+    assert timeout_indices == {1}
+    assert start.call_count == 4
+    workers = [call[0][0] for call in start.call_args_list]
+    assert {id(call[0][0]) for call in join.call_args_list} >= {id(worker) for worker in workers}
+    assert all(worker.exitcode is not None for worker in workers)
+
+
 def test_get_ngrams_features(mocker):
     mocker.patch('DBotMLFetchData.open', mock_read_func)
     load_external_resources()
@@ -205,6 +205,7 @@ class Tokenizer:
 DBOT_TEXT_FIELD = 'dbot_text'
 DBOT_PROCESSED_TEXT_FIELD = 'dbot_processed_text'
 CONTEXT_KEY = 'DBotPreProcessTextData'
+DEDUP_MAX_BLOCK_ELEMENTS = 10 ** 7
 HTML_PATTERNS = [
     re.compile(r"(?is)<(script|style).*?>.*?(</\1>)"),
     re.compile(r"(?s)<!--(.*?)-->[\n]?"),
@@ -332,20 +333,21 @@ def remove_short_text(data, text_field, target_text_field, remove_short_threshol
     return data, description
 
 
-def get_tf_idf_similarity_arr(documents):
-    tfidf = TfidfVectorizer(stop_words="english", min_df=1).fit_transform(documents)
-    pairwise_similarity = tfidf * tfidf.T
-    return pairwise_similarity.toarray()
-
-
-def find_duplicate_indices(texts, dedup_threshold):
-    similarity_arr = get_tf_idf_similarity_arr(texts)
-    indices_to_remove = []
-    for i in range(similarity_arr.shape[0]):
-        for j in range(similarity_arr.shape[1]):
-            if j > i and similarity_arr[i][j] > dedup_threshold:
-                indices_to_remove.append(j)
-    return set(indices_to_remove)
+def find_duplicate_indices(texts, dedup_threshold, max_block_elements=DEDUP_MAX_BLOCK_ELEMENTS):
+    """
+    Finds the indices of texts which are similar to an earlier text, by the cosine similarity of their TF-IDF vectors.
+    The similarity is computed with sparse products of blocks of rows against the rows which follow them, so the
+    memory is bounded by max_block_elements similarities instead of the whole dense n*n matrix.
+    """
+    tfidf = TfidfVectorizer(stop_words="english", min_df=1).fit_transform(texts).tocsr()
+    block_size = max(1, max_block_elements // max(1, tfidf.shape[0]))
+    indices_to_remove = set()  # type: ignore
+    for start in range(0, tfidf.shape[0], block_size):
+        block_similarity = (tfidf[start:start + block_size] * tfidf[start:].T).tocoo()
+        # keep the pairs where the column text comes after the row text
+        mask = (block_similarity.col > block_similarity.row) & (block_similarity.data > dedup_threshold)
+        indices_to_remove.update((block_similarity.col[mask] + start).tolist())
+    return indices_to_remove
 
 
 def remove_duplicate_by_indices(data, duplicate_indices):
@@ -1,9 +1,14 @@
+import os
+import random
 import unittest
 
+import pytest
+
 from CommonServerPython import *
 from DBotPreprocessTextData import clean_html, remove_line_breaks, hash_word, \
     concat_text_fields, whitelist_dict_fields, remove_short_text, remove_duplicate_by_indices, pre_process_batch, main, \
-    read_file, Tokenizer
+    read_file, Tokenizer, find_duplicate_indices
+from sklearn.feature_extraction.text import TfidfVectorizer
 import string
 
 from copy import deepcopy
@@ -124,6 +129,76 @@ def test_remove_dups():
     assert len(data) == 2
 
 
+def generate_corpus(size, seed=0, vocabulary_size=5000, duplicates_ratio=0.2):
+    """
+    Generates random texts, where some are near duplicates of an earlier text with a few words replaced.
+    """
+    rand = random.Random(seed)
+    vocabulary = ['word%d' % i for i in range(vocabulary_size)]
+    texts = []  # type: ignore
+    for _ in range(size):
+        if texts and rand.random() < duplicates_ratio:
+            words = rand.choice(texts).split()
+            for _ in range(rand.randint(0, 3)):
+                words[rand.randrange(len(words))] = rand.choice(vocabulary)
+        else:
+            words = rand.sample(vocabulary, rand.randint(5, 60))
+        texts.append(' '.join(words))
+    return texts
+
+
+def dense_duplicate_indices(texts, dedup_threshold):
+    tfidf = TfidfVectorizer(stop_words="english", min_df=1).fit_transform(texts)
+    similarity_arr = (tfidf * tfidf.T).toarray()
+    indices_to_remove = []
+    for i in range(similarity_arr.shape[0]):
+        for j in range(similarity_arr.shape[1]):
+            if j > i and similarity_arr[i][j] > dedup_threshold:
+                indices_to_remove.append(j)
+    return set(indices_to_remove)
+
+
+@pytest.mark.parametrize('max_block_elements', [1, 1000, 10 ** 7])
+def test_find_duplicate_indices(max_block_elements):
+    """
+    Given
+    - Texts, some of them near duplicates of earlier texts.
+
+    When
+    - Finding the duplicates in blocks of different sizes.
+
+    Then
+    - Ensure the indices are the same as the ones found with the dense similarity matrix.
+    """
+    texts = generate_corpus(300)
+    for threshold in (0.5, 0.75, 0.99):
+        expected = dense_duplicate_indices(texts, threshold)
+        assert expected
+        assert find_duplicate_indices(texts, threshold, max_block_elements) == expected
+
+
+@pytest.mark.skipif(not os.getenv('CONTENT_BENCHMARK'), reason='benchmark - set CONTENT_BENCHMARK to run')
+def test_find_duplicate_indices_benchmark(capfd):
+    """
+    Measures the time of finding the duplicates in 50K (CONTENT_BENCHMARK_SIZE to override) generated texts.
+    The dense computation used before is measured on the first 2000 texts only.
+    """
+    import time
+
+    size = int(os.getenv('CONTENT_BENCHMARK_SIZE', 50000))
+    texts = generate_corpus(size)
+    legacy_texts = texts[:2000]
+    start = time.time()
+    dense_duplicate_indices(legacy_texts, 0.75)
+    legacy_time = time.time() - start
+    start = time.time()
+    duplicates = find_duplicate_indices(texts, 0.75)
+    blocked_time = time.time() - start
+    with capfd.disabled():
+        print('\nbefore: {:.2f}s ({} texts), after: {:.2f}s ({} texts, {} duplicates)'.format(
+            legacy_time, len(legacy_texts), blocked_time, size, len(duplicates)))
+
+
 def test_pre_process():
     data = [
         {
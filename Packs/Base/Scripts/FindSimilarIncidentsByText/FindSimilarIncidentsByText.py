@@ -1,24 +1,197 @@
 # type: ignore
+import collections
+import hashlib
+import os
+import stat
+import tempfile
+
 import dateutil.parser
+import numpy as np
+from scipy.sparse import csr_matrix
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import linear_kernel
+from sklearn.preprocessing import normalize
 
 from CommonServerPython import *
 
 INCIDENT_TEXT_FIELD = 'incident_text_for_tfidf'
+INDEX_DIR = os.path.join(tempfile.gettempdir(), 'find_similar_incidents_by_text_index')
 
 
 def parse_datetime(datetime_str):
     return dateutil.parser.parse(datetime_str)
 
 
-def get_similar_texts(text, other_texts):
-    vect = TfidfVectorizer(min_df=1, stop_words='english')
-    if type(text) is not list:
-        text = [text]
-    tfidf = vect.fit_transform(text + other_texts)
-    similarity_vector = linear_kernel(tfidf[0:1], tfidf).flatten()
-    return similarity_vector[1:]
+def get_text_hash(text):
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+def get_term_counts(texts, vocabulary):
+    """
+    Tokenizes texts as TfidfVectorizer does, and counts their terms.
+
+    Args:
+        texts: The texts to tokenize.
+        vocabulary: The term to column dict, which new terms are added to.
+
+    Returns:
+        list. The (columns, counts) arrays of each text.
+    """
+    analyzer = TfidfVectorizer(min_df=1, stop_words='english').build_analyzer()
+    terms_counts = []
+    for text in texts:
+        counts = collections.Counter(vocabulary.setdefault(term, len(vocabulary)) for term in analyzer(text))
+        terms_counts.append((np.array(list(counts.keys()), dtype=int), np.array(list(counts.values()), dtype=float)))
+    return terms_counts
+
+
+def get_similar_texts(text_counts, other_texts_counts, vocabulary_size):
+    """
+    Calculates the cosine similarities of the TF-IDF vectors of a text and other texts, by their term counts.
+    The smoothed IDF is calculated over the text and the other texts only, so the similarities are the same as of a
+    TfidfVectorizer which is fitted on them.
+
+    Args:
+        text_counts: The (columns, counts) arrays of the text.
+        other_texts_counts: The (columns, counts) arrays of each of the other texts.
+        vocabulary_size: The number of columns.
+
+    Returns:
+        np.array. The similarity of the text to each of the other texts.
+    """
+    texts_counts = [text_counts] + other_texts_counts
+    columns = np.concatenate([document[0] for document in texts_counts])
+    counts = np.concatenate([document[1] for document in texts_counts])
+    indptr = np.cumsum([0] + [len(document[0]) for document in texts_counts])
+    document_frequency = np.bincount(columns, minlength=vocabulary_size)
+    idf = np.log((1.0 + len(texts_counts)) / (1.0 + document_frequency)) + 1
+    tfidf = normalize(csr_matrix((counts * idf[columns], columns, indptr),
+                                 shape=(len(texts_counts), max(1, vocabulary_size))))
+    return (tfidf[1:] * tfidf[0].T).toarray().ravel()
+
+
+def load_index(path):
+    """
+    Loads the index of the term counts of the incidents texts, which were tokenized in previous runs.
+    The documents of the index are an incident ID to (text hash, columns, counts) dict.
+    The index is stored as numpy arrays and JSON, which are loaded without unpickling.
+    """
+    if not path:
+        return {'vocabulary': {}, 'documents': {}}
+    try:
+        with open(path, 'rb') as index_file:
+            arrays = np.load(index_file, allow_pickle=False)
+            metadata = json.loads(arrays['metadata'].item())
+            indptr, columns, counts = arrays['indptr'], arrays['columns'], arrays['counts']
+        documents = {}
+        for i, (incident_id, text_hash) in enumerate(zip(metadata['ids'], metadata['hashes'])):
+            documents[incident_id] = (text_hash, columns[indptr[i]:indptr[i + 1]], counts[indptr[i]:indptr[i + 1]])
+        return {'vocabulary': metadata['vocabulary'], 'documents': documents}
+    except Exception:
+        return {'vocabulary': {}, 'documents': {}}
+
+
+def save_index(index, path):
+    """
+    Saves the index, after removing the terms which none of its documents has from the vocabulary.
+    The index is written to a temporary file which only the current user can access, and then renamed to its path, so
+    concurrent runs never load a partially written index.
+    """
+    if not path:
+        return
+    documents = index['documents']
+    used_columns = np.unique(np.concatenate([document[1] for document in documents.values()] or [[]]).astype(int))
+    if len(used_columns) < len(index['vocabulary']):
+        new_columns = np.full(len(index['vocabulary']), -1, dtype=int)
+        new_columns[used_columns] = np.arange(len(used_columns))
+        index = {
+            'vocabulary': {term: int(new_columns[column]) for term, column in index['vocabulary'].items()
+                           if new_columns[column] >= 0},
+            'documents': {incident_id: (text_hash, new_columns[columns], counts)
+                          for incident_id, (text_hash, columns, counts) in documents.items()}
+        }
+    ids = list(index['documents'].keys())
+    documents = [index['documents'][incident_id] for incident_id in ids]
+    metadata = {
+        'vocabulary': index['vocabulary'],
+        'ids': ids,
+        'hashes': [text_hash for text_hash, _, _ in documents]
+    }
+    temp_path = None
+    try:
+        index_fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(index_fd, 'wb') as index_file:
+            np.savez(index_file,
+                     metadata=np.array(json.dumps(metadata)),
+                     indptr=np.cumsum([0] + [len(columns) for _, columns, _ in documents]),
+                     columns=np.concatenate([columns for _, columns, _ in documents] or [[]]).astype(int),
+                     counts=np.concatenate([counts for _, _, counts in documents] or [[]]).astype(float))
+        os.rename(temp_path, path)
+    except Exception as e:
+        demisto.debug('Failed saving the text index: %s' % str(e))
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def update_index(index, incidents, pre_process_text):
+    """
+    Indexes the texts of the incidents which are not indexed yet or whose text has changed, and keeps only the given
+    incidents in the index.
+
+    Args:
+        index: The index, as loaded by load_index.
+        incidents: The incidents, with their text in INCIDENT_TEXT_FIELD.
+        pre_process_text: Whether to tokenize the texts with WordTokenizerNLP before indexing them.
+
+    Returns:
+        list. The (columns, counts) arrays of each incident.
+    """
+    documents = {}
+    new_incidents = []
+    new_texts = []
+    for incident in incidents:
+        text_hash = get_text_hash(incident[INCIDENT_TEXT_FIELD])
+        document = index['documents'].get(incident['id'])
+        if document and document[0] == text_hash:
+            documents[incident['id']] = document
+        else:
+            new_incidents.append((incident['id'], text_hash))
+            new_texts.append(incident[INCIDENT_TEXT_FIELD])
+
+    if pre_process_text and new_texts:
+        new_texts = pre_process_nlp(new_texts)
+    for (incident_id, text_hash), (columns, counts) in zip(new_incidents,
+                                                           get_term_counts(new_texts, index['vocabulary'])):
+        documents[incident_id] = (text_hash, columns, counts)
+
+    index['documents'] = documents
+    return [documents[incident['id']][1:] for incident in incidents]
+
+
+def is_private_directory(path):
+    """
+    Creates a directory which only the current user can access, or checks that the existing directory is such a
+    directory, so index files which were placed in it by others are not loaded.
+    """
+    try:
+        os.mkdir(path, 0o700)
+    except OSError:
+        pass
+    try:
+        path_stat = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(path_stat.st_mode) and path_stat.st_uid == os.getuid() and not path_stat.st_mode & 0o077
+
+
+def get_index_path(incident_type, pre_process_text):
+    """
+    Returns the path of the index of the incident type in the private INDEX_DIR, or None if it is not a private
+    directory and the texts are not indexed.
+    """
+    if not is_private_directory(INDEX_DIR):
+        demisto.debug('Not indexing the texts, as %s is not a private directory' % INDEX_DIR)
+        return None
+    return os.path.join(INDEX_DIR, hashlib.md5(repr((incident_type, pre_process_text))).hexdigest())
 
 
 def get_texts_from_incident(incident, text_fields):
@@ -129,13 +302,14 @@ def main():
     map(lambda x: add_text_to_incident(x, TEXT_FIELDS), candidates)
     candidates = [x for x in candidates if len(x.get(INCIDENT_TEXT_FIELD, 0)) >= MIN_TEXT_LENGTH]
 
-    # compare candidates to the orginial incident using TF-IDF
-    candidates_text = map(lambda x: x[INCIDENT_TEXT_FIELD], candidates)
-    if PRE_PROCESS_TEXT:
-        incident_text = pre_process_nlp(incident_text)
-        candidates_text = pre_process_nlp(candidates_text)
-
-    similarity_vector = get_similar_texts(incident_text, candidates_text)
+    # compare candidates to the orginial incident using TF-IDF, where only texts which were not indexed in previous
+    # runs are tokenized
+    index_path = get_index_path(incident['type'], PRE_PROCESS_TEXT)
+    index = load_index(index_path)
+    incident[INCIDENT_TEXT_FIELD] = incident_text
+    counts = update_index(index, [incident] + candidates, PRE_PROCESS_TEXT)
+    similarity_vector = get_similar_texts(counts[0], counts[1:], len(index['vocabulary']))
+    save_index(index, index_path)
     similar_incidents = []
     for (i, similarity) in enumerate(similarity_vector):
         candidates[i]['similarity'] = similarity
@@ -1,5 +1,7 @@
 from CommonServerPython import *
+import FindSimilarIncidentsByText
 from FindSimilarIncidentsByText import main
+import pytest
 import random
 
 nouns = ['people', 'history', 'way', 'art', 'world', 'information', 'map', 'two', 'family', 'government', 'health',
@@ -212,6 +214,11 @@ def execute_command(command, args=None):
         return []
 
 
+@pytest.fixture(autouse=True)
+def text_index(tmpdir, mocker):
+    mocker.patch.object(FindSimilarIncidentsByText, 'INDEX_DIR', str(tmpdir.join('index')))
+
+
 def test_similar_context(mocker):
     args = dict(default_args)
     args.update({'similarIncidentFields': 'name', 'similarContextKeys': 'simpleValue'})
@@ -238,3 +245,85 @@ def test_similar_context_with_pre_process(mocker):
     assert len(result['EntryContext']['similarIncidentList']) == 1
     assert result['EntryContext']['similarIncidentList'][0]['rawId'] == 2
     assert result['EntryContext']['similarIncident']['similarity'] > 0.9
+
+
+def test_similar_context_uses_index(mocker):
+    """
+    Given
+    - The texts of incidents which were indexed in a previous run.
+
+    When
+    - Running the script again for a new incident, after the text of one of the candidates has changed.
+
+    Then
+    - Ensure only the texts of the new incident and of the changed candidate are tokenized, and the similarities are
+     the same as without the index.
+    """
+    mocker.patch.object(demisto, 'args', return_value=dict(default_args))
+    mocker.patch.object(demisto, 'incidents', return_value=[dict(incident1)])
+    mocker.patch.object(demisto, 'executeCommand', side_effect=execute_command)
+    main()
+
+    incident5 = dict(incident1, id=5)
+    changed_incident4 = dict(incident4, details=incident1['details'])
+    mocker.patch.object(demisto, 'incidents', return_value=[incident5])
+    mocker.patch.object(demisto, 'executeCommand', return_value=[{
+        'Type': entryTypes['note'],
+        'Contents': {'data': [dict(incident1_dup), dict(incident3), changed_incident4]}
+    }])
+    get_term_counts = mocker.spy(FindSimilarIncidentsByText, 'get_term_counts')
+    result = main()
+
+    tokenized_texts = get_term_counts.call_args[0][0]
+    assert len(tokenized_texts) == 2
+    assert 'incident1 bla' in tokenized_texts[0] and 'incident4' in tokenized_texts[1]
+    assert [row['rawId'] for row in result['EntryContext']['similarIncidentList']] == [2, 4]
+    assert result['EntryContext']['similarIncident']['similarity'] > 0.9
+
+
+def test_load_index_does_not_unpickle(tmpdir):
+    """
+    Given
+    - An index file which is a pickle, and was not saved by the script.
+
+    When
+    - Loading the index.
+
+    Then
+    - Ensure the file is not unpickled, and an empty index is loaded.
+    """
+    import pickle
+    index_path = str(tmpdir.join('index'))
+    with open(index_path, 'wb') as index_file:
+        pickle.dump({'vocabulary': {'word': 0}, 'documents': {}}, index_file)
+    assert FindSimilarIncidentsByText.load_index(index_path) == {'vocabulary': {}, 'documents': {}}
+
+
+def test_index_path_in_private_directory(tmpdir, mocker):
+    """
+    Given
+    - An index directory which does not exist, and one which others can access.
+
+    When
+    - Getting the path of the index, and saving the index.
+
+    Then
+    - Ensure the directory is created so only the current user can access it, and the index is saved in it without
+     temporary files left behind.
+    - Ensure the texts are not indexed in a directory which others can access.
+    """
+    import os
+    import stat
+    index_path = FindSimilarIncidentsByText.get_index_path('Phishing', False)
+    index_dir = FindSimilarIncidentsByText.INDEX_DIR
+    assert os.path.dirname(index_path) == index_dir
+    assert stat.S_IMODE(os.stat(index_dir).st_mode) == 0o700
+    FindSimilarIncidentsByText.save_index({'vocabulary': {}, 'documents': {}}, index_path)
+    assert os.listdir(index_dir) == [os.path.basename(index_path)]
+    assert stat.S_IMODE(os.stat(index_path).st_mode) == 0o600
+
+    shared_dir = tmpdir.mkdir('shared')
+    shared_dir.chmod(0o777)
+    mocker.patch.object(FindSimilarIncidentsByText, 'INDEX_DIR', str(shared_dir))
+    assert FindSimilarIncidentsByText.get_index_path('Phishing', False) is None
+    assert FindSimilarIncidentsByText.load_index(None) == {'vocabulary': {}, 'documents': {}}
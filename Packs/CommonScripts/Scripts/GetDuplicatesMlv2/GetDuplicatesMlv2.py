@@ -3,14 +3,21 @@ from CommonServerPython import *
 import collections
 import re
 import dateutil.parser
+import hashlib
+import os
 import pickle
+import stat
+import tempfile
+import time
 import ipaddress
 import tldextract
 import editdistance
 import zlib
 from rfc822 import parseaddr  # type:ignore
 from urlparse import urlparse
+import numpy as np
 import pandas as pd
+from scipy.sparse import csr_matrix
 from sklearn.ensemble import RandomForestClassifier
 from datetime import datetime, timedelta
 from sklearn.preprocessing import Imputer
@@ -245,6 +252,9 @@ EMAIL_TEXT_LABEL = 'Email/text'
 EMAIL_HTML_LABEL = 'Email/html'
 EMAIL_ATTACHMENT_LABEL = 'Email/attachments'
 
+MODEL_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'get_duplicates_ml_models')
+MODEL_CACHE_TTL_SECONDS = 60 * 60
+
 BRAND_LABEL = 'Brand'
 INSTANCE_LABEL = 'Instance'
 CANDIDATES_FEATURES_NA_RATIO = 0.2
@@ -265,12 +275,15 @@ INDICATORS_FOR_JACCARD = []  # type: list
 class Utils():
     email_pattern = re.compile(
         r"""[a-zA-Z0-9.!#$%&'*+/=?^_`{|}~-]+@[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?(?:\.[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?)*""")  # noqa: E501
+    tld_extract = None
 
     @staticmethod
     def extract_domain_from_url(url):
-        extract = tldextract.TLDExtract(cache_file='/tmp/.tld_set')
-        domain = extract(url).domain.lower()
-        suffix = extract(url).suffix.lower()
+        if Utils.tld_extract is None:
+            Utils.tld_extract = tldextract.TLDExtract(cache_file='/tmp/.tld_set')
+        extract_result = Utils.tld_extract(url)
+        domain = extract_result.domain.lower()
+        suffix = extract_result.suffix.lower()
         if len(domain) > 0 and len(suffix) > 0:
             return ".".join([domain, suffix])
 
@@ -400,13 +413,8 @@ class Utils():
         if x is None or y is None:
             return 0
 
-        if type(x) == dict:
-            x = Utils.get_hashable_from_dict(x)
-        if type(y) == dict:
-            y = Utils.get_hashable_from_dict(y)
-
-        x = [v for v in x if isinstance(v, collections.Hashable)]
-        y = [v for v in y if isinstance(v, collections.Hashable)]
+        x = Utils.get_hashable_elements(x)
+        y = Utils.get_hashable_elements(y)
 
         if len(x) == 0 or len(y) == 0:
             return 0
@@ -415,6 +423,14 @@ class Utils():
         union_cardinality = len(Utils.union_set(x, y))
         return intersection_cardinality / float(union_cardinality)
 
+    @staticmethod
+    def get_hashable_elements(x):
+        if x is None:
+            return []
+        if isinstance(x, dict):
+            x = Utils.get_hashable_from_dict(x)
+        return [v for v in x if isinstance(v, collections.Hashable)]
+
     @staticmethod
     def canonize_ip_to_netrok(ip_address, mast_bits):
         try:
@@ -423,7 +439,115 @@ class Utils():
             return ip_address
 
 
+def prepare_incident(incident):
+    """
+    Computes the labels map and the time of an incident, and completes its domains and canonized IPs indicators.
+    This is done once per incident, and not once per pair of incidents.
+    """
+    if 'labels_map' in incident:
+        return incident
+    incident['labels_map'] = Utils.get_incident_labels_map(incident['labels'])
+    try:
+        incident['parsed_time'] = dateutil.parser.parse(incident[TIME_FIELD])
+    except Exception:
+        incident['parsed_time'] = incident.get(TIME_FIELD)
+
+    indicators = incident['indicators']
+    domains = Utils.get_unique_list(indicators.get('Domain', []) + Utils.get_domains(indicators,
+                                                                                     incident['labels_map']))
+    if len(domains) > 0:
+        indicators['Domain'] = domains
+    if IP_MASK_BITS_FOR_COMPARISON < 32 and IP_MASK_BITS_FOR_COMPARISON > 0 and 'IP' in indicators:
+        indicators['IP'] = [Utils.canonize_ip_to_netrok(ip, IP_MASK_BITS_FOR_COMPARISON) for ip in indicators['IP']]
+    return incident
+
+
+def get_jaccard_sets(incident):
+    """
+    Gets the elements of the sets which the Jaccard similarity features of an incident are computed on.
+    An indicator type which the incident does not have is not included, as its feature is not computed.
+    """
+    sets = {
+        'custom_fields_jaccard': Utils.get_hashable_elements(incident.get('CustomFields', [])),
+        'labels_jaccard': Utils.get_hashable_elements(
+            [(k, v) for (k, v) in incident['labels_map'].items() if k not in LABELS_BLACKLIST])
+    }
+    for indicator_type in INDICATORS_FOR_JACCARD:
+        if indicator_type in incident['indicators']:
+            sets['indicator_%s_jaccard' % indicator_type] = Utils.get_hashable_elements(
+                incident['indicators'][indicator_type])
+    return sets
+
+
+def get_jaccard_features(incidents, pairs):
+    """
+    Computes the Jaccard similarity features of pairs of incidents in a batch.
+    The sets of each incident are encoded once as the rows of a sparse binary matrix per feature, and the
+    intersections of all the pairs are computed by a single element-wise product of the matrix rows.
+
+    Args:
+        incidents: The prepared incidents.
+        pairs: (index, index) pairs of incidents to compare.
+
+    Returns:
+        dict. The feature name to the similarities of the pairs, where None marks a feature which is not computed.
+    """
+    incidents_sets = [get_jaccard_sets(incident) for incident in incidents]
+    rows1 = np.array([i for i, _ in pairs], dtype=int)
+    rows2 = np.array([j for _, j in pairs], dtype=int)
+    features = {}
+    for feature_name in set().union(*incidents_sets):
+        vocabulary = {}  # type: dict
+        indices, indptr, exists = [], [0], []
+        for incident_sets in incidents_sets:
+            exists.append(feature_name in incident_sets)
+            for element in set(incident_sets.get(feature_name, [])):
+                indices.append(vocabulary.setdefault(element, len(vocabulary)))
+            indptr.append(len(indices))
+        matrix = csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(incidents), max(1, len(vocabulary))))
+        sizes = np.diff(indptr)
+        exists = np.array(exists)
+
+        intersection = np.asarray(matrix[rows1].multiply(matrix[rows2]).sum(axis=1)).ravel()
+        union = sizes[rows1] + sizes[rows2] - intersection
+        similarity = np.zeros(len(pairs))
+        non_empty = (sizes[rows1] > 0) & (sizes[rows2] > 0)
+        similarity[non_empty] = intersection[non_empty] / union[non_empty].astype(float)
+        features[feature_name] = [similarity[k] if exists[rows1[k]] and exists[rows2[k]] else None
+                                  for k in range(len(pairs))]
+    return features
+
+
+def calculate_pairs_features(incidents, pairs, expected_features=FEATURES):
+    """
+    Calculates the features of pairs of incidents.
+
+    Args:
+        incidents: The incidents, enriched with their indicators.
+        pairs: (index, index) pairs of incidents to compare.
+        expected_features: Features which are set to None when they are not computed for a pair.
+
+    Returns:
+        list. The features dict of each pair.
+    """
+    for incident in incidents:
+        prepare_incident(incident)
+    jaccard_features = get_jaccard_features(incidents, pairs)
+    pairs_features = []
+    for k, (i, j) in enumerate(pairs):
+        features = IncidentFeatures(incidents[i], incidents[j]).calculate_features(expected_features)
+        for feature_name, similarities in jaccard_features.items():
+            if similarities[k] is not None:
+                features[feature_name] = similarities[k]
+        pairs_features.append(features)
+    return pairs_features
+
+
 class IncidentFeatures:
+    """
+    The features of a pair of prepared incidents, other than the Jaccard similarities which are computed in a batch
+    by get_jaccard_features.
+    """
     def __init__(self, incident1, incident2):
 
         self.incident1 = incident1
@@ -432,26 +556,8 @@ class IncidentFeatures:
         self.indicators1 = incident1['indicators']
         self.indicators2 = incident2['indicators']
 
-        self.labels_map1 = Utils.get_incident_labels_map(self.incident1['labels'])
-        self.labels_map2 = Utils.get_incident_labels_map(self.incident2['labels'])
-
-        domains1 = Utils.get_unique_list(
-            self.indicators1.get('Domain', []) + Utils.get_domains(self.indicators1, self.labels_map2))
-        domains2 = Utils.get_unique_list(
-            self.indicators2.get('Domain', []) + Utils.get_domains(self.indicators2, self.labels_map2))
-
-        if len(domains1) > 0:
-            self.indicators1['Domain'] = domains1
-        if len(domains2) > 0:
-            self.indicators2['Domain'] = domains2
-
-        if IP_MASK_BITS_FOR_COMPARISON < 32 and IP_MASK_BITS_FOR_COMPARISON > 0:
-            if 'IP' in self.indicators1:
-                self.indicators1['IP'] = map(lambda ip: Utils.canonize_ip_to_netrok(
-                    ip, IP_MASK_BITS_FOR_COMPARISON), self.indicators1['IP'])
-            if 'IP' in self.indicators2:
-                self.indicators2['IP'] = map(lambda ip: Utils.canonize_ip_to_netrok(
-                    ip, IP_MASK_BITS_FOR_COMPARISON), self.indicators2['IP'])
+        self.labels_map1 = incident1['labels_map']
+        self.labels_map2 = incident2['labels_map']
 
     def get_email_labels_features(self):
         def add_label_ld_feature(label_name):
@@ -488,26 +594,14 @@ class IncidentFeatures:
 
     def get_incident_features(self):
         features = {}
-        incident_time_diff = Utils.get_time_diff_seconds(self.incident1[TIME_FIELD], self.incident2[TIME_FIELD])
+        incident_time_diff = Utils.get_time_diff_seconds(self.incident1['parsed_time'], self.incident2['parsed_time'])
         features['incident_time_diff'] = incident_time_diff
         features['same_type'] = self.incident1['type'] == self.incident2['type']
         features['same_severity'] = self.incident1['severity'] == self.incident2['severity']
-        features['custom_fields_jaccard'] = Utils.jaccard_similarity(self.incident1.get('CustomFields', []),
-                                                                     self.incident2.get('CustomFields', []))
-        features['labels_jaccard'] = Utils.jaccard_similarity(
-            [(k, v) for (k, v) in self.labels_map1.items() if k not in LABELS_BLACKLIST],
-            [(k, v) for (k, v) in self.labels_map2.items() if k not in LABELS_BLACKLIST]
-        )
 
         if INSTANCE_LABEL in self.labels_map1 and INSTANCE_LABEL in self.labels_map2:
             features['same_instance'] = self.labels_map1[INSTANCE_LABEL] == self.labels_map2[INSTANCE_LABEL]
 
-        for indicator_type in INDICATORS_FOR_JACCARD:
-            if indicator_type in self.indicators1 and indicator_type in self.indicators2:
-                features['indicator_%s_jaccard' % indicator_type] = Utils.jaccard_similarity(
-                    self.indicators1[indicator_type],
-                    self.indicators2[indicator_type])
-
         return features
 
     def calculate_features(self, expected_features=FEATURES):
@@ -586,8 +680,10 @@ def get_my_duplicate_incidents_features(incident_type, days_to_fetch_duplicates,
         return None
     incidents = enrich_incidents_by_indicators(incident_list, max_indicators)
 
-    related_features = {}  # type: dict
-    for incident in incidents.values():
+    incidents_list = incidents.values()
+    incident_index = {incident['id']: i for i, incident in enumerate(incidents_list)}
+    related_pairs = {}  # type: dict
+    for incident in incidents_list:
         related_incidents = incident.get('linkedIncidents')
         if related_incidents:
             for related_incident_id in related_incidents:
@@ -595,11 +691,13 @@ def get_my_duplicate_incidents_features(incident_type, days_to_fetch_duplicates,
                     related_incidents += list(set(incidents[related_incident_id]['linkedIncidents']).difference(related_incidents))  # noqa E501 line too long
             for related_incident_id in related_incidents:
                 key = get_unique_key_for_pair(incident['id'], related_incident_id)
-                if incident['id'] == related_incident_id or key in related_features or related_incident_id not in incidents:
+                if incident['id'] == related_incident_id or key in related_pairs or related_incident_id not in incidents:
                     continue
-                related_features[key] = IncidentFeatures(incident, incidents[related_incident_id]).calculate_features()
-                related_features[key][DUPLICATE_COL] = 1
-    return pd.DataFrame.from_dict(related_features.values())
+                related_pairs[key] = (incident_index[incident['id']], incident_index[related_incident_id])
+    related_features = calculate_pairs_features(incidents_list, related_pairs.values())
+    for features in related_features:
+        features[DUPLICATE_COL] = 1
+    return pd.DataFrame.from_dict(related_features)
 
 
 def filter_features(features, selected_features=FEATURES):
@@ -617,6 +715,60 @@ def get_ml_model():
     return RandomForestClassifier(max_depth=10, n_estimators=100, random_state=1)
 
 
+def is_private_directory(path):
+    """
+    Creates a directory which only the current user can access, or checks that the existing directory is such a
+    directory, so files which were placed in it by others are not unpickled.
+    """
+    try:
+        os.mkdir(path, 0o700)
+    except OSError:
+        pass
+    try:
+        path_stat = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(path_stat.st_mode) and path_stat.st_uid == os.getuid() and not path_stat.st_mode & 0o077
+
+
+def get_trained_model(cache_key, get_training_data):
+    """
+    Gets a model trained on the training data, along with the training features.
+    The model is cached in a file in the private MODEL_CACHE_DIR for MODEL_CACHE_TTL_SECONDS, so it is reused between
+    runs with the same cache key.
+
+    Args:
+        cache_key: The arguments which determine the training data and the features.
+        get_training_data: A function which returns the training features and labels.
+
+    Returns:
+        tuple. The trained model and the training features.
+    """
+    use_cache = is_private_directory(MODEL_CACHE_DIR)
+    cache_path = os.path.join(MODEL_CACHE_DIR, hashlib.md5(repr(cache_key)).hexdigest())
+    try:
+        if use_cache and time.time() - os.path.getmtime(cache_path) < MODEL_CACHE_TTL_SECONDS:
+            with open(cache_path, 'rb') as cache_file:
+                return pickle.load(cache_file)
+    except Exception:
+        pass
+
+    X, Y = get_training_data()
+    model = get_ml_model()
+    model.fit(X, Y)
+    if not use_cache:
+        demisto.debug('Not caching the model, as %s is not a private directory' % MODEL_CACHE_DIR)
+        return model, X
+    try:
+        temp_path = '%s.%d' % (cache_path, os.getpid())
+        with open(temp_path, 'wb') as cache_file:
+            pickle.dump((model, X), cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(temp_path, cache_path)
+    except Exception as e:
+        demisto.debug('Failed caching the model: %s' % str(e))
+    return model, X
+
+
 def get_result_record(incident, probabilty):
     occured_time = incident[TIME_FIELD]
     try:
@@ -688,7 +840,7 @@ def main():
     THRESHOLD = float(demisto.args().get('threshold', 0.5))
     TIME_FIELD = demisto.args().get('timeField', 'created')
 
-    incident = enrich_incidents_by_indicators(demisto.incidents(), MAX_INDICATORS).values()[0]
+    incident = prepare_incident(enrich_incidents_by_indicators(demisto.incidents(), MAX_INDICATORS).values()[0])
 
     incident_email_labels = get_incident_email_labels(incident)
     email_features = set(incident_email_labels).intersection(EMAIL_LABELS_FEATURES)
@@ -699,31 +851,38 @@ def main():
     use_features = set(FEATURES).union(email_features).union(indicators_features)
 
     if len(email_features) > 0:
-        features_df = load_compressed_features(FEATURES_PHISHING_STRING)
+        features_string = FEATURES_PHISHING_STRING
     else:
-        features_df = load_compressed_features(FEATURES_OTHERS_STRING)
-
-    use_features = set(features_df.columns).intersection(use_features)
+        features_string = FEATURES_OTHERS_STRING
+
+    def get_training_data():
+        features_df = load_compressed_features(features_string)
+        training_features = set(features_df.columns).intersection(use_features)
+        if USE_MY_DUPLICATES_X_DAYS_AGO > 0:
+            my_tagged_data_features = get_my_duplicate_incidents_features(incident['type'],
+                                                                          USE_MY_DUPLICATES_X_DAYS_AGO,
+                                                                          MAX_INCIDENTS, MAX_INDICATORS)
+            features_df = union_complete_missing_values(features_df, my_tagged_data_features).reset_index()
+        return filter_features(features_df, training_features), features_df[DUPLICATE_COL]
+
+    model_cache_key = (len(email_features) > 0, sorted(use_features), USE_MY_DUPLICATES_X_DAYS_AGO)
     if USE_MY_DUPLICATES_X_DAYS_AGO > 0:
-        my_tagged_data_features = get_my_duplicate_incidents_features(incident['type'], USE_MY_DUPLICATES_X_DAYS_AGO,
-                                                                      MAX_INCIDENTS, MAX_INDICATORS)
-        features_df = union_complete_missing_values(features_df, my_tagged_data_features).reset_index()
-
-    X = filter_features(features_df, use_features)
-    Y = features_df[DUPLICATE_COL]
-    model = get_ml_model()
-    model.fit(X, Y)
+        model_cache_key += (incident['type'], MAX_INCIDENTS, IP_MASK_BITS_FOR_COMPARISON, TIME_FIELD,
+                            sorted(EMAIL_LABELS_MAP.items()), sorted(INDICATORS_FOR_JACCARD))
+    model, X = get_trained_model(model_cache_key, get_training_data)
+    # the features which the model was trained on
+    use_features = set(X.columns)
     candidates = enrich_incidents_by_indicators(get_incidents_by_time_diff(incident.get('id'),
                                                                            incident[TIME_FIELD],
                                                                            IGNORE_CLOSED_INCIDENTS,
                                                                            MAX_INCIDENTS, TIME_DIFF_HOURS), MAX_INDICATORS)
     candidates.pop(incident['id'], None)
 
-    candidates_features_list = []
-    for candidate in candidates.values():
-        feature_dict = IncidentFeatures(incident, candidate).calculate_features()
+    candidates_list = candidates.values()
+    candidates_features_list = calculate_pairs_features([incident] + candidates_list,
+                                                        [(0, i + 1) for i in range(len(candidates_list))])
+    for feature_dict, candidate in zip(candidates_features_list, candidates_list):
         feature_dict['id'] = candidate['id']
-        candidates_features_list.append(feature_dict)
     if len(candidates_features_list) == 0:
         demisto.results('Did not find any duplicate incidents candidates')
         return
@@ -732,6 +891,7 @@ def main():
     candidates_features = candidates_features.dropna(axis=0, thresh=(len(use_features) * (1 - CANDIDATES_FEATURES_NA_RATIO)))
     candidates_features_x = filter_features(candidates_features, use_features)
     candidates_features_x = union_complete_missing_values(X, candidates_features_x, ['features', 'candidates']).loc['candidates']
+    candidates_features_x = candidates_features_x[X.columns]
     predications_prob = model.predict_proba(candidates_features_x)
     predications = model.predict(candidates_features_x)
     result = []
@@ -1,9 +1,21 @@
+import copy
+import random
+
+import pytest
+
 import demistomock as demisto
-from GetDuplicatesMlv2 import main, Utils
+import GetDuplicatesMlv2
+from GetDuplicatesMlv2 import main, Utils, calculate_pairs_features
 from CommonServerPython import entryTypes
 
 
-def test_main(mocker):
+@pytest.fixture(autouse=True)
+def model_cache(tmpdir, mocker):
+    mocker.patch.object(GetDuplicatesMlv2, 'MODEL_CACHE_DIR', str(tmpdir.join('models')))
+
+
+def mock_main(mocker, indicator_type='Email', compare_indicators='Email, IP, Domain, File SHA256, File MD5, URL',
+              incidents=None):
     def executeCommand(name, args=None):
         if name == 'findIndicators':
             return [
@@ -12,22 +24,28 @@ def test_main(mocker):
                     'Contents': [{
                         "investigationIDs": ["1", "2"],
                         "value": "test@test.com",
-                        "indicator_type": "Email",
+                        "indicator_type": indicator_type,
                     }]
                 }
             ]
         elif name == 'getIncidents':
+            if incidents:
+                return [{'Type': entryTypes['note'], 'Contents': {'data': incidents, 'total': len(incidents)}}]
             return demisto.exampleIncidents  # use original mock
         else:
             raise ValueError('Unimplemented command called: {}'.format(name))
 
     mocker.patch.object(demisto, 'args', return_value={
-        "compareIndicators": "Email, IP, Domain, File SHA256, File MD5, URL",
+        "compareIndicators": compare_indicators,
         "compareEmailLabels": "Email/headers/From, Email/headers/Subject, Email/text, Email/html, Email/attachments",
         "UseLocalEnvDuplicatesInLastDays": "30"
     })
     mocker.patch.object(demisto, 'results')
     mocker.patch.object(demisto, 'executeCommand', side_effect=executeCommand)
+
+
+def test_main(mocker):
+    mock_main(mocker)
     # validate our mocks are good
     assert 'URL' in demisto.args()['compareIndicators']
     main()
@@ -42,3 +60,112 @@ def test_extract_domain_from_url():
     assert res == 'google.com'
     res = Utils.extract_domain_from_url("https://www.google.co.il")  # disable-secrets-detection
     assert res == 'google.co.il'
+
+
+def test_main_reuses_cached_model(mocker):
+    """
+    Given
+    - A model which was trained in a previous run.
+
+    When
+    - Running the script again with the same arguments.
+
+    Then
+    - Ensure the cached model is used and not trained again.
+    """
+    mock_main(mocker)
+    main()
+    fit = mocker.spy(GetDuplicatesMlv2.RandomForestClassifier, 'fit')
+    main()
+    assert fit.call_count == 0
+    assert demisto.results.call_args[0][0].startswith('Did not find any')
+
+
+def test_get_trained_model_private_cache_directory(mocker):
+    """
+    Given
+    - A model which was cached, in a directory which other users can write to.
+
+    When
+    - Getting the trained model again.
+
+    Then
+    - Ensure the cached model is not loaded, and the model is trained again.
+    """
+    import os
+    import pandas as pd
+    get_training_data = mocker.Mock(return_value=(pd.DataFrame({'feature': [0, 1, 0, 1]}), pd.Series([0, 1, 0, 1])))
+    GetDuplicatesMlv2.get_trained_model('key', get_training_data)
+    GetDuplicatesMlv2.get_trained_model('key', get_training_data)
+    assert get_training_data.call_count == 1
+
+    os.chmod(GetDuplicatesMlv2.MODEL_CACHE_DIR, 0o777)
+    GetDuplicatesMlv2.get_trained_model('key', get_training_data)
+    assert get_training_data.call_count == 2
+
+
+def test_main_indicator_type_not_in_training_data(mocker):
+    """
+    Given
+    - Incidents which have indicators of a type which the training data does not have a feature of.
+
+    When
+    - Comparing the incidents by this indicator type.
+
+    Then
+    - Ensure the candidates are scored by the features which the model was trained on only.
+    """
+    incident = demisto.incidents()[0]
+    mock_main(mocker, indicator_type='Custom Type', compare_indicators='Custom Type',
+              incidents=[copy.deepcopy(incident), dict(copy.deepcopy(incident), id='2')])
+    predict_proba = mocker.spy(GetDuplicatesMlv2.RandomForestClassifier, 'predict_proba')
+    main()
+    candidates_features = predict_proba.call_args_list[0][0][1]
+    assert 'indicator_Custom Type_jaccard' not in candidates_features.columns
+    assert demisto.results.call_args[0][0]['Contents'] == 'Did not find any duplicate incidents'
+
+
+def test_calculate_pairs_features_jaccard(mocker):
+    """
+    Given
+    - Incidents with random custom fields, labels and indicators.
+
+    When
+    - Calculating the features of pairs of incidents in a batch.
+
+    Then
+    - Ensure the Jaccard similarities are the same as calculated for each pair separately, and are calculated only for
+     indicator types which both incidents have.
+    """
+    mocker.patch.object(GetDuplicatesMlv2, 'INDICATORS_FOR_JACCARD', ['IP', 'File SHA256'])
+    rand = random.Random(0)
+
+    def random_incident(i):
+        indicators = {}
+        for indicator_type in ('IP', 'File SHA256'):
+            if rand.random() < 0.7:
+                indicators[indicator_type] = ['%s%d' % (indicator_type, rand.randint(0, 5))
+                                              for _ in range(rand.randint(0, 4))]
+        return {
+            'id': str(i), 'type': 'Phishing', 'severity': 1, 'created': '2020-01-01T00:00:00Z',
+            'labels': [{'type': 'Brand', 'value': 'brand %d' % rand.randint(0, 2)},
+                       {'type': 'Country', 'value': 'country %d' % rand.randint(0, 2)}],
+            'CustomFields': rand.choice([None, {}, {'a': rand.randint(0, 2), 'b': [1], 'c': rand.randint(0, 1)}]),
+            'indicators': indicators
+        }
+
+    incidents = [random_incident(i) for i in range(30)]
+    pairs = [(rand.randint(0, 29), rand.randint(0, 29)) for _ in range(100)]
+    for (i, j), features in zip(pairs, calculate_pairs_features(incidents, pairs)):
+        assert features['custom_fields_jaccard'] == Utils.jaccard_similarity(incidents[i]['CustomFields'],
+                                                                             incidents[j]['CustomFields'])
+        assert features['labels_jaccard'] == Utils.jaccard_similarity(
+            [(k, v) for k, v in incidents[i]['labels_map'].items() if k not in GetDuplicatesMlv2.LABELS_BLACKLIST],
+            [(k, v) for k, v in incidents[j]['labels_map'].items() if k not in GetDuplicatesMlv2.LABELS_BLACKLIST])
+        for indicator_type in ('IP', 'File SHA256'):
+            feature = features.get('indicator_%s_jaccard' % indicator_type)
+            if indicator_type in incidents[i]['indicators'] and indicator_type in incidents[j]['indicators']:
+                assert feature == Utils.jaccard_similarity(incidents[i]['indicators'][indicator_type],
+                                                           incidents[j]['indicators'][indicator_type])
+            else:
+                assert feature is None
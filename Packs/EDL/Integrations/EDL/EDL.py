@@ -2,21 +2,27 @@ import demistomock as demisto
 from CommonServerPython import *
 from CommonServerUserPython import *
 
+from IndicatorsOutputsApiModule import *  # noqa: E402
+
 import re
+import gzip
+import hashlib
+import gevent
+import threading
 from base64 import b64decode
+from datetime import timezone
 from multiprocessing import Process
 from gevent.pywsgi import WSGIServer
 from tempfile import NamedTemporaryFile
 from flask import Flask, Response, request
-from netaddr import IPAddress, iprange_to_cidrs
-from typing import Callable, List, Any, Dict, cast, Tuple
+from typing import Callable, List, Any, Dict, cast, Tuple, NamedTuple, Optional, Iterable, Iterator
 from ssl import SSLContext, SSLError, PROTOCOL_TLSv1_2
 
 
 class Handler:
     @staticmethod
     def write(msg):
-        demisto.info(msg)
+        call_demisto(demisto.info, msg)
 
 
 ''' GLOBAL VARIABLES '''
@@ -31,6 +37,13 @@ EDL_COLLAPSE_ERR_MSG: str = 'The Collapse parameter can only get the following:
                             '1 - Collapse to Ranges, 2 - Collapse to CIDRS'
 EDL_MISSING_REFRESH_ERR_MSG: str = 'Refresh Rate must be "number date_range_unit", examples: (2 hours, 4 minutes, ' \
                                    '6 months, 1 day, etc.)'
+EDL_REFRESH_RETRY_SECONDS: int = 60
+EDL_FULL_SYNC_INTERVAL: int = 60 * 60
+# modifications of the last seconds before a sync are searched again by the next sync, as they may not be indexed yet
+EDL_SYNC_OVERLAP: int = 60
+DEMISTO_TIME_FORMAT: str = '%Y-%m-%dT%H:%M:%SZ'
+# the seconds a request waits for the first refresh of the EDL, before it is answered that the EDL is not ready
+EDL_FIRST_REFRESH_TIMEOUT: int = 30
 ''' REFORMATTING REGEXES '''
 _PROTOCOL_REMOVAL = re.compile('^(?:[a-z]+:)*//')
 _PORT_REMOVAL = re.compile(r'^((?:[a-z]+:)*//([a-z0-9\-\.]+)|([a-z0-9\-\.]+))(?:\:[0-9]+)*')
@@ -40,6 +53,54 @@ _INVALID_TOKEN_REMOVAL = re.compile(r'(?:[^\./+=\?&]+\*[^\./+=\?&]*)|(?:[^\./+=\
 DONT_COLLAPSE = "Don't Collapse"
 COLLAPSE_TO_CIDR = "To CIDRS"
 COLLAPSE_TO_RANGES = "To Ranges"
+IP_INDICATOR_TYPES = ('IP', 'IPv6', 'CIDR', 'IPv6CIDR')
+
+'''EDL Response Class'''
+
+
+class EDLResponse(NamedTuple):
+    """An immutable precomputed EDL body, with its ETag and gzip compressed body"""
+    body: bytes
+    etag: str
+    gzip_body: Optional[bytes] = None
+
+
+# the response of the EDL with the default request arguments, which the background refresher replaces on a schedule
+EDL_PRECOMPUTED_RESPONSE: Optional[EDLResponse] = None
+# set when the background refresher precomputes the first response
+EDL_REFRESHED: threading.Event = threading.Event()
+# set to stop the background refresher thread
+EDL_REFRESHER_STOP: threading.Event = threading.Event()
+# guards the handover of the precomputed response from the refresher thread to the server
+EDL_RESPONSE_LOCK: threading.Lock = threading.Lock()
+# the requests and the refresher thread share the stdin and stdout of the integration, so their demisto calls are
+# serialized
+DEMISTO_CALLS_LOCK: threading.Lock = threading.Lock()
+
+
+def call_demisto(func: Callable, *args, **kwargs) -> Any:
+    """
+    Calls a demisto function under the demisto calls lock. The server greenlets wait for the lock without blocking
+    the gevent hub, so other requests are served while the refresher thread is in a demisto call.
+
+    Args:
+        func: The demisto function
+        *args: The positional arguments of the function
+        **kwargs: The keyword arguments of the function
+
+    Returns:
+        The result of the function
+    """
+    if threading.current_thread() is threading.main_thread():
+        while not DEMISTO_CALLS_LOCK.acquire(blocking=False):
+            gevent.sleep(0.01)
+    else:
+        DEMISTO_CALLS_LOCK.acquire()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        DEMISTO_CALLS_LOCK.release()
+
 
 '''Request Arguments Class'''
 
@@ -78,6 +139,95 @@ class RequestArguments:
 
         return False
 
+    def cache_key(self) -> tuple:
+        """
+        The normalized request arguments, which identify the output of the request in the outputs cache
+        """
+        return tuple((name, normalize_request_arg(value)) for name, value in sorted(vars(self).items()))
+
+
+OUTPUTS_CACHE: OutputsCache = OutputsCache()
+
+
+'''IOC Snapshot Class'''
+
+
+class IOCSnapshot:
+    """
+    An in memory snapshot of the IOCs which match a query, keyed by their values. The first sync searches all the
+    IOCs of the query, and the next syncs search only the IOCs of the query which were modified since the previous
+    sync, and add or update them. IOCs whose expiration time passed are removed if the query includes only active
+    IOCs, and a full sync runs every full sync interval, to remove the IOCs which were deleted or no longer match the
+    query.
+    The snapshot keeps the IOCs in the order of the search, as the EDL takes its first IOCs. A modified IOC keeps its
+    place until the next full sync, and a sync which finds new IOCs when the snapshot already holds the IOCs the EDL
+    takes is a full sync, as the new IOCs can not be placed in the order of the search without searching all the IOCs.
+    """
+
+    def __init__(self, query: str, full_sync_interval: int = EDL_FULL_SYNC_INTERVAL):
+        self.query = query
+        self.full_sync_interval = full_sync_interval
+        self.iocs: Dict[str, dict] = {}
+        self.last_sync: Optional[datetime] = None
+        self.last_full_sync: Optional[datetime] = None
+        self._expirations: Dict[str, datetime] = {}
+        self._remove_expired = 'expirationstatus:active' in query.lower().replace(' ', '')
+
+    def sync(self, limit: int = 0) -> List[dict]:
+        """
+        Syncs the snapshot with the IOCs in Cortex XSOAR
+
+        Args:
+            limit: The number of the first IOCs of the snapshot which the EDL takes, or 0 if it takes all of them
+
+        Returns:
+            The IOCs of the snapshot
+        """
+        now = datetime.utcnow()
+        full_sync = not self.last_sync or not self.last_full_sync or \
+            (now - self.last_full_sync).total_seconds() >= self.full_sync_interval
+        if not full_sync:
+            modified_query = f'modified:>="{self.last_sync.strftime(DEMISTO_TIME_FORMAT)}"'  # type: ignore
+            modified_iocs = list(search_indicators_with_cursor(f'{modified_query} and ({self.query})'))
+            # new IOCs are added after the IOCs of the snapshot, where the EDL does not take them from once the
+            # snapshot holds the IOCs it takes
+            full_sync = bool(limit) and len(self.iocs) >= limit and \
+                any(ioc.get('value') and ioc.get('value') not in self.iocs for ioc in modified_iocs)
+            if not full_sync:
+                self._add(modified_iocs)
+        if full_sync:
+            self.iocs = {}
+            self._expirations = {}
+            self._add(search_indicators_with_cursor(self.query))
+            self.last_full_sync = now
+
+        if self._remove_expired:
+            for value in [value for value, expiration in self._expirations.items() if expiration <= now]:
+                self._remove(value)
+
+        self.last_sync = now - timedelta(seconds=EDL_SYNC_OVERLAP)
+        return list(self.iocs.values())
+
+    def _add(self, iocs: Iterable[dict]):
+        for ioc in iocs:
+            value = ioc.get('value')
+            if not value:
+                continue
+            # only the fields which are used to format the EDL are kept
+            self.iocs[value] = {'value': value, 'indicator_type': ioc.get('indicator_type')}
+            expiration = parse_expiration(ioc.get('expiration'))
+            if expiration:
+                self._expirations[value] = expiration
+            else:
+                self._expirations.pop(value, None)
+
+    def _remove(self, value: str):
+        self.iocs.pop(value, None)
+        self._expirations.pop(value, None)
+
+
+EDL_IOC_SNAPSHOT: Optional[IOCSnapshot] = None
+
 
 ''' HELPER FUNCTIONS '''
 
@@ -113,16 +263,20 @@ def get_params_port(params: dict = demisto.params()) -> int:
     return port
 
 
-def refresh_edl_context(request_args: RequestArguments) -> str:
+def refresh_edl_context(request_args: RequestArguments, snapshot: IOCSnapshot = None) -> str:
     """
     Refresh the cache values and format using an indicator_query to call demisto.searchIndicators
 
     Parameters:
         request_args: Request arguments
+        snapshot: A snapshot of the IOCs of the query, which is synced instead of searching all the IOCs
 
     Returns: List(IoCs in output format)
     """
     now = datetime.now()
+    if snapshot:
+        return refresh_edl_context_from_snapshot(request_args, snapshot, now)
+
     # poll indicators into edl from demisto
     iocs = find_indicators_to_limit(request_args.query, request_args.limit, request_args.offset)
     out_dict, actual_indicator_amount = create_values_for_returned_dict(iocs, request_args)
@@ -147,10 +301,84 @@ def refresh_edl_context(request_args: RequestArguments) -> str:
 
     out_dict["last_run"] = date_to_timestamp(now)
     out_dict["current_iocs"] = iocs
-    demisto.setIntegrationContext(out_dict)
+    call_demisto(demisto.setIntegrationContext, out_dict)
+    return out_dict[EDL_VALUES_KEY]
+
+
+def refresh_edl_context_from_snapshot(request_args: RequestArguments, snapshot: IOCSnapshot, now: datetime) -> str:
+    """
+    Syncs a snapshot of the IOCs, and refreshes the cache values and format from it
+
+    Parameters:
+        request_args: Request arguments
+        snapshot: The snapshot of the IOCs of the query
+        now: The time of the refresh
+
+    Returns: List(IoCs in output format)
+    """
+    all_iocs = snapshot.sync(limit=request_args.offset + request_args.limit)
+    end = request_args.offset + request_args.limit
+    formatted_indicators, ip_indicators = format_indicators(all_iocs[request_args.offset:end], request_args)
+    collapsed_ips = ips_to_ranges(ip_indicators, request_args.collapse_ips) if ip_indicators else []
+
+    # take more IOCs from the snapshot in case formatting or ip collapse caused a lack in results. only the new IOCs
+    # are formatted, and their IPs are collapsed with the ranges which were already collapsed
+    while len(formatted_indicators) + len(collapsed_ips) < request_args.limit and end < len(all_iocs):
+        start = end
+        end += request_args.limit - len(formatted_indicators) - len(collapsed_ips)
+        new_formatted_indicators, new_ip_indicators = format_indicators(all_iocs[start:end], request_args)
+        formatted_indicators.extend(new_formatted_indicators)
+        if new_ip_indicators:
+            collapsed_ips = ips_to_ranges(collapsed_ips + new_ip_indicators, request_args.collapse_ips)
+
+    out_dict = {EDL_VALUES_KEY: list_to_str(formatted_indicators + collapsed_ips, '\n')}
+    out_dict["last_run"] = date_to_timestamp(now)
+    out_dict["current_iocs"] = all_iocs[request_args.offset:end]
+    call_demisto(demisto.setIntegrationContext, out_dict)
     return out_dict[EDL_VALUES_KEY]
 
 
+def search_indicators_with_cursor(indicator_query: str) -> Iterator[dict]:
+    """
+    Finds all the indicators of a query using demisto.searchIndicators, paging with the searchAfter cursor
+
+    Parameters:
+        indicator_query (str): Cortex XSOAR indicator query
+
+    Returns:
+        The indicators
+    """
+    search_after = None
+    while True:
+        res = call_demisto(demisto.searchIndicators, query=indicator_query, size=PAGE_SIZE, searchAfter=search_after)
+        iocs = res.get('iocs') or []
+        yield from iocs
+        search_after = res.get('searchAfter')
+        if len(iocs) < PAGE_SIZE or search_after is None:
+            break
+
+
+def parse_expiration(expiration: Optional[str]) -> Optional[datetime]:
+    """
+    Parses the expiration time of an IOC
+
+    Parameters:
+        expiration (str): The expiration of the IOC, in ISO format
+
+    Returns:
+        The expiration time in UTC, or None if the IOC does not expire
+    """
+    if not expiration or expiration.startswith('0001-01-01'):
+        return None
+    try:
+        expiration_time = datetime.fromisoformat(re.sub(r'(\.\d{6})\d*', r'\1', expiration.replace('Z', '+00:00')))
+    except ValueError:
+        return None
+    if expiration_time.tzinfo:
+        expiration_time = expiration_time.astimezone(timezone.utc).replace(tzinfo=None)
+    return expiration_time
+
+
 def find_indicators_to_limit(indicator_query: str, limit: int, offset: int = 0) -> list:
     """
     Finds indicators using demisto.searchIndicators
@@ -204,7 +432,8 @@ def find_indicators_to_limit_loop(indicator_query: str, limit: int, total_fetche
     if not last_found_len:
         last_found_len = total_fetched
     while last_found_len == PAGE_SIZE and limit and total_fetched < limit:
-        fetched_iocs = demisto.searchIndicators(query=indicator_query, page=next_page, size=PAGE_SIZE).get('iocs')
+        fetched_iocs = call_demisto(demisto.searchIndicators, query=indicator_query, page=next_page,
+                                    size=PAGE_SIZE).get('iocs')
         # In case the result from searchIndicators includes the key `iocs` but it's value is None
         fetched_iocs = fetched_iocs or []
         iocs.extend(fetched_iocs)
@@ -214,116 +443,28 @@ def find_indicators_to_limit_loop(indicator_query: str, limit: int, total_fetche
     return iocs, next_page
 
 
-def ip_groups_to_cidrs(ip_range_groups: list):
-    """Collapse ip groups list to CIDRs
-
-    Args:
-        ip_range_groups (list): a list of lists containing connected IPs
-
-    Returns:
-        list. a list of CIDRs.
-    """
-    ip_ranges = []  # type:List
-    for group in ip_range_groups:
-        # handle single ips
-        if len(group) == 1:
-            ip_ranges.append(str(group[0]))
-            continue
-
-        min_ip = group[0]
-        max_ip = group[-1]
-        moved_ip = False
-        # CIDR must begin with an even LSB
-        # if the first ip does not - separate it from the rest of the range
-        if (int(str(min_ip).split('.')[-1]) % 2) != 0:
-            ip_ranges.append(str(min_ip))
-            min_ip = group[1]
-            moved_ip = True
-
-        # CIDR must end with uneven LSB
-        # if the last ip does not - separate it from the rest of the range
-        if (int(str(max_ip).split('.')[-1]) % 2) == 0:
-            ip_ranges.append(str(max_ip))
-            max_ip = group[-2]
-            moved_ip = True
-
-        # if both min and max ips were shifted and there are only 2 ips in the range
-        # we added both ips by the shift and now we move to the next  range
-        if moved_ip and len(group) == 2:
-            continue
-
-        else:
-            ip_ranges.append(str(iprange_to_cidrs(min_ip, max_ip)[0].cidr))
-
-    return ip_ranges
-
-
-def ip_groups_to_ranges(ip_range_groups: list):
-    """Collapse ip groups list to ranges.
-
-    Args:
-        ip_range_groups (list): a list of lists containing connected IPs
-
-    Returns:
-        list. a list of Ranges.
-    """
-    ip_ranges = []  # type:List
-    for group in ip_range_groups:
-        # handle single ips
-        if len(group) == 1:
-            ip_ranges.append(str(group[0]))
-            continue
-
-        min_ip = group[0]
-        max_ip = group[-1]
-        ip_ranges.append(str(min_ip) + "-" + str(max_ip))
-
-    return ip_ranges
-
-
 def ips_to_ranges(ips: list, collapse_ips):
     """Collapse IPs to Ranges or CIDRs.
 
     Args:
-        ips (list): a list of IP strings.
+        ips (list): a list of IP, CIDR and IP range strings.
         collapse_ips (str): Whether to collapse to Ranges or CIDRs.
 
     Returns:
         list. a list to Ranges or CIDRs.
     """
-    ips_range_groups = []  # type:List
-    ips = sorted(ips)
-
-    if len(ips) > 0:
-        ips_range_groups.append([ips[0]])
-
-    if len(ips) > 1:
-        for ip in ips[1:]:
-            appended = False
-
-            for group in ips_range_groups:
-                if IPAddress(int(ip) + 1) in group or IPAddress(int(ip) - 1) in group:
-                    group.append(ip)
-                    sorted(group)
-                    appended = True
-
-            if not appended:
-                ips_range_groups.append([ip])
-
-    if collapse_ips == COLLAPSE_TO_RANGES:
-        return ip_groups_to_ranges(ips_range_groups)
-
-    else:
-        return ip_groups_to_cidrs(ips_range_groups)
+    return collapse_ip_indicators(ips, to_cidrs=collapse_ips == COLLAPSE_TO_CIDR)
 
 
-def create_values_for_returned_dict(iocs: list, request_args: RequestArguments) -> Tuple[dict, int]:
+def format_indicators(iocs: list, request_args: RequestArguments) -> Tuple[list, list]:
     """
-    Create a dictionary for output values
+    Formats IOCs to output values
+
+    Returns:
+        The formatted values, and the IP values which should be collapsed
     """
     formatted_indicators = []
-    ipv4_formatted_indicators = []
-    ipv6_formatted_indicators = []
+    ip_indicators = []
     for ioc in iocs:
         indicator = ioc.get('value')
         if not indicator:
@@ -355,29 +496,29 @@ def create_values_for_returned_dict(iocs: list, request_args: RequestArguments)
         if indicator.startswith('*.'):
             formatted_indicators.append(indicator.lstrip('*.'))
 
-        if request_args.collapse_ips != DONT_COLLAPSE and ioc_type == 'IP':
-            ipv4_formatted_indicators.append(IPAddress(indicator))
-
-        elif request_args.collapse_ips != DONT_COLLAPSE and ioc_type == 'IPv6':
-            ipv6_formatted_indicators.append(IPAddress(indicator))
+        if request_args.collapse_ips != DONT_COLLAPSE and ioc_type in IP_INDICATOR_TYPES:
+            ip_indicators.append(indicator)
 
         else:
             formatted_indicators.append(indicator)
+    return formatted_indicators, ip_indicators
 
-    if len(ipv4_formatted_indicators) > 0:
-        ipv4_formatted_indicators = ips_to_ranges(ipv4_formatted_indicators, request_args.collapse_ips)
-        formatted_indicators.extend(ipv4_formatted_indicators)
 
-    if len(ipv6_formatted_indicators) > 0:
-        ipv6_formatted_indicators = ips_to_ranges(ipv6_formatted_indicators, request_args.collapse_ips)
-        formatted_indicators.extend(ipv6_formatted_indicators)
+def create_values_for_returned_dict(iocs: list, request_args: RequestArguments) -> Tuple[dict, int]:
+    """
+    Create a dictionary for output values
+    """
+    formatted_indicators, ip_indicators = format_indicators(iocs, request_args)
+    if len(ip_indicators) > 0:
+        formatted_indicators.extend(ips_to_ranges(ip_indicators, request_args.collapse_ips))
     return {EDL_VALUES_KEY: list_to_str(formatted_indicators, '\n')}, len(formatted_indicators)
 
 
 def get_edl_ioc_values(on_demand: bool,
                        request_args: RequestArguments,
                        integration_context: dict,
-                       cache_refresh_rate: str = None) -> str:
+                       cache_refresh_rate: str = None,
+                       outputs_cache: OutputsCache = None) -> str:
     """
     Get the ioc list to return in the edl
 
@@ -386,6 +527,7 @@ def get_edl_ioc_values(on_demand: bool,
         request_args: the request arguments
         integration_context: The integration context
         cache_refresh_rate: The cache_refresh_rate configuration value
+        outputs_cache: The cache of the outputs of recent request arguments, if used
 
     Returns:
         string representation of the iocs
@@ -393,7 +535,18 @@ def get_edl_ioc_values(on_demand: bool,
     last_run = integration_context.get('last_run')
     last_query = integration_context.get('last_query')
     current_iocs = integration_context.get('current_iocs')
-
+    cache_time = None
+    if not on_demand and (last_run or outputs_cache is not None):
+        cache_time, _ = parse_date_range(cache_refresh_rate, to_timestamp=True)
+
+    if outputs_cache is not None:
+        cached_values, version = outputs_cache.get(request_args)
+        # on demand outputs are valid until the IOCs are updated, and other outputs until the cache refresh time
+        if cached_values is not None and (version == last_run if on_demand else version > cache_time):
+            return cached_values
+
+    # the version of the IOCs of the output
+    version = last_run
     # on_demand ignores cache
     if on_demand:
         if request_args.is_request_change(integration_context):
@@ -402,15 +555,15 @@ def get_edl_ioc_values(on_demand: bool,
         else:
             values_str = get_ioc_values_str_from_context(integration_context, request_args=request_args)
     else:
-        if last_run:
-            cache_time, _ = parse_date_range(cache_refresh_rate, to_timestamp=True)
-            if last_run <= cache_time or request_args.is_request_change(integration_context) or \
-                    request_args.query != last_query:
-                values_str = refresh_edl_context(request_args)
-            else:
-                values_str = get_ioc_values_str_from_context(integration_context, request_args=request_args)
-        else:
+        if not last_run or last_run <= cache_time or request_args.is_request_change(integration_context) or \
+                request_args.query != last_query:
+            version = date_to_timestamp(datetime.now())
             values_str = refresh_edl_context(request_args)
+        else:
+            values_str = get_ioc_values_str_from_context(integration_context, request_args=request_args)
+
+    if outputs_cache is not None:
+        outputs_cache.set(request_args, values_str, version)
     return values_str
 
 
@@ -434,7 +587,7 @@ def get_ioc_values_str_from_context(integration_context: dict,
         iocs = iocs[request_args.offset: request_args.limit + request_args.offset]
         returned_dict, _ = create_values_for_returned_dict(iocs, request_args=request_args)
         integration_context['last_output'] = returned_dict
-        demisto.setIntegrationContext(integration_context)
+        call_demisto(demisto.setIntegrationContext, integration_context)
 
     else:
         returned_dict = integration_context.get('last_output', {})
@@ -475,6 +628,129 @@ def validate_basic_authentication(headers: dict, username: str, password: str) -
     return user == username and pwd == password
 
 
+def build_edl_response(values: str, compress: bool = True) -> EDLResponse:
+    """
+    Precomputes the response of an EDL
+
+    Args:
+        values: The EDL values
+        compress: Whether to precompute the gzip compressed body
+
+    Returns:
+        The EDL response
+    """
+    body = values.encode('utf-8')
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    return EDLResponse(body, etag, gzip.compress(body) if compress else None)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Checks whether an If-None-Match header matches an ETag
+    """
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
+def create_edl_response(edl_response: EDLResponse, headers) -> Response:
+    """
+    Creates the HTTP response of an EDL. The body is compressed if the client accepts gzip, and a 304 response
+    without a body is returned if the client already has the EDL.
+
+    Args:
+        edl_response: The precomputed EDL response
+        headers: The headers of the http request
+
+    Returns:
+        The flask response
+    """
+    use_gzip = edl_response.gzip_body is not None and accepts_gzip(headers)
+    # the compressed body is a different representation, so it has its own ETag
+    etag = f'{edl_response.etag[:-1]}-gzip"' if use_gzip else edl_response.etag
+    response_headers = {'ETag': etag, 'Vary': 'Accept-Encoding'}
+    if etag_matches(headers.get('If-None-Match', ''), etag):
+        return Response(status=304, headers=response_headers)
+
+    if use_gzip:
+        response_headers['Content-Encoding'] = 'gzip'
+    return Response(edl_response.gzip_body if use_gzip else edl_response.body, status=200, mimetype='text/plain',
+                    headers=response_headers)
+
+
+def refresh_edl_response(params: dict):
+    """
+    Refreshes the EDL with the default request arguments, and replaces the precomputed response with it
+
+    Args:
+        params: Integration configuration parameters
+    """
+    global EDL_PRECOMPUTED_RESPONSE, EDL_IOC_SNAPSHOT
+    request_args = get_request_args({}, params)
+    if not EDL_IOC_SNAPSHOT or EDL_IOC_SNAPSHOT.query != request_args.query:
+        EDL_IOC_SNAPSHOT = IOCSnapshot(request_args.query)
+    values = refresh_edl_context(request_args, snapshot=EDL_IOC_SNAPSHOT)
+    edl_response = build_edl_response(values)
+    with EDL_RESPONSE_LOCK:
+        EDL_PRECOMPUTED_RESPONSE = edl_response
+        EDL_REFRESHED.set()
+
+
+def get_precomputed_response(timeout: float) -> Optional[EDLResponse]:
+    """
+    Gets the precomputed EDL response, and waits for the first refresh without blocking the gevent hub if needed
+
+    Args:
+        timeout: The seconds to wait for the first refresh
+
+    Returns:
+        The precomputed EDL response, or None if the first refresh did not finish in time
+    """
+    deadline = time.time() + timeout
+    while not EDL_REFRESHED.is_set() and time.time() < deadline:
+        gevent.sleep(0.1)
+    with EDL_RESPONSE_LOCK:
+        return EDL_PRECOMPUTED_RESPONSE
+
+
+def edl_refresh_loop(params: dict, refresh_interval: float):
+    """
+    Refreshes the precomputed EDL response every refresh interval, and retries sooner when a refresh fails
+
+    Args:
+        params: Integration configuration parameters
+        refresh_interval: The seconds between refreshes
+    """
+    while not EDL_REFRESHER_STOP.is_set():
+        try:
+            refresh_edl_response(params)
+            wait = refresh_interval
+        except Exception as e:
+            call_demisto(demisto.error, f'Failed to refresh the EDL: {str(e)}')
+            wait = min(refresh_interval, EDL_REFRESH_RETRY_SECONDS)
+        EDL_REFRESHER_STOP.wait(wait)
+
+
+def start_edl_refresher(params: dict) -> threading.Thread:
+    """
+    Starts a background thread which refreshes the precomputed EDL response every cache refresh rate, so requests
+    are served from memory instead of waiting for the indicators to be searched and formatted.
+    The gevent hub of the server is not monkey patched, so the refresher runs in a thread of its own, where its
+    demisto calls, formatting and compression do not block the requests.
+
+    Args:
+        params: Integration configuration parameters
+
+    Returns:
+        The refresher thread
+    """
+    start, end = parse_date_range(params.get('cache_refresh_rate'), to_timestamp=True)
+    refresh_interval = max((end - start) / 1000, 1)
+    EDL_REFRESHER_STOP.clear()
+    refresher = threading.Thread(target=edl_refresh_loop, args=(params, refresh_interval), daemon=True)
+    refresher.start()
+    return refresher
+
+
 ''' ROUTE FUNCTIONS '''
 
 
@@ -492,18 +768,26 @@ def route_edl_values() -> Response:
         headers: dict = cast(Dict[Any, Any], request.headers)
         if not validate_basic_authentication(headers, username, password):
             err_msg: str = 'Basic authentication failed. Make sure you are using the right credentials.'
-            demisto.debug(err_msg)
+            call_demisto(demisto.debug, err_msg)
             return Response(err_msg, status=401)
 
-    request_args = get_request_args(request.args, params)
+    if not request.args and not params.get('on_demand'):
+        # the refresher swaps in a new response when a refresh finishes, so the last one is always complete
+        edl_response = get_precomputed_response(EDL_FIRST_REFRESH_TIMEOUT)
+        if not edl_response:
+            return Response('The EDL is being refreshed. Please try again later.', status=503,
+                            headers={'Retry-After': str(EDL_FIRST_REFRESH_TIMEOUT)})
+        return create_edl_response(edl_response, request.headers)
 
+    request_args = get_request_args(request.args, params)
     values = get_edl_ioc_values(
         on_demand=params.get('on_demand'),
         request_args=request_args,
-        integration_context=demisto.getIntegrationContext(),
+        integration_context=call_demisto(demisto.getIntegrationContext),
         cache_refresh_rate=params.get('cache_refresh_rate'),
+        outputs_cache=OUTPUTS_CACHE,
     )
-    return Response(values, status=200, mimetype='text/plain')
+    return create_edl_response(build_edl_response(values, compress=accepts_gzip(request.headers)), request.headers)
 
 
 def get_request_args(request_args: dict, params: dict) -> RequestArguments:
@@ -623,6 +907,8 @@ def run_long_running(params, is_test=False):
             time.sleep(5)
             server_process.terminate()
         else:
+            if not params.get('on_demand'):
+                start_edl_refresher(params)
             server.serve_forever()
     except SSLError as e:
         ssl_err_message = f'Failed to validate certificate and/or private key: {str(e)}'
@@ -692,5 +978,8 @@ def main():
         return_error(err_msg)
 
 
+from IPRangesApiModule import *  # noqa: E402
+
+
 if __name__ in ['__main__', '__builtin__', 'builtins']:
     main()
@@ -1,6 +1,7 @@
 """Imports"""
 import json
 import pytest
+import threading
 import demistomock as demisto
 from netaddr import IPAddress
 
@@ -272,3 +273,366 @@ class TestHelperFunctions:
         assert "1.1.1.3" not in ip_range_list
         assert "2.2.2.2" in ip_range_list
         assert "25.24.23.22" in ip_range_list
+
+    @pytest.mark.ips_to_cidrs
+    def test_create_values_for_returned_dict_collapses_cidrs(self):
+        from EDL import create_values_for_returned_dict, EDL_VALUES_KEY, RequestArguments, COLLAPSE_TO_CIDR
+        iocs = [{'value': '10.0.0.0/25', 'indicator_type': 'CIDR'}, {'value': '10.0.0.200', 'indicator_type': 'IP'},
+                {'value': '10.0.0.128/26', 'indicator_type': 'CIDR'}, {'value': '10.0.0.255', 'indicator_type': 'IP'},
+                {'value': '10.0.0.192/27', 'indicator_type': 'CIDR'}, {'value': '2001:db8::1', 'indicator_type': 'IPv6'},
+                {'value': '10.0.0.224/28', 'indicator_type': 'CIDR'}, {'value': '10.0.0.240/29', 'indicator_type': 'CIDR'},
+                {'value': '10.0.0.248-10.0.0.254', 'indicator_type': 'IP'}, {'value': 'demisto.com', 'indicator_type': 'Domain'}]
+        request_args = RequestArguments(query='', collapse_ips=COLLAPSE_TO_CIDR)
+        returned_dict, num_of_indicators = create_values_for_returned_dict(iocs, request_args)
+        assert returned_dict.get(EDL_VALUES_KEY) == 'demisto.com\n10.0.0.0/24\n2001:db8::1'
+        assert num_of_indicators == 3
+
+
+class TestPrecomputedResponse:
+    def test_create_edl_response(self):
+        import gzip
+        from EDL import build_edl_response, create_edl_response
+        edl_response = build_edl_response('1.1.1.1\n2.2.2.2')
+
+        response = create_edl_response(edl_response, {})
+        assert response.status_code == 200
+        assert response.get_data() == b'1.1.1.1\n2.2.2.2'
+        etag = response.headers['ETag']
+        assert create_edl_response(edl_response, {'If-None-Match': etag}).status_code == 304
+
+        response = create_edl_response(edl_response, {'Accept-Encoding': 'gzip, deflate'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.get_data()) == b'1.1.1.1\n2.2.2.2'
+        assert response.headers['ETag'] != etag
+        gzip_headers = {'Accept-Encoding': 'gzip', 'If-None-Match': f'"other", {response.headers["ETag"]}'}
+        assert create_edl_response(edl_response, gzip_headers).status_code == 304
+
+    def test_route_edl_values_from_precomputed_response(self, mocker):
+        """
+        Given
+        - An EDL which was refreshed by the background refresher.
+
+        When
+        - Requesting the EDL with the default request arguments, and with an argument.
+
+        Then
+        - Ensure the default EDL is served from memory, without searching indicators, and the other one is not.
+        """
+        import EDL as edl
+        params = {'indicators_query': 'type:IP', 'edl_size': '10', 'cache_refresh_rate': '1 minute'}
+        mocker.patch.object(demisto, 'params', return_value=params)
+        mocker.patch.object(demisto, 'getIntegrationContext', return_value={})
+        mocker.patch.object(demisto, 'setIntegrationContext')
+        find_indicators = mocker.patch.object(
+            edl, 'find_indicators_to_limit',
+            side_effect=lambda query, limit, offset=0: [] if offset else [{'value': '1.1.1.1', 'indicator_type': 'IP'}])
+        search_indicators = mocker.patch.object(
+            demisto, 'searchIndicators', return_value={'iocs': [{'value': '1.1.1.1', 'indicator_type': 'IP'}]})
+        mocker.patch.object(edl, 'EDL_PRECOMPUTED_RESPONSE', None)
+        mocker.patch.object(edl, 'EDL_REFRESHED', threading.Event())
+        mocker.patch.object(edl, 'EDL_IOC_SNAPSHOT', None)
+        edl.refresh_edl_response(params)
+        assert search_indicators.call_count == 1
+        refresh_calls = find_indicators.call_count
+
+        client = edl.APP.test_client()
+        response = client.get('/')
+        assert response.status_code == 200
+        assert response.get_data() == b'1.1.1.1'
+        assert client.get('/', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+        assert find_indicators.call_count == refresh_calls
+
+        assert client.get('/?n=5').get_data() == b'1.1.1.1'
+        assert find_indicators.call_count > refresh_calls
+
+    def test_route_edl_values_waits_for_refresher(self, mocker):
+        """
+        Given
+        - A background refresher which was started, and did not refresh the EDL yet.
+
+        When
+        - Requesting the EDL with the default request arguments.
+
+        Then
+        - Ensure the request waits for the refresher thread and is served its response.
+        - Ensure the request is answered that the EDL is not ready if the first refresh does not finish in time.
+        """
+        import EDL as edl
+        params = {'indicators_query': 'type:IP', 'edl_size': '10', 'cache_refresh_rate': '1 minute'}
+        mocker.patch.object(demisto, 'params', return_value=params)
+        mocker.patch.object(edl, 'refresh_edl_context', return_value='1.1.1.1')
+        mocker.patch.object(edl, 'EDL_PRECOMPUTED_RESPONSE', None)
+        mocker.patch.object(edl, 'EDL_REFRESHED', threading.Event())
+        mocker.patch.object(edl, 'EDL_FIRST_REFRESH_TIMEOUT', 0)
+        client = edl.APP.test_client()
+        assert client.get('/').status_code == 503
+
+        mocker.patch.object(edl, 'EDL_FIRST_REFRESH_TIMEOUT', 5)
+        refresher = edl.start_edl_refresher(params)
+        try:
+            assert client.get('/').get_data() == b'1.1.1.1'
+        finally:
+            edl.EDL_REFRESHER_STOP.set()
+            refresher.join(5)
+        assert not refresher.is_alive()
+
+    def test_server_answers_while_refresh_is_blocked(self, mocker):
+        """
+        Given
+        - A running EDL server, with a precomputed response.
+
+        When
+        - The background refresher is blocked in a search of indicators.
+
+        Then
+        - Ensure the server answers requests from the precomputed response while the refresh is blocked.
+        - Ensure the refreshed response replaces it once the search returns.
+        """
+        import gevent
+        import requests
+        import EDL as edl
+        from gevent.pywsgi import WSGIServer
+        params = {'indicators_query': 'type:IP', 'edl_size': '10', 'cache_refresh_rate': '1 minute'}
+        mocker.patch.object(demisto, 'params', return_value=params)
+        mocker.patch.object(demisto, 'setIntegrationContext')
+        blocked, release = threading.Event(), threading.Event()
+
+        def search_indicators(**kwargs):
+            blocked.set()
+            release.wait(10)
+            return {'iocs': [{'value': '2.2.2.2', 'indicator_type': 'IP'}]}
+
+        mocker.patch.object(demisto, 'searchIndicators', side_effect=search_indicators)
+        mocker.patch.object(edl, 'EDL_PRECOMPUTED_RESPONSE', edl.build_edl_response('1.1.1.1'))
+        mocker.patch.object(edl, 'EDL_REFRESHED', threading.Event())
+        mocker.patch.object(edl, 'EDL_IOC_SNAPSHOT', None)
+        edl.EDL_REFRESHED.set()
+
+        server = WSGIServer(('127.0.0.1', 0), edl.APP, log=None)
+        server.start()
+        responses = []
+
+        def get_edl():
+            blocked.wait(10)
+            responses.append(requests.get(f'http://127.0.0.1:{server.server_port}/', timeout=5).content)
+            release.set()
+
+        client = threading.Thread(target=get_edl)
+        refresher = edl.start_edl_refresher(params)
+        client.start()
+        try:
+            while client.is_alive():
+                gevent.sleep(0.05)
+            for _ in range(100):
+                if edl.EDL_PRECOMPUTED_RESPONSE.body != b'1.1.1.1':
+                    break
+                gevent.sleep(0.05)
+        finally:
+            release.set()
+            edl.EDL_REFRESHER_STOP.set()
+            refresher.join(5)
+            server.stop()
+        assert responses == [b'1.1.1.1']
+        assert edl.EDL_PRECOMPUTED_RESPONSE.body == b'2.2.2.2'
+
+
+class TestOutputsCache:
+    def test_outputs_cache_lru(self):
+        from EDL import OutputsCache, RequestArguments
+        cache = OutputsCache(max_size=2)
+        first, second, third = (RequestArguments(query='', limit=limit) for limit in (1, 2, 3))
+        cache.set(first, 'first', 1)
+        cache.set(second, 'second', 1)
+        assert cache.get(first) == ('first', 1)
+        cache.set(third, 'third', 1)
+        assert cache.get(second) == (None, None)
+        assert cache.get(first) == ('first', 1)
+        assert cache.get(RequestArguments(query='', limit=3, url_port_stripping='true')) == (None, None)
+        assert cache.get(RequestArguments(query='', limit=3, drop_invalids='False')) == ('third', 1)
+
+    def test_get_edl_ioc_values_alternating_request_args(self, mocker):
+        """
+        Given
+        - Two clients which poll the EDL with different request arguments.
+
+        When
+        - The clients poll alternately, and then the cache refresh time passes.
+
+        Then
+        - Ensure each output is created once until the refresh time passes, and then created again.
+        """
+        import EDL as edl
+        integration_context: dict = {}
+        mocker.patch.object(edl, 'parse_date_range', return_value=(1000, 0))
+        refresh = mocker.patch.object(edl, 'refresh_edl_context', side_effect=lambda request_args: str(request_args.limit))
+        mocker.patch.object(edl, 'date_to_timestamp', return_value=2000)
+        cache = edl.OutputsCache()
+        devices = [edl.RequestArguments(query='type:IP', limit=limit) for limit in (10, 20)]
+        for _ in range(3):
+            for request_args in devices:
+                values = edl.get_edl_ioc_values(False, request_args, integration_context, '1 minute', cache)
+                assert values == str(request_args.limit)
+        assert refresh.call_count == 2
+
+        mocker.patch.object(edl, 'parse_date_range', return_value=(2000, 0))
+        edl.get_edl_ioc_values(False, devices[0], integration_context, '1 minute', cache)
+        assert refresh.call_count == 3
+
+
+class TestIOCSnapshot:
+    @staticmethod
+    def mock_search_indicators(mocker, pages):
+        def search_indicators(query, size, searchAfter=None):
+            return pages[query][searchAfter or 0]
+        return mocker.patch.object(demisto, 'searchIndicators', side_effect=search_indicators)
+
+    def test_search_indicators_with_cursor(self, mocker):
+        """
+        Given
+        - Indicators which are returned in two pages.
+
+        When
+        - Searching the indicators with the searchAfter cursor.
+
+        Then
+        - Ensure all the indicators are returned, and the cursor of the first page is used to get the second one.
+        """
+        import EDL as edl
+        mocker.patch.object(edl, 'PAGE_SIZE', 2)
+        search_indicators = self.mock_search_indicators(mocker, {'type:IP': {
+            0: {'iocs': [{'value': '1.1.1.1'}, {'value': '2.2.2.2'}], 'searchAfter': 'cursor'},
+            'cursor': {'iocs': [{'value': '3.3.3.3'}], 'searchAfter': 'next'},
+        }})
+        iocs = edl.search_indicators_with_cursor('type:IP')
+        assert [ioc['value'] for ioc in iocs] == ['1.1.1.1', '2.2.2.2', '3.3.3.3']
+        assert [call[1]['searchAfter'] for call in search_indicators.call_args_list] == [None, 'cursor']
+
+    def test_sync(self, mocker):
+        """
+        Given
+        - A snapshot of the IOCs of an active IOCs query.
+
+        When
+        - Syncing it after an IOC was modified, an IOC stopped matching the query and an IOC expired.
+
+        Then
+        - Ensure only the modified IOCs of the query are searched, and the snapshot is updated accordingly.
+        - Ensure the next full sync searches all the IOCs of the query again, and removes the IOC which no longer
+         matches it.
+        """
+        import EDL as edl
+        query = 'type:IP and expirationStatus:active'
+        iocs = [{'value': '1.1.1.1', 'indicator_type': 'IP', 'expiration': '0001-01-01T00:00:00Z'},
+                {'value': '2.2.2.2', 'indicator_type': 'IP', 'expiration': '2100-01-01T00:00:00.123456789+02:00'},
+                {'value': '3.3.3.3', 'indicator_type': 'IP', 'expiration': '2000-01-01T00:00:00Z'}]
+        search_indicators = self.mock_search_indicators(mocker, {query: {0: {'iocs': iocs}}})
+        snapshot = edl.IOCSnapshot(query)
+        snapshot._remove_expired = False
+        assert [ioc['value'] for ioc in snapshot.sync()] == ['1.1.1.1', '2.2.2.2', '3.3.3.3']
+
+        snapshot = edl.IOCSnapshot(query)
+        assert [ioc['value'] for ioc in snapshot.sync()] == ['1.1.1.1', '2.2.2.2']
+        assert snapshot.iocs['2.2.2.2'] == {'value': '2.2.2.2', 'indicator_type': 'IP'}
+
+        modified_query = f'modified:>="{snapshot.last_sync.strftime(edl.DEMISTO_TIME_FORMAT)}"'
+        search_indicators = self.mock_search_indicators(mocker, {
+            f'{modified_query} and ({query})': {0: {'iocs': [{'value': '4.4.4.4', 'indicator_type': 'IP'}]}},
+        })
+        assert [ioc['value'] for ioc in snapshot.sync()] == ['1.1.1.1', '2.2.2.2', '4.4.4.4']
+        assert search_indicators.call_count == 1
+
+        snapshot.full_sync_interval = 0
+        search_indicators = self.mock_search_indicators(mocker, {query: {0: {'iocs': iocs[1:] + [
+            {'value': '4.4.4.4', 'indicator_type': 'IP'}]}}})
+        assert [ioc['value'] for ioc in snapshot.sync()] == ['2.2.2.2', '4.4.4.4']
+        assert search_indicators.call_count == 1
+
+    def test_sync_new_iocs_past_limit(self, mocker):
+        """
+        Given
+        - A snapshot which holds more IOCs than the EDL takes.
+
+        When
+        - Syncing it after an IOC was modified, and after a new IOC was added, which the search returns first.
+
+        Then
+        - Ensure the modified IOC is synced incrementally and keeps its place.
+        - Ensure the new IOC triggers a full sync, so it is taken by the EDL in the order of the search.
+        """
+        import EDL as edl
+        query = 'type:IP'
+        iocs = [{'value': f'1.1.1.{i}', 'indicator_type': 'IP'} for i in range(1, 5)]
+        self.mock_search_indicators(mocker, {query: {0: {'iocs': iocs}}})
+        snapshot = edl.IOCSnapshot(query)
+        assert [ioc['value'] for ioc in snapshot.sync(limit=2)] == ['1.1.1.1', '1.1.1.2', '1.1.1.3', '1.1.1.4']
+        last_full_sync = snapshot.last_full_sync
+
+        modified_query = f'modified:>="{snapshot.last_sync.strftime(edl.DEMISTO_TIME_FORMAT)}" and ({query})'
+        search_indicators = self.mock_search_indicators(mocker, {modified_query: {0: {'iocs': iocs[3:]}}})
+        assert [ioc['value'] for ioc in snapshot.sync(limit=2)] == ['1.1.1.1', '1.1.1.2', '1.1.1.3', '1.1.1.4']
+        assert search_indicators.call_count == 1
+        assert snapshot.last_full_sync == last_full_sync
+
+        new_ioc = {'value': '2.2.2.2', 'indicator_type': 'IP'}
+        modified_query = f'modified:>="{snapshot.last_sync.strftime(edl.DEMISTO_TIME_FORMAT)}" and ({query})'
+        search_indicators = self.mock_search_indicators(mocker, {modified_query: {0: {'iocs': [new_ioc]}},
+                                                                 query: {0: {'iocs': [new_ioc] + iocs}}})
+        assert [ioc['value'] for ioc in snapshot.sync(limit=2)][:2] == ['2.2.2.2', '1.1.1.1']
+        assert search_indicators.call_count == 2
+        assert snapshot.last_full_sync > last_full_sync
+
+    def test_refresh_edl_context_from_snapshot(self, mocker):
+        """
+        Given
+        - A snapshot of IPs, where the first ones are collapsed to a single range.
+
+        When
+        - Refreshing the EDL from it, with a limit.
+
+        Then
+        - Ensure more IOCs are taken from the snapshot to fill the limit, without searching the IOCs again.
+        """
+        import EDL as edl
+        iocs = [{'value': f'1.1.1.{i}', 'indicator_type': 'IP'} for i in range(1, 5)] + \
+            [{'value': '2.2.2.2', 'indicator_type': 'IP'}, {'value': '3.3.3.3', 'indicator_type': 'IP'}]
+        search_indicators = self.mock_search_indicators(mocker, {'type:IP': {0: {'iocs': iocs}}})
+        mocker.patch.object(demisto, 'setIntegrationContext')
+        request_args = edl.RequestArguments('type:IP', limit=3, collapse_ips=edl.COLLAPSE_TO_RANGES)
+        values = edl.refresh_edl_context(request_args, snapshot=edl.IOCSnapshot('type:IP'))
+        assert values == '1.1.1.1-1.1.1.4\n2.2.2.2\n3.3.3.3'
+        assert search_indicators.call_count == 1
+
+    @pytest.mark.parametrize('collapse_ips', ["Don't Collapse", 'To Ranges', 'To CIDRS'])
+    def test_refresh_edl_context_from_snapshot_formats_new_iocs(self, mocker, collapse_ips):
+        """
+        Given
+        - A snapshot of random IPs, URLs with ports and domains, some of which are collapsed or dropped.
+
+        When
+        - Refreshing the EDL from it, with a limit which requires taking more IOCs from the snapshot.
+
+        Then
+        - Ensure the output is the same as formatting all the taken IOCs at once, and the IOCs are formatted once.
+        """
+        import random
+        import EDL as edl
+        rand = random.Random(0)
+        iocs = []
+        for i in range(300):
+            kind = rand.choice(['IP', 'URL', 'Domain'])
+            if kind == 'IP':
+                iocs.append({'value': f'10.0.{rand.randint(0, 3)}.{rand.randint(0, 255)}', 'indicator_type': 'IP'})
+            elif kind == 'URL':
+                iocs.append({'value': f'www.site{i}.com:{rand.choice([80, 443])}/path', 'indicator_type': 'URL'})
+            else:
+                iocs.append({'value': f'*.domain{i}.com', 'indicator_type': 'Domain'})
+        self.mock_search_indicators(mocker, {'type:IP': {0: {'iocs': iocs}}})
+        set_context = mocker.patch.object(demisto, 'setIntegrationContext')
+        format_indicators = mocker.spy(edl, 'format_indicators')
+        request_args = edl.RequestArguments('type:IP', limit=100, offset=5, collapse_ips=collapse_ips)
+
+        values = edl.refresh_edl_context(request_args, snapshot=edl.IOCSnapshot('type:IP'))
+        taken_iocs = set_context.call_args[0][0]['current_iocs']
+        assert sum(len(call[0][0]) for call in format_indicators.call_args_list) == len(taken_iocs)
+        assert values == edl.create_values_for_returned_dict(taken_iocs, request_args)[0][edl.EDL_VALUES_KEY]
+        assert len(values.split('\n')) >= 100
@@ -898,7 +898,12 @@ def get_last_run():
     return last_run
 
 
-def fetch_last_emails(account, folder_name='Inbox', since_datetime=None, exclude_ids=None):
+def fetch_last_emails(account, folder_name='Inbox', since_datetime=None, exclude_ids=None, batch_size=MAX_FETCH):
+    """
+    Returns a generator of the emails received since the given time, in the order they were received.
+    The emails are listed with their ID and received time only, in server-side pages, and the full
+    emails are loaded in batches of batch_size, so only the emails which are consumed are loaded.
+    """
     qs = get_folder_by_path(account, folder_name, is_public=IS_PUBLIC_FOLDER)
     if since_datetime:
         qs = qs.filter(datetime_received__gte=since_datetime)
@@ -906,21 +911,38 @@ def fetch_last_emails(account, folder_name='Inbox', since_datetime=None, exclude
         if not FETCH_ALL_HISTORY:
             last_10_min = EWSDateTime.now(tz=EWSTimeZone.timezone('UTC')) - timedelta(minutes=10)
             qs = qs.filter(datetime_received__gte=last_10_min)
-    qs = qs.filter().only(*map(lambda x: x.name, Message.FIELDS))
+    qs = qs.filter().only('message_id', 'datetime_received')
     qs = qs.filter().order_by('datetime_received')
+    qs.page_size = max(batch_size, 1) * 2
 
-    result = qs.all()
+    exclude_ids = set(exclude_ids or [])
+    light_items = []  # type: list
     try:
-        result = [item for item in result if isinstance(item, Message)]
+        for item in qs.iterator():
+            if isinstance(item, Message) and item.message_id not in exclude_ids:
+                light_items.append(item)
+                if len(light_items) >= batch_size:
+                    for full_item in fetch_full_emails(account, light_items):
+                        yield full_item
+                    light_items = []
     except ValueError as exc:
         future_utils.raise_from(ValueError(
             'Got an error when pulling incidents. You might be using the wrong exchange version.'
         ), exc)
 
-    if exclude_ids and len(exclude_ids) > 0:
-        exclude_ids = set(exclude_ids)
-        result = [x for x in result if x.message_id not in exclude_ids]
-    return result
+    for full_item in fetch_full_emails(account, light_items):
+        yield full_item
+
+
+def fetch_full_emails(account, items):
+    """
+    Loads all the fields of the given emails, with a single request
+    """
+    if not items:
+        return []
+    full_items = account.fetch(ids=items, only_fields=[field.name for field in Message.FIELDS],
+                               chunk_size=len(items))
+    return [item for item in full_items if isinstance(item, Message)]
 
 
 def keys_to_camel_case(value):
@@ -18,3 +18,81 @@ def test_start_logging():
     EWSv2.start_logging()
     logging.getLogger().debug("test this")
     assert "test this" in EWSv2.log_stream.getvalue()
+
+
+class MockQuerySet(object):
+    def __init__(self, items):
+        self.items = items
+        self.only_fields = None
+        self.page_size = None
+        self.consumed = 0
+
+    def filter(self, *args, **kwargs):
+        return self
+
+    def only(self, *fields):
+        self.only_fields = fields
+        return self
+
+    def order_by(self, *fields):
+        return self
+
+    def iterator(self):
+        for item in self.items:
+            self.consumed += 1
+            yield item
+
+
+def test_fetch_last_emails_pages_and_loads_in_batches(mocker):
+    """
+    Given
+    - 10 emails since the last run, 2 of which were already fetched.
+
+    When
+    - Consuming the first 5 emails of the fetch, in batches of 3.
+
+    Then
+    - Ensure the emails are listed with their ID and received time only, in pages of twice the batch size.
+    - Ensure only the emails which were consumed, without the ones already fetched, are loaded in full.
+    """
+    from exchangelib.items import Message
+    light_items = [Message(message_id='id{}'.format(i)) for i in range(10)]
+    qs = MockQuerySet(light_items)
+    mocker.patch.object(EWSv2, 'get_folder_by_path', return_value=qs)
+    account = mocker.Mock()
+    account.fetch.side_effect = lambda ids, **kwargs: [Message(message_id=item.message_id, subject='full')
+                                                       for item in ids]
+
+    emails = EWSv2.fetch_last_emails(account, exclude_ids=['id0', 'id3'], batch_size=3)
+    consumed = [next(emails) for _ in range(5)]
+
+    assert qs.only_fields == ('message_id', 'datetime_received')
+    assert qs.page_size == 6
+    assert [email.message_id for email in consumed] == ['id1', 'id2', 'id4', 'id5', 'id6']
+    assert all(email.subject == 'full' for email in consumed)
+    assert [[item.message_id for item in call[1]['ids']] for call in account.fetch.call_args_list] == \
+        [['id1', 'id2', 'id4'], ['id5', 'id6', 'id7']]
+    assert qs.consumed == 8
+
+
+def test_fetch_last_emails_last_batch(mocker):
+    """
+    Given
+    - 4 emails since the last run, and a batch size of 3.
+
+    When
+    - Consuming all the emails of the fetch.
+
+    Then
+    - Ensure the emails which do not fill a batch are loaded in a last batch.
+    """
+    from exchangelib.items import Message
+    mocker.patch.object(EWSv2, 'get_folder_by_path',
+                        return_value=MockQuerySet([Message(message_id='id{}'.format(i)) for i in range(4)]))
+    account = mocker.Mock()
+    account.fetch.side_effect = lambda ids, **kwargs: list(ids)
+
+    emails = list(EWSv2.fetch_last_emails(account, batch_size=3))
+
+    assert [email.message_id for email in emails] == ['id0', 'id1', 'id2', 'id3']
+    assert account.fetch.call_count == 2
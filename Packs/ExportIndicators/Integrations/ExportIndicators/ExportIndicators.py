@@ -2,17 +2,20 @@ import demistomock as demisto
 from CommonServerPython import *
 from CommonServerUserPython import *
 
+from IndicatorsOutputsApiModule import *  # noqa: E402
+
 import re
 import json
+import zlib
+import itertools
 import traceback
 from base64 import b64decode
 from multiprocessing import Process
 from gevent.pywsgi import WSGIServer
 from tempfile import NamedTemporaryFile
 from flask import Flask, Response, request
-from netaddr import IPAddress, iprange_to_cidrs
 from ssl import SSLContext, SSLError, PROTOCOL_TLSv1_2
-from typing import Callable, List, Any, cast, Dict, Tuple
+from typing import Callable, List, Any, cast, Dict, Tuple, Optional, Iterable, Iterator
 
 
 class Handler:
@@ -27,7 +30,6 @@ PAGE_SIZE: int = 200
 DEMISTO_LOGGER: Handler = Handler()
 APP: Flask = Flask('demisto-export_iocs')
 CTX_VALUES_KEY: str = 'dmst_export_iocs_values'
-CTX_MIMETYPE_KEY: str = 'dmst_export_iocs_mimetype'
 
 FORMAT_CSV: str = 'csv'
 FORMAT_TEXT: str = 'text'
@@ -65,9 +67,12 @@ MIMETYPE_JSON: str = 'application/json'
 MIMETYPE_CSV: str = 'text/csv'
 MIMETYPE_TEXT: str = 'text/plain'
 
+STREAM_BUFFER_SIZE: int = 64 * 1024
+
 DONT_COLLAPSE = "Don't Collapse"
 COLLAPSE_TO_CIDR = "To CIDRs"
 COLLAPSE_TO_RANGES = "To Ranges"
+IP_INDICATOR_TYPES = ('IP', 'IPv6', 'CIDR', 'IPv6CIDR')
 
 _PROTOCOL_REMOVAL = re.compile(r'^(?:[a-z]+:)*//')
 _PORT_REMOVAL = re.compile(r'^([a-z0-9\-\.]+)(?:\:[0-9]+)*')
@@ -134,10 +139,35 @@ class RequestArguments:
 
         return False
 
+    def cache_key(self) -> tuple:
+        """
+        The normalized request arguments, which identify the output of the request in the outputs cache
+        """
+        return tuple((name, normalize_request_arg(value)) for name, value in sorted(vars(self).items()))
+
+
+OUTPUTS_CACHE: OutputsCache = OutputsCache()
+
 
 ''' HELPER FUNCTIONS '''
 
 
+def get_request_mimetype(request_args: RequestArguments) -> str:
+    """
+    Returns the mimetype of the output of the request arguments
+    """
+    if request_args.out_format == FORMAT_JSON:
+        return MIMETYPE_JSON
+
+    elif request_args.out_format in [FORMAT_CSV, FORMAT_XSOAR_CSV]:
+        return MIMETYPE_TEXT if request_args.csv_text else MIMETYPE_CSV
+
+    elif request_args.out_format in [FORMAT_JSON_SEQ, FORMAT_XSOAR_JSON_SEQ]:
+        return MIMETYPE_JSON_SEQ
+
+    return MIMETYPE_TEXT
+
+
 def list_to_str(inp_list: list, delimiter: str = ',', map_func: Callable = str) -> str:
     """
     Transforms a list to an str, with a custom delimiter between each list item
@@ -174,10 +204,20 @@ def refresh_outbound_context(request_args: RequestArguments) -> str:
     Refresh the cache values and format using an indicator_query to call demisto.searchIndicators
     Returns: List(IoCs in output format)
     """
+    iocs = refresh_outbound_iocs(request_args)
+    return ''.join(iter_formatted_values(iocs, request_args))
+
+
+def refresh_outbound_iocs(request_args: RequestArguments) -> list:
+    """
+    Refresh the IOCs snapshot in the integration context using an indicator_query to call demisto.searchIndicators.
+    Only the IOCs are kept in the integration context, and the output is formatted from them when it is requested.
+    Returns: List(IoCs)
+    """
     now = datetime.now()
     # poll indicators into list from demisto
     iocs = find_indicators_with_limit(request_args.query, request_args.limit, request_args.offset)
-    out_dict, actual_indicator_amount = create_values_for_returned_dict(iocs, request_args)
+    actual_indicator_amount = count_formatted_values(iocs, request_args)
 
     # if in CSV format - the "indicator" header
     if request_args.out_format in [FORMAT_CSV, FORMAT_XSOAR_CSV]:
@@ -199,30 +239,13 @@ def refresh_outbound_context(request_args: RequestArguments) -> str:
         # add the new results to the existing results
         iocs += new_iocs
 
-        # reformat the output
-        out_dict, actual_indicator_amount = create_values_for_returned_dict(iocs, request_args)
+        # recount the output
+        actual_indicator_amount = count_formatted_values(iocs, request_args)
 
         if request_args.out_format == FORMAT_CSV:
             actual_indicator_amount = actual_indicator_amount - 1
 
-    if request_args.out_format == FORMAT_JSON:
-        out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_JSON
-
-    elif request_args.out_format in [FORMAT_CSV, FORMAT_XSOAR_CSV]:
-        if request_args.csv_text:
-            out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_TEXT
-
-        else:
-            out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_CSV
-
-    elif request_args.out_format in [FORMAT_JSON_SEQ, FORMAT_XSOAR_JSON_SEQ]:
-        out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_JSON_SEQ
-
-    else:
-        out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_TEXT
-
     demisto.setIntegrationContext({
-        "last_output": out_dict,
         'last_run': date_to_timestamp(now),
         'last_limit': request_args.limit,
         'last_offset': request_args.offset,
@@ -237,7 +260,7 @@ def refresh_outbound_context(request_args: RequestArguments) -> str:
         'collapse_ips': request_args.collapse_ips,
         'csv_text': request_args.csv_text
     })
-    return out_dict[CTX_VALUES_KEY]
+    return iocs
 
 
 def find_indicators_with_limit(indicator_query: str, limit: int, offset: int) -> list:
@@ -281,117 +304,28 @@ def find_indicators_with_limit_loop(indicator_query: str, limit: int, total_fetc
     return iocs, next_page
 
 
-def ip_groups_to_cidrs(ip_range_groups: list):
-    """Collapse ip groups list to CIDRs
-
-    Args:
-        ip_range_groups (list): a list of lists containing connected IPs
-
-    Returns:
-        list. a list of CIDRs.
-    """
-    ip_ranges = []  # type:List
-    for group in ip_range_groups:
-        # handle single ips
-        if len(group) == 1:
-            ip_ranges.append(str(group[0]))
-            continue
-
-        min_ip = group[0]
-        max_ip = group[-1]
-        moved_ip = False
-        # CIDR must begin with an even LSB
-        # if the first ip does not - separate it from the rest of the range
-        if (int(str(min_ip).split('.')[-1]) % 2) != 0:
-            ip_ranges.append(str(min_ip))
-            min_ip = group[1]
-            moved_ip = True
-
-        # CIDR must end with uneven LSB
-        # if the last ip does not - separate it from the rest of the range
-        if (int(str(max_ip).split('.')[-1]) % 2) == 0:
-            ip_ranges.append(str(max_ip))
-            max_ip = group[-2]
-            moved_ip = True
-
-        # if both min and max ips were shifted and there are only 2 ips in the range
-        # we added both ips by the shift and now we move to the next  range
-        if moved_ip and len(group) == 2:
-            continue
-
-        else:
-            ip_ranges.append(str(iprange_to_cidrs(min_ip, max_ip)[0].cidr))
-
-    return ip_ranges
-
-
-def ip_groups_to_ranges(ip_range_groups: list):
-    """Collapse ip groups list to ranges
-
-    Args:
-        ip_range_groups (list): a list of lists containing connected IPs
-
-    Returns:
-        list. a list of Ranges.
-    """
-    ip_ranges = []  # type:List
-    for group in ip_range_groups:
-        # handle single ips
-        if len(group) == 1:
-            ip_ranges.append(str(group[0]))
-            continue
-
-        min_ip = group[0]
-        max_ip = group[-1]
-        ip_ranges.append(str(min_ip) + "-" + str(max_ip))
-
-    return ip_ranges
-
-
 def ips_to_ranges(ips: list, collapse_ips):
     """Collapse IPs to Ranges or CIDRs.
 
     Args:
-        ips (list): a list of IP strings.
+        ips (list): a list of IP, CIDR and IP range strings.
         collapse_ips (str): Whether to collapse to Ranges or CIDRs.
 
     Returns:
         list. a list to Ranges or CIDRs.
     """
-    ips_range_groups = []  # type:List
-    ips = sorted(ips)
-    if len(ips) > 0:
-        ips_range_groups.append([ips[0]])
-
-    if len(ips) > 1:
-        for ip in ips[1:]:
-            appended = False
-
-            if len(ips_range_groups) == 0:
-                ips_range_groups.append([ip])
-                continue
-
-            for group in ips_range_groups:
-                if IPAddress(int(ip) + 1) in group or IPAddress(int(ip) - 1) in group:
-                    group.append(ip)
-                    sorted(group)
-                    appended = True
-
-            if not appended:
-                ips_range_groups.append([ip])
-
-    for group in ips_range_groups:
-        sorted(group)
+    return collapse_ip_indicators(ips, to_cidrs=collapse_ips == COLLAPSE_TO_CIDR)
 
-    if collapse_ips == COLLAPSE_TO_RANGES:
-        return ip_groups_to_ranges(ips_range_groups)
 
-    else:
-        return ip_groups_to_cidrs(ips_range_groups)
+def join_chunks(chunks: Iterable[str], delimiter: str = '\n') -> Iterator[str]:
+    """
+    Yields the chunks with a delimiter between each chunk, so the yielded strings form the joined string
+    """
+    for i, chunk in enumerate(chunks):
+        yield chunk if i == 0 else delimiter + chunk
 
 
-def panos_url_formatting(iocs: list, drop_invalids: bool, strip_port: bool):
-    formatted_indicators = []  # type:List
+def iter_panos_url_lines(iocs: list, drop_invalids: bool, strip_port: bool) -> Iterator[str]:
     for indicator_data in iocs:
         # only format URLs and Domains
         indicator = indicator_data.get('value')
@@ -430,28 +364,34 @@ def panos_url_formatting(iocs: list, drop_invalids: bool, strip_port: bool):
 
             # for PAN-OS "*.domain.com" does not match "domain.com" - we should provide both
             if indicator.startswith('*.'):
-                formatted_indicators.append(indicator[2:])
+                yield indicator[2:]
+
+        yield indicator
 
-        formatted_indicators.append(indicator)
+
+def panos_url_formatting(iocs: list, drop_invalids: bool, strip_port: bool):
+    formatted_indicators = list(iter_panos_url_lines(iocs, drop_invalids, strip_port))
     return {CTX_VALUES_KEY: list_to_str(formatted_indicators, '\n')}, len(formatted_indicators)
 
 
-def create_json_out_format(iocs: list):
-    formatted_indicators = []  # type:List
-    for indicator_data in iocs:
-        json_format_indicator = json_format_single_indicator(indicator_data)
-        formatted_indicators.append(json_format_indicator)
+def iter_json_list(items: Iterable[dict]) -> Iterator[str]:
+    """
+    Yields a JSON list of the items, one item at a time
+    """
+    yield '['
+    yield from join_chunks((json.dumps(item) for item in items), ', ')
+    yield ']'
 
-    return {CTX_VALUES_KEY: json.dumps(formatted_indicators)}
+
+def create_json_out_format(iocs: list):
+    return {CTX_VALUES_KEY: ''.join(iter_json_list(json_format_single_indicator(ioc) for ioc in iocs))}
 
 
 def json_format_single_indicator(indicator: dict):
     json_format_indicator = {
-        "indicator": indicator.get("value")
+        "indicator": indicator.get("value"),
+        "value": {key: value for key, value in indicator.items() if key != 'value'}
     }
-    del indicator["value"]
-
-    json_format_indicator["value"] = indicator
     return json_format_indicator
 
 
@@ -465,11 +405,8 @@ def add_indicator_to_category(indicator, category, category_dict):
     return category_dict
 
 
-def create_proxysg_out_format(iocs: list, category_attribute: list, category_default='bc_category'):
-    formatted_indicators = ''
+def group_proxysg_categories(iocs: list, category_attribute: list, category_default='bc_category') -> dict:
     category_dict = {}  # type:Dict
-    num_of_returned_indicators = 0
-
     for indicator in iocs:
         if indicator.get('indicator_type') in ['URL', 'Domain', 'DomainGlob']:
             indicator_proxysg_category = indicator.get('proxysgcategory')
@@ -484,23 +421,35 @@ def create_proxysg_out_format(iocs: list, category_attribute: list, category_def
                 # if ProxySG Category is not set or does not exist in the category_attribute list
                 category_dict = add_indicator_to_category(indicator.get('value'), category_default, category_dict)
 
-    for category, indicator_list in category_dict.items():
-        sub_output_string = f"define category {category}\n"
-        sub_output_string += list_to_str(indicator_list, '\n')
-        sub_output_string += "\nend\n"
-        formatted_indicators += sub_output_string
-        num_of_returned_indicators = num_of_returned_indicators + len(indicator_list)
+    return category_dict
+
 
-    if len(formatted_indicators) == 0:
+def iter_proxysg_out_format(iocs: list, category_attribute: list, category_default='bc_category') -> Iterator[str]:
+    category_dict = group_proxysg_categories(iocs, category_attribute, category_default)
+    if len(category_dict) == 0:
         raise Exception(CTX_NO_URLS_IN_PROXYSG_FORMAT)
 
+    for category, indicator_list in category_dict.items():
+        yield f"define category {category}\n"
+        yield list_to_str(indicator_list, '\n')
+        yield "\nend\n"
+
+
+def create_proxysg_out_format(iocs: list, category_attribute: list, category_default='bc_category'):
+    formatted_indicators = ''.join(iter_proxysg_out_format(iocs, category_attribute, category_default))
+    num_of_returned_indicators = sum(
+        len(indicator_list)
+        for indicator_list in group_proxysg_categories(iocs, category_attribute, category_default).values())
     return {CTX_VALUES_KEY: formatted_indicators}, num_of_returned_indicators
 
 
-def create_mwg_out_format(iocs: list, mwg_type: str) -> dict:
-    formatted_indicators = []  # type:List
-    for indicator in iocs:
-        value = "\"" + indicator.get('value') + "\""
+def iter_mwg_out_format(iocs: list, mwg_type: str) -> Iterator[str]:
+    if isinstance(mwg_type, list):
+        mwg_type = mwg_type[0]
+
+    yield "type=" + mwg_type + "\n"
+
+    def format_indicator(indicator: dict) -> str:
         sources = indicator.get('sourceBrands')
         if sources:
             sources_string = "\"" + ','.join(sources) + "\""
@@ -508,143 +457,230 @@ def create_mwg_out_format(iocs: list, mwg_type: str) -> dict:
         else:
             sources_string = "\"from CORTEX XSOAR\""
 
-        formatted_indicators.append(value + " " + sources_string)
+        return "\"" + indicator.get('value') + "\" " + sources_string
 
-    string_formatted_indicators = list_to_str(formatted_indicators, '\n')
+    yield from join_chunks(format_indicator(indicator) for indicator in iocs)
 
-    if isinstance(mwg_type, list):
-        mwg_type = mwg_type[0]
 
-    string_formatted_indicators = "type=" + mwg_type + "\n" + string_formatted_indicators
+def create_mwg_out_format(iocs: list, mwg_type: str) -> dict:
+    return {CTX_VALUES_KEY: ''.join(iter_mwg_out_format(iocs, mwg_type))}
 
-    return {CTX_VALUES_KEY: string_formatted_indicators}
 
+def iter_lines_out_format(iocs: list, request_args: RequestArguments) -> Iterator[str]:
+    """
+    Yields the lines of the line based formats (text, csv, json-seq, XSOAR csv, XSOAR json-seq)
+    """
+    if request_args.out_format == FORMAT_XSOAR_CSV and len(iocs) > 0:  # add csv keys as first item
+        headers = list(iocs[0].keys())
+        yield list_to_str(headers)
 
-def create_values_for_returned_dict(iocs: list, request_args: RequestArguments) -> Tuple[dict, int]:
+    elif request_args.out_format == FORMAT_CSV and len(iocs) > 0:
+        yield 'indicator'
+
+    ip_indicators = []
+    for ioc in iocs:
+        value = ioc.get('value')
+        type = ioc.get('indicator_type')
+        if value:
+            if request_args.out_format in [FORMAT_TEXT, FORMAT_CSV]:
+                if type in IP_INDICATOR_TYPES and request_args.collapse_ips != DONT_COLLAPSE:
+                    ip_indicators.append(value)
+
+                else:
+                    yield value
+
+            elif request_args.out_format == FORMAT_XSOAR_JSON_SEQ:
+                yield json.dumps(ioc)
+
+            elif request_args.out_format == FORMAT_JSON_SEQ:
+                yield json.dumps(json_format_single_indicator(ioc))
+
+            elif request_args.out_format == FORMAT_XSOAR_CSV:
+                # wrap csv values with " to escape them
+                values = list(ioc.values())
+                yield list_to_str(values, map_func=lambda val: f'"{val}"')
+
+    if len(ip_indicators) > 0:
+        yield from ips_to_ranges(ip_indicators, request_args.collapse_ips)
+
+
+def iter_formatted_values(iocs: list, request_args: RequestArguments) -> Iterator[str]:
     """
-    Create a dictionary for output values using the selected format (json, json-seq, text, csv, McAfee Web Gateway,
-    Symantec ProxySG, panosurl)
+    Yields the output of the IOCs in the selected format (json, json-seq, text, csv, McAfee Web Gateway,
+    Symantec ProxySG, panosurl) chunk by chunk, so it can be streamed without building it in memory
     """
     if request_args.out_format == FORMAT_PANOSURL:
-        return panos_url_formatting(iocs, request_args.drop_invalids, request_args.strip_port)
+        return join_chunks(iter_panos_url_lines(iocs, request_args.drop_invalids, request_args.strip_port))
 
     if request_args.out_format == FORMAT_PROXYSG:
-        return create_proxysg_out_format(iocs, request_args.category_attribute, request_args.category_default)
+        return iter_proxysg_out_format(iocs, request_args.category_attribute, request_args.category_default)
 
     if request_args.out_format == FORMAT_MWG:
-        return create_mwg_out_format(iocs, request_args.mwg_type), len(iocs)
+        return iter_mwg_out_format(iocs, request_args.mwg_type)
 
     if request_args.out_format == FORMAT_JSON:
-        return create_json_out_format(iocs), len(iocs)
+        return iter_json_list(json_format_single_indicator(ioc) for ioc in iocs)
 
     if request_args.out_format == FORMAT_XSOAR_JSON:
-        iocs_list = [ioc for ioc in iocs]
-        return {CTX_VALUES_KEY: json.dumps(iocs_list)}, len(iocs)
+        return iter_json_list(iocs)
 
-    else:
-        ipv4_formatted_indicators = []
-        ipv6_formatted_indicators = []
-        formatted_indicators = []
-        if request_args.out_format == FORMAT_XSOAR_CSV and len(iocs) > 0:  # add csv keys as first item
-            headers = list(iocs[0].keys())
-            formatted_indicators.append(list_to_str(headers))
-
-        elif request_args.out_format == FORMAT_CSV and len(iocs) > 0:
-            formatted_indicators.append('indicator')
-
-        for ioc in iocs:
-            value = ioc.get('value')
-            type = ioc.get('indicator_type')
-            if value:
-                if request_args.out_format in [FORMAT_TEXT, FORMAT_CSV]:
-                    if type == 'IP' and request_args.collapse_ips != DONT_COLLAPSE:
-                        ipv4_formatted_indicators.append(IPAddress(value))
-
-                    elif type == 'IPv6' and request_args.collapse_ips != DONT_COLLAPSE:
-                        ipv6_formatted_indicators.append(IPAddress(value))
-
-                    else:
-                        formatted_indicators.append(value)
-
-                elif request_args.out_format == FORMAT_XSOAR_JSON_SEQ:
-                    formatted_indicators.append(json.dumps(ioc))
-
-                elif request_args.out_format == FORMAT_JSON_SEQ:
-                    json_format_indicator = json_format_single_indicator(ioc)
-                    formatted_indicators.append(json.dumps(json_format_indicator))
-
-                elif request_args.out_format == FORMAT_XSOAR_CSV:
-                    # wrap csv values with " to escape them
-                    values = list(ioc.values())
-                    formatted_indicators.append(list_to_str(values, map_func=lambda val: f'"{val}"'))
-
-        if len(ipv4_formatted_indicators) > 0:
-            ipv4_formatted_indicators = ips_to_ranges(ipv4_formatted_indicators, request_args.collapse_ips)
-            formatted_indicators.extend(ipv4_formatted_indicators)
-
-        if len(ipv6_formatted_indicators) > 0:
-            ipv6_formatted_indicators = ips_to_ranges(ipv6_formatted_indicators, request_args.collapse_ips)
-            formatted_indicators.extend(ipv6_formatted_indicators)
+    return join_chunks(iter_lines_out_format(iocs, request_args))
 
-    return {CTX_VALUES_KEY: list_to_str(formatted_indicators, '\n')}, len(formatted_indicators)
 
+def count_formatted_values(iocs: list, request_args: RequestArguments) -> int:
+    """
+    Counts the values in the output of the IOCs in the selected format, without formatting the whole output
+    """
+    if request_args.out_format == FORMAT_PANOSURL:
+        return sum(1 for _ in iter_panos_url_lines(iocs, request_args.drop_invalids, request_args.strip_port))
+
+    if request_args.out_format == FORMAT_PROXYSG:
+        return sum(len(indicator_list) for indicator_list in group_proxysg_categories(
+            iocs, request_args.category_attribute, request_args.category_default).values())
 
-def get_outbound_mimetype() -> str:
-    """Returns the mimetype of the export_iocs"""
-    ctx = demisto.getIntegrationContext().get('last_output', {})
-    return ctx.get(CTX_MIMETYPE_KEY, 'text/plain')
+    if request_args.out_format in [FORMAT_MWG, FORMAT_JSON, FORMAT_XSOAR_JSON]:
+        return len(iocs)
+
+    return sum(1 for _ in iter_lines_out_format(iocs, request_args))
+
+
+def create_values_for_returned_dict(iocs: list, request_args: RequestArguments) -> Tuple[dict, int]:
+    """
+    Create a dictionary for output values using the selected format (json, json-seq, text, csv, McAfee Web Gateway,
+    Symantec ProxySG, panosurl)
+    """
+    values = ''.join(iter_formatted_values(iocs, request_args))
+    return {CTX_VALUES_KEY: values}, count_formatted_values(iocs, request_args)
 
 
 def get_outbound_ioc_values(on_demand, request_args: RequestArguments,
-                            last_update_data={}, cache_refresh_rate=None) -> str:
+                            last_update_data={}, cache_refresh_rate=None,
+                            outputs_cache: OutputsCache = None) -> str:
     """
     Get the ioc list to return in the list
     """
+    return ''.join(iter_outbound_ioc_values(on_demand, request_args, last_update_data, cache_refresh_rate,
+                                            outputs_cache))
+
+
+def iter_outbound_ioc_values(on_demand, request_args: RequestArguments,
+                             last_update_data={}, cache_refresh_rate=None,
+                             outputs_cache: OutputsCache = None) -> Iterator[str]:
+    """
+    Yields the ioc list to return in the list, chunk by chunk
+    """
     last_update = last_update_data.get('last_run')
     last_query = last_update_data.get('last_query')
     current_iocs = last_update_data.get('current_iocs')
-
+    cache_time = None
+    if not on_demand and (last_update or outputs_cache is not None):
+        # takes the cache_refresh_rate amount of time back since run time.
+        cache_time, _ = parse_date_range(cache_refresh_rate, to_timestamp=True)
+
+    if outputs_cache is not None:
+        cached_values, version = outputs_cache.get(request_args)
+        # on demand outputs are valid until the IOCs are updated, and other outputs until the cache refresh time
+        if cached_values is not None and (version == last_update if on_demand else version > cache_time):
+            yield cached_values
+            return
+
+    # the version of the IOCs of the output
+    version = last_update
     # on_demand ignores cache
     if on_demand:
         if request_args.is_request_change(last_update_data):
-            values_str = get_ioc_values_str_from_context(request_args=request_args, iocs=current_iocs)
+            values = iter_ioc_values_from_context(request_args=request_args, iocs=current_iocs)
 
         else:
-            values_str = get_ioc_values_str_from_context(request_args=request_args)
+            values = iter_ioc_values_from_context(request_args=request_args)
 
     else:
-        if last_update:
-            # takes the cache_refresh_rate amount of time back since run time.
-            cache_time, _ = parse_date_range(cache_refresh_rate, to_timestamp=True)
-            if last_update <= cache_time or request_args.is_request_change(last_update_data) or \
-                    request_args.query != last_query:
-                values_str = refresh_outbound_context(request_args=request_args)
-            else:
-                values_str = get_ioc_values_str_from_context(request_args=request_args)
+        if not last_update or last_update <= cache_time or request_args.is_request_change(last_update_data) or \
+                request_args.query != last_query:
+            version = date_to_timestamp(datetime.now())
+            values = iter_formatted_values(refresh_outbound_iocs(request_args=request_args), request_args)
         else:
-            values_str = refresh_outbound_context(request_args)
+            values = iter_ioc_values_from_context(request_args=request_args)
+
+    # the chunks are collected to cache the output, until it is too large to be cached
+    chunks: Optional[list] = [] if outputs_cache is not None else None
+    output_bytes = 0
+    for chunk in values:
+        if chunks is not None:
+            output_bytes += len(chunk)
+            if output_bytes > outputs_cache.max_output_bytes:  # type: ignore
+                chunks = None
+            else:
+                chunks.append(chunk)
+        yield chunk
 
-    return values_str
+    if chunks is not None:
+        outputs_cache.set(request_args, ''.join(chunks), version)  # type: ignore
 
 
-def get_ioc_values_str_from_context(request_args: RequestArguments, iocs=None) -> str:
+def iter_ioc_values_from_context(request_args: RequestArguments, iocs=None) -> Iterator[str]:
     """
-    Extracts output values from cache
+    Formats output values from the IOCs snapshot in the integration context
     """
     if iocs:
         if request_args.offset > len(iocs):
-            return ''
+            return
 
         iocs = iocs[request_args.offset: request_args.limit + request_args.offset]
-        returned_dict, _ = create_values_for_returned_dict(iocs, request_args=request_args)
-        current_cache = demisto.getIntegrationContext()
-        current_cache['last_output'] = returned_dict
-        demisto.setIntegrationContext(current_cache)
 
     else:
-        returned_dict = demisto.getIntegrationContext().get('last_output', {})
+        integration_context = demisto.getIntegrationContext()
+        iocs = integration_context.get('current_iocs')
+        if iocs is None:
+            # the integration context was created by a version which kept the formatted output instead of the IOCs
+            yield integration_context.get('last_output', {}).get(CTX_VALUES_KEY, '')
+            return
+
+    yield from iter_formatted_values(iocs, request_args)
+
 
-    return returned_dict.get(CTX_VALUES_KEY, '')
+def iter_buffered(chunks: Iterable[str], buffer_size: int = STREAM_BUFFER_SIZE) -> Iterator[bytes]:
+    """
+    Joins small chunks of a streamed output to encoded chunks of about buffer_size
+    """
+    buffer: List[str] = []
+    buffered_size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered_size += len(chunk)
+        if buffered_size >= buffer_size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            buffered_size = 0
+
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def iter_gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Compresses a streamed output with gzip, chunk by chunk
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed_chunk = compressor.compress(chunk)
+        if compressed_chunk:
+            yield compressed_chunk
+
+    yield compressor.flush()
+
+
+def create_streamed_response(chunks: Iterable[str], mimetype: str, headers) -> Response:
+    """
+    Creates a chunked response which streams the output, compressed with gzip if the client accepts it
+    """
+    body = iter_buffered(chunks)
+    response_headers = {'Vary': 'Accept-Encoding'}
+    if accepts_gzip(headers):
+        body = iter_gzip(body)
+        response_headers['Content-Encoding'] = 'gzip'
+
+    return Response(body, status=200, mimetype=mimetype, headers=response_headers)
 
 
 def try_parse_integer(int_to_parse: Any, err_msg: str) -> int:
@@ -776,22 +812,28 @@ def route_list_values() -> Response:
 
         request_args = get_request_args(params)
 
-        values = get_outbound_ioc_values(
+        chunks = iter_outbound_ioc_values(
             on_demand=params.get('on_demand'),
             last_update_data=demisto.getIntegrationContext(),
             cache_refresh_rate=params.get('cache_refresh_rate'),
-            request_args=request_args
+            request_args=request_args,
+            outputs_cache=OUTPUTS_CACHE
         )
+        # the IOCs are searched and formatted until the first chunk, so errors are still returned as a bad request
+        first_chunk = next((chunk for chunk in chunks if chunk), '')
 
         if not demisto.getIntegrationContext() and params.get('on_demand'):
             values = 'You are running in On-Demand mode - please run !eis-update command to initialize the ' \
                      'export process'
 
-        elif not values:
+        elif not first_chunk:
             values = "No Results Found For the Query"
 
-        mimetype = get_outbound_mimetype()
-        return Response(values, status=200, mimetype=mimetype)
+        else:
+            mimetype = get_request_mimetype(request_args)
+            return create_streamed_response(itertools.chain([first_chunk], chunks), mimetype, request.headers)
+
+        return Response(values, status=200, mimetype=get_request_mimetype(request_args))
 
     except Exception:
         return Response(traceback.format_exc(), status=400, mimetype='text/plain')
@@ -961,5 +1003,8 @@ def main():
         return_error(err_msg)
 
 
+from IPRangesApiModule import *  # noqa: E402
+
+
 if __name__ in ['__main__', '__builtin__', 'builtins']:
     main()
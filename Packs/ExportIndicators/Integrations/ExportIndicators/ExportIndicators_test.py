@@ -36,7 +36,8 @@ class TestHelperFunctions:
         with open('ExportIndicators_test/TestHelperFunctions/iocs_cache_values_text.json', 'r') as iocs_text_values_f:
             iocs_text_dict = json.loads(iocs_text_values_f.read())
             mocker.patch.object(demisto, 'getIntegrationContext', return_value={"last_output": iocs_text_dict})
-            mocker.patch.object(ei, 'refresh_outbound_context', return_value=iocs_text_dict)
+            mocker.patch.object(ei, 'refresh_outbound_iocs',
+                                return_value=[{'value': ioc, 'indicator_type': 'IP'} for ioc in iocs_text_dict])
             mocker.patch.object(demisto, 'getLastRun', return_value={'last_run': 1578383898000})
             request_args = ei.RequestArguments(query='', out_format='text', limit=50, offset=0)
             ioc_list = ei.get_outbound_ioc_values(
@@ -44,7 +45,7 @@ class TestHelperFunctions:
                 request_args=request_args,
                 cache_refresh_rate='1 minute'
             )
-            for ioc_row in ioc_list:
+            for ioc_row in ioc_list.split('\n'):
                 assert ioc_row in iocs_text_dict
 
     @pytest.mark.get_outbound_ioc_values
@@ -56,7 +57,8 @@ class TestHelperFunctions:
         with open('ExportIndicators_test/TestHelperFunctions/iocs_cache_values_text.json', 'r') as iocs_text_values_f:
             iocs_text_dict = json.loads(iocs_text_values_f.read())
             mocker.patch.object(demisto, 'getIntegrationContext', return_value={"last_output": iocs_text_dict})
-            mocker.patch.object(ei, 'refresh_outbound_context', return_value=iocs_text_dict)
+            mocker.patch.object(ei, 'refresh_outbound_iocs',
+                                return_value=[{'value': ioc, 'indicator_type': 'IP'} for ioc in iocs_text_dict])
             mocker.patch.object(demisto, 'getLastRun', return_value={'last_run': 1578383898000})
             request_args = ei.RequestArguments(query='', out_format='text', limit=50, offset=0)
             ioc_list = ei.get_outbound_ioc_values(
@@ -64,7 +66,7 @@ class TestHelperFunctions:
                 request_args=request_args,
                 cache_refresh_rate='1 minute'
             )
-            for ioc_row in ioc_list:
+            for ioc_row in ioc_list.split('\n'):
                 assert ioc_row in iocs_text_dict
 
     @pytest.mark.get_outbound_ioc_values
@@ -79,7 +81,8 @@ class TestHelperFunctions:
                                                                                 "last_limit": 1, "last_offset": 0,
                                                                                 "last_query": "type:ip",
                                                                                 "last_format": "text"})
-            mocker.patch.object(ei, 'refresh_outbound_context', return_value=iocs_text_dict)
+            mocker.patch.object(ei, 'refresh_outbound_iocs',
+                                return_value=[{'value': ioc, 'indicator_type': 'IP'} for ioc in iocs_text_dict])
             mocker.patch.object(demisto, 'getLastRun', return_value={'last_run': 1578383898000})
             request_args = ei.RequestArguments(query='type:ip', out_format='text', limit=50, offset=0)
             ioc_list = ei.get_outbound_ioc_values(
@@ -87,7 +90,7 @@ class TestHelperFunctions:
                 request_args=request_args,
                 cache_refresh_rate='1 minute'
             )
-            for ioc_row in ioc_list:
+            for ioc_row in ioc_list.split('\n'):
                 assert ioc_row in iocs_text_dict
 
     @pytest.mark.get_outbound_ioc_values
@@ -102,7 +105,8 @@ class TestHelperFunctions:
                                                                                 "last_limit": 50, "last_offset": 1,
                                                                                 "last_query": "type:ip",
                                                                                 "last_format": "text"})
-            mocker.patch.object(ei, 'refresh_outbound_context', return_value=iocs_text_dict)
+            mocker.patch.object(ei, 'refresh_outbound_iocs',
+                                return_value=[{'value': ioc, 'indicator_type': 'IP'} for ioc in iocs_text_dict])
             mocker.patch.object(demisto, 'getLastRun', return_value={'last_run': 1578383898000})
             request_args = ei.RequestArguments(query='type:ip', out_format='text', limit=50, offset=0)
             ioc_list = ei.get_outbound_ioc_values(
@@ -110,7 +114,7 @@ class TestHelperFunctions:
                 request_args=request_args,
                 cache_refresh_rate='1 minute'
             )
-            for ioc_row in ioc_list:
+            for ioc_row in ioc_list.split('\n'):
                 assert ioc_row in iocs_text_dict
 
     @pytest.mark.get_outbound_ioc_values
@@ -125,7 +129,8 @@ class TestHelperFunctions:
                                                                                 "last_limit": 50, "last_offset": 0,
                                                                                 "last_query": "type:URL",
                                                                                 "last_format": "text"})
-            mocker.patch.object(ei, 'refresh_outbound_context', return_value=iocs_text_dict)
+            mocker.patch.object(ei, 'refresh_outbound_iocs',
+                                return_value=[{'value': ioc, 'indicator_type': 'IP'} for ioc in iocs_text_dict])
             mocker.patch.object(demisto, 'getLastRun', return_value={'last_run': 1578383898000})
             request_args = ei.RequestArguments(query='type:ip', out_format='text', limit=50, offset=0)
             ioc_list = ei.get_outbound_ioc_values(
@@ -133,7 +138,7 @@ class TestHelperFunctions:
                 request_args=request_args,
                 cache_refresh_rate='1 minute'
             )
-            for ioc_row in ioc_list:
+            for ioc_row in ioc_list.split('\n'):
                 assert ioc_row in iocs_text_dict
 
     @pytest.mark.list_to_str
@@ -567,8 +572,149 @@ class TestHelperFunctions:
         assert "2.2.2.2" in ip_range_list
         assert "25.24.23.22" in ip_range_list
 
-    def test_empty_integartion_context_mimtype(self, mocker):
-        from ExportIndicators import get_outbound_mimetype
+
+class TestOutputsCache:
+    def test_get_outbound_ioc_values_alternating_formats(self, mocker):
+        """
+        Given
+        - An on demand list polled by a text client and a json-seq client.
+
+        When
+        - The clients poll alternately, and then the IOCs are updated.
+
+        Then
+        - Ensure each output is formatted once until the IOCs are updated, and then formatted again.
+        """
+        import ExportIndicators as ei
+        iocs = [{'value': '1.1.1.1', 'indicator_type': 'IP'}, {'value': 'demisto.com', 'indicator_type': 'Domain'}]
+        integration_context = {'last_run': 1000, 'current_iocs': iocs, 'last_output': {}}
+        mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: integration_context)
+        mocker.patch.object(demisto, 'setIntegrationContext')
+        format_values = mocker.patch.object(ei, 'iter_formatted_values', wraps=ei.iter_formatted_values)
+        cache = ei.OutputsCache()
+        text_args = ei.RequestArguments(query='', out_format=ei.FORMAT_TEXT, limit=50)
+        json_seq_args = ei.RequestArguments(query='', out_format=ei.FORMAT_JSON_SEQ, limit=50)
+        for _ in range(3):
+            assert ei.get_outbound_ioc_values(True, text_args, integration_context, None, cache) == '1.1.1.1\ndemisto.com'
+            assert ei.get_outbound_ioc_values(True, json_seq_args, integration_context, None, cache).count('\n') == 1
+        assert format_values.call_count == 2
+        assert ei.get_request_mimetype(json_seq_args) == ei.MIMETYPE_JSON_SEQ
+
+        integration_context['last_run'] = 2000
+        ei.get_outbound_ioc_values(True, text_args, integration_context, None, cache)
+        assert format_values.call_count == 3
+
+    def test_outputs_cache_max_bytes(self):
+        """
+        Given
+        - An outputs cache which is bounded by the total size of the outputs.
+
+        When
+        - Caching outputs whose total size passes the bound, and an output larger than the size of a single output.
+
+        Then
+        - Ensure the least recently used outputs are evicted, and the large output is not cached.
+        """
+        from ExportIndicators import OutputsCache, RequestArguments
+        cache = OutputsCache(max_bytes=10, max_output_bytes=6)
+        first, second, third = (RequestArguments(query='', limit=limit) for limit in (1, 2, 3))
+        cache.set(first, '1' * 4, 1)
+        cache.set(second, '2' * 4, 1)
+        cache.set(third, '3' * 4, 1)
+        assert cache.get(first) == (None, None)
+        assert cache.get(second) == ('2' * 4, 1)
+        cache.set(second, '2' * 7, 2)
+        assert cache.get(second) == (None, None)
+        assert cache.get(third) == ('3' * 4, 1)
+
+    def test_iter_outbound_ioc_values_too_large_to_cache(self, mocker):
+        """
+        Given
+        - An output which is larger than the size of a single cached output.
+
+        When
+        - Streaming it.
+
+        Then
+        - Ensure the whole output is streamed, and it is not cached.
+        """
+        import ExportIndicators as ei
+        iocs = [{'value': f'{i}.example.com', 'indicator_type': 'Domain'} for i in range(100)]
+        mocker.patch.object(ei, 'refresh_outbound_iocs', return_value=iocs)
+        request_args = ei.RequestArguments(query='type:Domain', out_format=ei.FORMAT_TEXT, limit=100)
+        cache = ei.OutputsCache(max_output_bytes=100)
+        values = ''.join(ei.iter_outbound_ioc_values(False, request_args, {}, '1 minute', cache))
+        assert values.split('\n')[-1] == '99.example.com'
+        assert cache.get(request_args) == (None, None)
+
+
+class TestStreamedOutput:
+    def test_json_format_single_indicator_does_not_mutate(self):
+        """
+        Given
+        - An IOC of the IOCs snapshot.
+
+        When
+        - Formatting it to json.
+
+        Then
+        - Ensure the IOC keeps its value, so the snapshot can be formatted again.
+        """
+        from ExportIndicators import json_format_single_indicator
+        ioc = {'value': '1.1.1.1', 'indicator_type': 'IP'}
+        assert json_format_single_indicator(ioc) == {'indicator': '1.1.1.1', 'value': {'indicator_type': 'IP'}}
+        assert ioc == {'value': '1.1.1.1', 'indicator_type': 'IP'}
+
+    def test_refresh_outbound_context_keeps_only_iocs(self, mocker):
+        """
+        Given
+        - IOCs found by the indicators query.
+
+        When
+        - Refreshing the outbound context.
+
+        Then
+        - Ensure only the IOCs snapshot is kept in the integration context, without the formatted output.
+        """
+        import ExportIndicators as ei
+        iocs = [{'value': '1.1.1.1', 'indicator_type': 'IP'}, {'value': 'demisto.com', 'indicator_type': 'Domain'}]
+        mocker.patch.object(ei, 'find_indicators_with_limit', return_value=iocs)
+        set_integration_context = mocker.patch.object(demisto, 'setIntegrationContext')
+        request_args = ei.RequestArguments(query='', out_format=ei.FORMAT_JSON, limit=2)
+        assert json.loads(ei.refresh_outbound_context(request_args))[1]['indicator'] == 'demisto.com'
+        integration_context = set_integration_context.call_args[0][0]
+        assert 'last_output' not in integration_context
+        assert integration_context['current_iocs'] == iocs
+
+    @pytest.mark.parametrize('headers', [{}, {'Accept-Encoding': 'gzip, deflate'}])
+    def test_route_list_values_streams(self, mocker, headers):
+        """
+        Given
+        - An export of many IOCs.
+
+        When
+        - Requesting the export, with and without accepting gzip.
+
+        Then
+        - Ensure the export is streamed in chunks, compressed with gzip if it is accepted.
+        """
+        import gzip
+        import ExportIndicators as ei
+        iocs = [{'value': f'{i}.example.com', 'indicator_type': 'Domain'} for i in range(1000)]
+        mocker.patch.object(demisto, 'params', return_value={'indicators_query': 'type:Domain', 'list_size': 1000,
+                                                             'format': 'json-seq', 'cache_refresh_rate': '1 minute'})
         mocker.patch.object(demisto, 'getIntegrationContext', return_value={})
-        mimtype = get_outbound_mimetype()
-        assert mimtype == 'text/plain'
+        mocker.patch.object(ei, 'refresh_outbound_iocs', return_value=iocs)
+        mocker.patch.object(ei, 'OUTPUTS_CACHE', ei.OutputsCache())
+
+        response = ei.APP.test_client().get('/', headers=headers)
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.mimetype == ei.MIMETYPE_JSON_SEQ
+        body = response.get_data()
+        if headers:
+            assert response.headers['Content-Encoding'] == 'gzip'
+            body = gzip.decompress(body)
+        lines = body.decode('utf-8').split('\n')
+        assert len(lines) == 1000
+        assert json.loads(lines[-1])['indicator'] == '999.example.com'
@@ -41,6 +41,8 @@ def main():
     }
 
     params['feed_url_to_config'] = feed_url_to_config
+    # the lists are small, so they are all downloaded at once
+    params['max_concurrency'] = len(feed_url_to_config)
 
     # Call the main execution of the HTTP API module.
     feed_main('Spamhaus Feed', params, 'spamhaus')
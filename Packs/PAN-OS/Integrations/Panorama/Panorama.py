@@ -6,6 +6,7 @@ from typing import Dict, List, Any, Optional, Tuple, Union
 import uuid
 import json
 import requests
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
 
 # disable insecure warnings
 requests.packages.urllib3.disable_warnings()
@@ -18,6 +19,8 @@ USE_URL_FILTERING = None
 TEMPLATE = None
 VSYS = ''
 PRE_POST = ''
+MAX_CONCURRENCY = 1
+SESSION: Optional[requests.Session] = None
 
 XPATH_SECURITY_RULES = ''
 DEVICE_GROUP = ''
@@ -82,12 +85,26 @@ class PAN_OS_Not_Found(Exception):
         pass
 
 
+def get_session() -> requests.Session:
+    """
+    Get the session shared by all the API calls, which keeps the connections to the firewall or Panorama alive.
+    The connection pool is large enough for MAX_CONCURRENCY concurrent calls.
+    """
+    global SESSION
+    if SESSION is None:
+        SESSION = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max(MAX_CONCURRENCY, DEFAULT_POOLSIZE))
+        SESSION.mount('http://', adapter)
+        SESSION.mount('https://', adapter)
+    return SESSION
+
+
 def http_request(uri: str, method: str, headers: dict = {},
                  body: dict = {}, params: dict = {}, files: dict = None, is_pcap: bool = False) -> Any:
     """
     Makes an API call with the given arguments
     """
-    result = requests.request(
+    result = get_session().request(
         method,
         uri,
         headers=headers,
@@ -105,7 +122,7 @@ def http_request(uri: str, method: str, headers: dict = {},
     if is_pcap:
         return result
 
-    json_result = json.loads(xml2json(result.text))
+    json_result = xml2dict(result.text)
 
     # handle raw response that doe not contain the response key, e.g xonfiguration export
     if 'response' not in json_result or '@code' not in json_result['response']:
@@ -817,24 +834,24 @@ def panorama_get_address(address_name: str) -> Dict:
 
 def panorama_get_address_command(name: str):
     """
-    Get an address
+    Get addresses, concurrently if several names are given
     """
-    address_name = name
+    address_names = argToList(name)
 
-    address = panorama_get_address(address_name)
-    address_output = prettify_address(address)
+    for address in ordered_concurrent_map(panorama_get_address, address_names, MAX_CONCURRENCY):
+        address_output = prettify_address(address)
 
-    return_results({
-        'Type': entryTypes['note'],
-        'ContentsFormat': formats['json'],
-        'Contents': address,
-        'ReadableContentsFormat': formats['markdown'],
-        'HumanReadable': tableToMarkdown('Address:', address_output,
-                                         ['Name', 'IP_Netmask', 'IP_Range', 'FQDN', 'Tags'], removeNull=True),
-        'EntryContext': {
-            "Panorama.Addresses(val.Name == obj.Name)": address_output
-        }
-    })
+        return_results({
+            'Type': entryTypes['note'],
+            'ContentsFormat': formats['json'],
+            'Contents': address,
+            'ReadableContentsFormat': formats['markdown'],
+            'HumanReadable': tableToMarkdown('Address:', address_output,
+                                             ['Name', 'IP_Netmask', 'IP_Range', 'FQDN', 'Tags'], removeNull=True),
+            'EntryContext': {
+                "Panorama.Addresses(val.Name == obj.Name)": address_output
+            }
+        })
 
 
 @logger
@@ -1445,24 +1462,25 @@ def panorama_get_service(service_name: str):
 
 def panorama_get_service_command(service_name: str):
     """
-    Get a service
+    Get services, concurrently if several names are given
     """
+    service_names = argToList(service_name)
 
-    service = panorama_get_service(service_name)
-    service_output = prettify_service(service)
+    for service in ordered_concurrent_map(panorama_get_service, service_names, MAX_CONCURRENCY):
+        service_output = prettify_service(service)
 
-    return_results({
-        'Type': entryTypes['note'],
-        'ContentsFormat': formats['json'],
-        'Contents': service,
-        'ReadableContentsFormat': formats['markdown'],
-        'HumanReadable': tableToMarkdown('Address:', service_output,
-                                         ['Name', 'Protocol', 'SourcePort', 'DestinationPort', 'Description', 'Tags'],
-                                         removeNull=True),
-        'EntryContext': {
-            "Panorama.Services(val.Name == obj.Name)": service_output
-        }
-    })
+        return_results({
+            'Type': entryTypes['note'],
+            'ContentsFormat': formats['json'],
+            'Contents': service,
+            'ReadableContentsFormat': formats['markdown'],
+            'HumanReadable': tableToMarkdown('Address:', service_output,
+                                             ['Name', 'Protocol', 'SourcePort', 'DestinationPort', 'Description',
+                                              'Tags'], removeNull=True),
+            'EntryContext': {
+                "Panorama.Services(val.Name == obj.Name)": service_output
+            }
+        })
 
 
 @logger
@@ -2235,19 +2253,22 @@ def panorama_get_url_category_command(url_cmd: str, url: str, additional_suspici
     Get the url category from Palo Alto URL Filtering
     """
     urls = argToList(url)
+    categories = ordered_concurrent_map(lambda url_: panorama_get_url_category(url_cmd, url_), urls, MAX_CONCURRENCY)
 
     categories_dict: Dict[str, list] = {}
     categories_dict_hr: Dict[str, list] = {}
+    context_urls_by_category: Dict[str, list] = {}
     command_results: List[CommandResults] = []
-    for url in urls:
-        category = panorama_get_url_category(url_cmd, url)
+    for url, category in zip(urls, categories):
         if category in categories_dict:
             categories_dict[category].append(url)
             categories_dict_hr[category].append(url)
         else:
             categories_dict[category] = [url]
             categories_dict_hr[category] = [url]
-        context_urls = populate_url_filter_category_from_context(category)
+        if category not in context_urls_by_category:
+            context_urls_by_category[category] = populate_url_filter_category_from_context(category)
+        context_urls = context_urls_by_category[category]
         categories_dict[category] = list((set(categories_dict[category])).union(set(context_urls)))
 
         score = calculate_dbot_score(category.lower(), additional_suspicious, additional_malicious)
@@ -3079,7 +3100,7 @@ def panorama_list_pcaps_command(args: dict):
         raise Exception('can not provide dlp-pcap without password')
 
     result = http_request(URL, 'GET', params=params, is_pcap=True)
-    json_result = json.loads(xml2json(result.text))['response']
+    json_result = xml2dict(result.text)['response']
     if json_result['@status'] != 'success':
         raise Exception('Request to get list of Pcaps Failed.\nStatus code: ' + str(
             json_result['response']['@code']) + '\nWith message: ' + str(json_result['response']['msg']['line']))
@@ -4240,8 +4261,8 @@ def panorama_check_logs_status_command(job_id: str):
     Check query logs status
     """
     job_ids = argToList(job_id)
-    for job_id in job_ids:
-        result = panorama_get_traffic_logs(job_id)
+    results = ordered_concurrent_map(panorama_get_traffic_logs, job_ids, MAX_CONCURRENCY)
+    for job_id, result in zip(job_ids, results):
 
         if result['response']['@status'] == 'error':
             if 'msg' in result['response'] and 'line' in result['response']['msg']:
@@ -4374,8 +4395,8 @@ def prettify_logs(logs: Union[list, dict]):
 def panorama_get_logs_command(args: dict):
     ignore_auto_extract = args.get('ignore_auto_extract') == 'true'
     job_ids = argToList(args.get('job_id'))
-    for job_id in job_ids:
-        result = panorama_get_traffic_logs(job_id)
+    results = ordered_concurrent_map(panorama_get_traffic_logs, job_ids, MAX_CONCURRENCY)
+    for job_id, result in zip(job_ids, results):
         log_type_dt = demisto.dt(demisto.context(), f'Panorama.Monitor(val.JobID === "{job_id}").LogType')
         if isinstance(log_type_dt, list):
             log_type = log_type_dt[0]
@@ -6585,9 +6606,13 @@ def create_wildfire_best_practice_profile_command(profile_name: str):
 
 def initialize_instance(args: Dict[str, str], params: Dict[str, str]):
     global URL, API_KEY, USE_SSL, USE_URL_FILTERING, VSYS, DEVICE_GROUP, XPATH_SECURITY_RULES, XPATH_OBJECTS, \
-        XPATH_RULEBASE, TEMPLATE, PRE_POST
+        XPATH_RULEBASE, TEMPLATE, PRE_POST, MAX_CONCURRENCY
     if not params.get('port'):
         raise DemistoException('Set a port for the instance')
+    try:
+        MAX_CONCURRENCY = max(int(params.get('max_concurrency') or 10), 1)
+    except ValueError:
+        raise DemistoException('Set an integer for the maximum concurrent requests')
 
     URL = params.get('server', '').rstrip('/:') + ':' + params.get('port', '') + '/api/'
     API_KEY = str(params.get('key'))
@@ -250,3 +250,68 @@ def test_validate_search_time():
     with pytest.raises(Exception):
         assert validate_search_time('219/12/26 00:00:00')
         assert validate_search_time('219/10/35')
+
+
+def test_http_request_reuses_session(patched_requests_mocker):
+    """
+    Given
+    - An instance which makes several API calls.
+
+    When
+    - Making the calls.
+
+    Then
+    - Ensure all the calls are sent through the same pooled session.
+    """
+    from Panorama import get_pan_os_version, get_session
+    import Panorama
+    Panorama.URL = 'https://1.1.1.1:443/api/'
+    Panorama.API_KEY = 'thisisabogusAPIKEY!'
+    session = get_session()
+    assert get_pan_os_version() == get_pan_os_version() == '9.0.6'
+    assert get_session() is session
+    assert patched_requests_mocker.call_count == 2
+
+
+def test_panorama_get_url_category_command_concurrently(mocker):
+    """
+    Given
+    - URLs of two categories, and a maximum of 4 concurrent requests.
+
+    When
+    - Getting the categories of the URLs.
+
+    Then
+    - Ensure the categories are requested concurrently, and returned in the order of the URLs.
+    - Ensure the context is read once per category.
+    """
+    import threading
+    import time
+    import Panorama
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def get_url_category(url_cmd, url):
+        with lock:
+            running.append(url)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(url)
+        return 'malware' if url.startswith('bad') else 'news'
+
+    urls = [f'{"bad" if i % 3 == 0 else "good"}{i}.com' for i in range(12)]
+    mocker.patch.object(Panorama, 'MAX_CONCURRENCY', 4)
+    mocker.patch.object(Panorama, 'panorama_get_url_category', side_effect=get_url_category)
+    from_context = mocker.patch.object(Panorama, 'populate_url_filter_category_from_context', return_value=[])
+    results = mocker.patch.object(Panorama, 'return_results')
+
+    Panorama.panorama_get_url_category_command('url', ','.join(urls), [], [])
+
+    assert max(peak) == 4
+    assert from_context.call_count == 2
+    command_results = results.call_args[0][0]
+    assert [result.indicator.url for result in command_results[1:]] == urls
+    assert [result.indicator.category for result in command_results[1:]] == \
+        ['malware' if url.startswith('bad') else 'news' for url in urls]
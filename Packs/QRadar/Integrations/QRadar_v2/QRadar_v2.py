@@ -1,4 +1,3 @@
-import concurrent.futures
 import json
 import time
 import traceback
@@ -19,18 +18,24 @@ from CommonServerUserPython import *
 urllib3.disable_warnings()
 
 """ ADVANCED GLOBAL PARAMETERS """
-EVENTS_INTERVAL_SECS = 15           # interval between events polling
+EVENTS_INTERVAL_SECS = 15           # max interval between events polling
+EVENTS_MIN_INTERVAL_SECS = 1        # first interval between events polling, doubled on every poll
+EVENTS_PAGE_SIZE = 1000             # page size used for fetching events search results
 EVENTS_FAILURE_LIMIT = 3            # amount of consecutive failures events fetch will tolerate
 FETCH_SLEEP = 60                    # sleep between fetches
 BATCH_SIZE = 100                    # batch size used for offense ip enrichment
 OFF_ENRCH_LIMIT = BATCH_SIZE * 10   # max amount of IPs to enrich per offense
 LOCK_WAIT_TIME = 0.5                # time to wait for lock.acquire
-MAX_WORKERS = 8                     # max concurrent workers used for events enriching
+MAX_WORKERS = 8                     # max concurrent events searches
 DOMAIN_ENRCH_FLG = "True"           # when set to true, will try to enrich offense and assets with domain names
 RULES_ENRCH_FLG = "True"            # when set to true, will try to enrich offense with rule names
+LOOKUP_CACHE_TTL = 3600             # seconds the long-running fetch caches offense types, names, addresses and assets
+LOOKUP_CACHE_PERSIST = "False"      # when set to true, will keep a copy of the lookup cache in the integration context
 
 ADVANCED_PARAMETER_NAMES = [
     "EVENTS_INTERVAL_SECS",
+    "EVENTS_MIN_INTERVAL_SECS",
+    "EVENTS_PAGE_SIZE",
     "EVENTS_FAILURE_LIMIT",
     "FETCH_SLEEP",
     "BATCH_SIZE",
@@ -38,17 +43,20 @@ ADVANCED_PARAMETER_NAMES = [
     "MAX_WORKERS",
     "DOMAIN_ENRCH_FLG",
     "RULES_ENRCH_FLG",
+    "LOOKUP_CACHE_TTL",
+    "LOOKUP_CACHE_PERSIST",
 ]
 
 """ GLOBAL VARS """
 SYNC_CONTEXT = True
 RESET_KEY = "reset"
 LAST_FETCH_KEY = "id"
+LOOKUP_CACHE_KEY = "lookup_cache"
 API_USERNAME = "_api_token_key"
 TERMINATING_SEARCH_STATUSES = {"CANCELED", "ERROR", "COMPLETED"}
+LOOKUP_CACHE = None  # type: Optional[LookupCache]
 EVENT_TIME_FIELDS = ["starttime"]
 ASSET_TIME_FIELDS = ['created', 'last_reported', 'first_seen_scanner', 'last_seen_scanner']
-EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS)
 
 
 """ Header names transformation maps """
@@ -572,14 +580,12 @@ class QRadarClient:
             params['fields'] = ' or '.join(fields)
         return self.send_request("GET", url, headers=headers, params=params)
 
-    def enrich_source_addresses_dict(self, src_adrs):
+    def get_source_addresses(self, src_ids):
         """
-        helper function: Enriches the source addresses ids dictionary with the source addresses values corresponding to the ids
+        Returns a dictionary of the source addresses ids to their values, for up to OFF_ENRCH_LIMIT ids
         """
-        batch_size = BATCH_SIZE
-        for b in batch(
-            list(src_adrs.values())[:OFF_ENRCH_LIMIT], batch_size=int(batch_size)
-        ):
+        src_adrs = {}
+        for b in batch(list(src_ids)[:OFF_ENRCH_LIMIT], batch_size=int(BATCH_SIZE)):
             src_ids_str = ",".join(map(str, b))
             source_url = (
                 f"{self._server}/api/siem/source_addresses?filter=id in ({src_ids_str})"
@@ -589,15 +595,12 @@ class QRadarClient:
                 src_adrs[src_adr["id"]] = src_adr["source_ip"]
         return src_adrs
 
-    def enrich_destination_addresses_dict(self, dst_adrs):
+    def get_destination_addresses(self, dst_ids):
         """
-        helper function: Enriches the destination addresses ids dictionary with the source addresses values corresponding to
-        the ids
+        Returns a dictionary of the destination addresses ids to their values, for up to OFF_ENRCH_LIMIT ids
         """
-        batch_size = BATCH_SIZE
-        for b in batch(
-            list(dst_adrs.values())[:OFF_ENRCH_LIMIT], batch_size=int(batch_size)
-        ):
+        dst_adrs = {}
+        for b in batch(list(dst_ids)[:OFF_ENRCH_LIMIT], batch_size=int(BATCH_SIZE)):
             dst_ids_str = ",".join(map(str, b))
             destination_url = f"{self._server}/api/siem/local_destination_addresses?filter=id in ({dst_ids_str})"
             dst_res = self.send_request("GET", destination_url, self._auth_headers)
@@ -605,6 +608,110 @@ class QRadarClient:
                 dst_adrs[dst_adr["id"]] = dst_adr["local_destination_ip"]
         return dst_adrs
 
+    def enrich_source_addresses_dict(self, src_adrs):
+        """
+        helper function: Enriches the source addresses ids dictionary with the source addresses values corresponding to the ids
+        """
+        src_adrs.update(self.get_source_addresses(src_adrs.values()))
+        return src_adrs
+
+    def enrich_destination_addresses_dict(self, dst_adrs):
+        """
+        helper function: Enriches the destination addresses ids dictionary with the source addresses values corresponding to
+        the ids
+        """
+        dst_adrs.update(self.get_destination_addresses(dst_adrs.values()))
+        return dst_adrs
+
+
+class LookupCache:
+    """
+    TTL cache of the QRadar lookups used to enrich offenses - offense types, closing reasons, domain names,
+    rule names, addresses and assets. Every lookup is a table of keys to values, where a whole response
+    (e.g. the offense types) is kept under a single key. Only keys which are not cached, or whose entry
+    expired, are fetched.
+    The keys are kept as strings, so the cache can be saved to and loaded from the integration context.
+    """
+
+    def __init__(self, ttl, tables=None):
+        self.ttl = ttl
+        self.tables: Dict[str, Dict[str, list]] = tables or {}
+
+    def get_many(self, table, keys, fetch: Callable):
+        """
+        Returns a dictionary of the keys to their values.
+        fetch is called with the keys which are not cached, and returns a dictionary of the keys it found to their
+        values. Keys which were not found are not cached, and are missing from the result.
+        """
+        entries = self.tables.setdefault(table, {})
+        now = time.time()
+        values = {}
+        missing = []
+        for key in keys:
+            entry = entries.get(str(key))
+            if entry and entry[1] > now:
+                values[key] = entry[0]
+            else:
+                missing.append(key)
+        if missing:
+            fetched = fetch(missing)
+            expiry = now + self.ttl
+            for key, value in fetched.items():
+                entries[str(key)] = [value, expiry]
+            values.update(fetched)
+        return values
+
+    def get(self, table, fetch: Callable):
+        """
+        Returns a whole cached response, calling fetch if it is not cached
+        """
+        return self.get_many(table, [""], lambda _: {"": fetch()})[""]
+
+    def prune(self):
+        """
+        Removes the expired entries
+        """
+        now = time.time()
+        for table, entries in self.tables.items():
+            self.tables[table] = {key: entry for key, entry in entries.items() if entry[1] > now}
+
+    def to_context(self):
+        self.prune()
+        return self.tables
+
+    @classmethod
+    def from_context(cls, ttl, ctx):
+        tables = ctx.get(LOOKUP_CACHE_KEY) if isinstance(ctx, dict) else None
+        cache = cls(ttl, tables if isinstance(tables, dict) else None)
+        cache.prune()
+        return cache
+
+
+def get_lookup_cache():
+    """
+    Returns the lookup cache of the long-running fetch, which is loaded from the integration context
+    when LOOKUP_CACHE_PERSIST is set
+    """
+    global LOOKUP_CACHE
+    if LOOKUP_CACHE is None:
+        if LOOKUP_CACHE_PERSIST == "True":
+            LOOKUP_CACHE = LookupCache.from_context(LOOKUP_CACHE_TTL, get_integration_context(SYNC_CONTEXT))
+        else:
+            LOOKUP_CACHE = LookupCache(LOOKUP_CACHE_TTL)
+    else:
+        LOOKUP_CACHE.prune()
+    return LOOKUP_CACHE
+
+
+def create_fetch_context(offense_id, samples, cache=None):
+    """
+    Returns the integration context of the long-running fetch, with the lookup cache if LOOKUP_CACHE_PERSIST is set
+    """
+    context = {LAST_FETCH_KEY: offense_id, "samples": samples}
+    if cache and LOOKUP_CACHE_PERSIST == "True":
+        context[LOOKUP_CACHE_KEY] = cache.to_context()
+    return context
+
 
 """ Utility functions """
 
@@ -746,112 +853,153 @@ def test_module(client: QRadarClient):
     return test_res
 
 
-def enrich_offense_with_events(
-    client: QRadarClient, offense, fetch_mode, events_columns, events_limit
-):
+def get_offense_events_query(offense, fetch_mode, events_columns, events_limit):
+    """
+    Returns the AQL query of the events of an offense
+    """
     additional_where = (
         "AND LOGSOURCETYPENAME(devicetype) = 'Custom Rule Engine'"
         if fetch_mode == FetchMode.correlations_only
         else ""
     )
-    try:
-        return perform_offense_events_enrichment(
-            offense, additional_where, events_columns, events_limit, client,
-        )
-    except Exception as e:
-        print_debug_msg(
-            f"Failed events fetch for offense {offense['id']}: {str(e)}.", client.lock,
-        )
-        return offense
+    return (
+        f'SELECT {events_columns} FROM events WHERE INOFFENSE({offense["id"]})'
+        f"{additional_where} limit {events_limit} START '{offense['start_time']}'"
+    )
 
 
-def perform_offense_events_enrichment(
-    offense, additional_where, events_columns, events_limit, client: QRadarClient,
-):
+def convert_events_time_fields(events):
     """
-    Performs an offense enrichment by:
-        try to create events search via AQL
-        if search created successfully:
-            try to get search results
-            if successfully:
-                enrich offense with event
-        return offense
+    Converts the epoch time fields of events to ISO strings, in place
     """
-    if is_reset_triggered(client.lock):
-        return offense
+    for event in events:
+        try:
+            for time_field in EVENT_TIME_FIELDS:
+                if time_field in event:
+                    event[time_field] = epoch_to_iso(event[time_field])
+        except TypeError:
+            continue
+    return events
 
-    offense_start_time = offense["start_time"]
-    query_expression = (
-        f'SELECT {events_columns} FROM events WHERE INOFFENSE({offense["id"]})'
-        f"{additional_where} limit {events_limit} START '{offense_start_time}'"
-    )
-    events_query = {"headers": "", "query_expression": query_expression}
-    print_debug_msg(f'Starting events fetch for offense {offense["id"]}.', client.lock)
-    try:
-        query_status, search_id = try_create_search_with_retry(
-            client, events_query, offense
-        )
-        offense["events"] = try_poll_offense_events_with_retry(
-            client, offense["id"], query_status, search_id
-        )
-    except Exception as e:
-        print_debug_msg(
-            f'Failed fetching event for offense {offense["id"]}: {str(e)}.',
-            client.lock,
-        )
-    finally:
-        return offense
 
+class EventsSearch:
+    """
+    State of the events search of a single offense
+    """
 
-def try_poll_offense_events_with_retry(
-    client, offense_id, query_status, search_id, max_retries=None
-):
+    def __init__(self, offense, search_id, interval):
+        self.offense = offense
+        self.search_id = search_id
+        self.interval = interval
+        self.next_poll = time.time() + interval
+        self.failures = 0
+        self.last_status_msg = time.time()
+
+
+class EventsSearchScheduler:
     """
-    Polls search until the search is done (completed/canceled/error), and then returns the search result
-    will retry up to max_retries consecutive failures
+    Fetches the events of many offenses with a single polling loop, instead of a thread polling each search.
+    At most max_searches searches run in QRadar at once, and a new search is created whenever one ends.
+    A running search is polled after EVENTS_MIN_INTERVAL_SECS, and the interval doubles on every poll up to
+    EVENTS_INTERVAL_SECS, so short searches end quickly and long ones do not flood QRadar with polls.
+    The results of a completed search are fetched in pages of EVENTS_PAGE_SIZE events.
     """
-    if not max_retries:
-        max_retries = EVENTS_FAILURE_LIMIT
-    failures = 0
-    start_time = time.time()
-    while not (query_status in TERMINATING_SEARCH_STATUSES or failures >= max_retries):
+
+    def __init__(self, client: QRadarClient, max_searches=None, min_interval=None, max_interval=None,
+                 page_size=None, max_failures=None):
+        self.client = client
+        self.max_searches = max(int(max_searches or MAX_WORKERS), 1)
+        self.min_interval = min_interval if min_interval is not None else EVENTS_MIN_INTERVAL_SECS
+        self.max_interval = max(max_interval if max_interval is not None else EVENTS_INTERVAL_SECS,
+                                self.min_interval)
+        self.page_size = max(int(page_size or EVENTS_PAGE_SIZE), 1)
+        self.max_failures = max_failures if max_failures is not None else EVENTS_FAILURE_LIMIT
+
+    def run(self, offenses_queries):
+        """
+        Searches the events of the offenses, and sets them in the "events" key of every offense.
+        An offense whose search could not be created or polled is left without events.
+        Stops, leaving the remaining offenses without events, when a reset is triggered.
+
+        :param offenses_queries: (offense, AQL query) pairs
+        :return: the offenses
+        """
+        offenses = [offense for offense, _ in offenses_queries]
+        waiting = list(reversed(offenses_queries))
+        running: List[EventsSearch] = []
+        while waiting or running:
+            if is_reset_triggered(self.client.lock):
+                return offenses
+
+            while waiting and len(running) < self.max_searches:
+                offense, query_expression = waiting.pop()
+                search = self.create_search(offense, query_expression)
+                if search:
+                    running.append(search)
+
+            now = time.time()
+            for search in [search for search in running if search.next_poll <= now]:
+                if self.poll(search):
+                    running.remove(search)
+
+            if running and not (waiting and len(running) < self.max_searches):
+                time.sleep(max(min(search.next_poll for search in running) - time.time(), 0))
+        return offenses
+
+    def create_search(self, offense, query_expression):
+        print_debug_msg(f'Starting events fetch for offense {offense["id"]}.', self.client.lock)
+        events_query = {"headers": "", "query_expression": query_expression}
         try:
-            if is_reset_triggered(client.lock):
-                return []
+            _, search_id = try_create_search_with_retry(self.client, events_query, offense, self.max_failures)
+        except Exception as e:
+            print_debug_msg(f'Failed fetching event for offense {offense["id"]}: {str(e)}.', self.client.lock)
+            return None
+        return EventsSearch(offense, search_id, self.min_interval)
 
-            raw_search = client.get_search(search_id)
+    def poll(self, search: EventsSearch):
+        """
+        Polls a search once, and fetches its events if it ended.
+        Returns whether the search is done with - it ended, or failed max_failures consecutive times.
+        """
+        offense_id = search.offense["id"]
+        try:
+            raw_search = self.client.get_search(search.search_id)
             query_status = raw_search.get("status")
-            # failures are relevant only when consecutive
-            failures = 0
             if query_status in TERMINATING_SEARCH_STATUSES:
-                raw_search_results = client.get_search_results(search_id)
-                print_debug_msg(
-                    f"Events fetched for offense {offense_id}.", client.lock
-                )
-                events = raw_search_results.get("events", [])
-                for event in events:
-                    try:
-                        for time_field in EVENT_TIME_FIELDS:
-                            if time_field in event:
-                                event[time_field] = epoch_to_iso(event[time_field])
-                    except TypeError:
-                        continue
-                return events
-            else:
-                # prepare next run
-                elapsed = time.time() - start_time
-                if elapsed >= FETCH_SLEEP:  # print status debug every fetch sleep (or after)
-                    print_debug_msg(
-                        f"Still fetching offense {offense_id} events, search_id: {search_id}.",
-                        client.lock,
-                    )
-                    start_time = time.time()
-                time.sleep(EVENTS_INTERVAL_SECS)
+                search.offense["events"] = self.get_events(search.search_id, raw_search.get("record_count"))
+                print_debug_msg(f"Events fetched for offense {offense_id}.", self.client.lock)
+                return True
+            # failures are relevant only when consecutive
+            search.failures = 0
         except Exception as e:
-            print_debug_msg(f"Error while fetching offense {offense_id} events, search_id: {search_id}. "
+            print_debug_msg(f"Error while fetching offense {offense_id} events, search_id: {search.search_id}. "
                             f"Error details: {str(e)}")
-            failures += 1
-    return []
+            search.failures += 1
+            if search.failures >= self.max_failures:
+                return True
+
+        now = time.time()
+        if now - search.last_status_msg >= FETCH_SLEEP:  # print status debug every fetch sleep (or after)
+            print_debug_msg(f"Still fetching offense {offense_id} events, search_id: {search.search_id}.",
+                            self.client.lock)
+            search.last_status_msg = now
+        search.interval = min(search.interval * 2, self.max_interval)
+        search.next_poll = now + search.interval
+        return False
+
+    def get_events(self, search_id, record_count=None):
+        """
+        Fetches the events of an ended search in pages
+        """
+        events: List[dict] = []
+        while record_count is None or len(events) < record_count:
+            page = self.client.get_search_results(
+                search_id, _range=f"{len(events)}-{len(events) + self.page_size - 1}"
+            ).get("events", [])
+            events.extend(page)
+            if len(page) < self.page_size:
+                break
+        return convert_events_time_fields(events)
 
 
 def try_create_search_with_retry(client, events_query, offense, max_retries=None):
@@ -989,37 +1137,28 @@ def fetch_incidents_long_running_events(
         raw_offenses.reverse()
     for offense in raw_offenses:
         offense_id = max(offense_id, offense["id"])
-    enriched_offenses = []
 
-    futures = []
-    for offense in raw_offenses:
-        futures.append(
-            EXECUTOR.submit(
-                enrich_offense_with_events,
-                client=client,
-                offense=offense,
-                fetch_mode=fetch_mode,
-                events_columns=events_columns,
-                events_limit=events_limit,
-            )
-        )
-    for future in concurrent.futures.as_completed(futures):
-        enriched_offenses.append(future.result())
+    offenses_queries = [
+        (offense, get_offense_events_query(offense, fetch_mode, events_columns, events_limit))
+        for offense in raw_offenses
+    ]
+    enriched_offenses = EventsSearchScheduler(client).run(offenses_queries)
 
     if is_reset_triggered(client.lock, handle_reset=True):
         return
 
     enriched_offenses.sort(key=lambda offense: offense.get("id", 0))
+    cache = get_lookup_cache()
     if ip_enrich or asset_enrich:
         print_debug_msg("Enriching offenses")
-        enrich_offense_result(client, enriched_offenses, ip_enrich, asset_enrich)
+        enrich_offense_result(client, enriched_offenses, ip_enrich, asset_enrich, cache)
         print_debug_msg("Enriched offenses successfully.")
     new_incidents_samples = create_incidents(enriched_offenses, incident_type)
     incidents_batch_for_sample = (
         new_incidents_samples if new_incidents_samples else last_run.get("samples", [])
     )
 
-    context = {LAST_FETCH_KEY: offense_id, "samples": incidents_batch_for_sample}
+    context = create_fetch_context(offense_id, incidents_batch_for_sample, cache)
     set_integration_context(context, sync=SYNC_CONTEXT)
 
 
@@ -1050,9 +1189,10 @@ def fetch_incidents_long_running_no_events(
     for offense in raw_offenses:
         offense_id = max(offense_id, offense["id"])
 
+    cache = get_lookup_cache()
     if ip_enrich or asset_enrich:
         print_debug_msg("Enriching offenses")
-        enrich_offense_result(client, raw_offenses, ip_enrich, asset_enrich)
+        enrich_offense_result(client, raw_offenses, ip_enrich, asset_enrich, cache)
         print_debug_msg("Enriched offenses successfully.")
 
     # handle reset signal
@@ -1064,7 +1204,7 @@ def fetch_incidents_long_running_no_events(
         incidents_batch if incidents_batch else last_run.get("samples", [])
     )
 
-    context = {LAST_FETCH_KEY: offense_id, "samples": incidents_batch_for_sample}
+    context = create_fetch_context(offense_id, incidents_batch_for_sample, cache)
     set_integration_context(context, sync=SYNC_CONTEXT)
 
 
@@ -1117,10 +1257,10 @@ def get_offenses_command(
 
 
 def enrich_offense_result(
-    client: QRadarClient, response, ip_enrich=False, asset_enrich=False
+    client: QRadarClient, response, ip_enrich=False, asset_enrich=False, cache: LookupCache = None
 ):
     """
-    Enriches the values of a given offense result
+    Enriches the values of a given offense result, looking up only what is not in the given lookup cache
     * epoch timestamps -> ISO time string
     * closing reason id -> name
     * Domain id -> name
@@ -1133,13 +1273,15 @@ def enrich_offense_result(
     * IP value -> Asset
     * Add offense link
     """
+    if cache is None:
+        cache = LookupCache(0)
     domain_ids = set()
     rule_ids = set()
     if isinstance(response, list):
-        type_dict = client.get_offense_types()
-        closing_reason_dict = client.get_closing_reasons(
+        type_dict = cache.get("offense_types", client.get_offense_types)
+        closing_reason_dict = cache.get("closing_reasons", lambda: client.get_closing_reasons(
             include_deleted=True, include_reserved=True
-        )
+        ))
         for offense in response:
             offense["LinkToOffense"] = f"{client.server}/console/do/sem/offensesummary?" \
                                        f"appName=Sem&pageId=OffenseSummary&summaryId={offense.get('id')}"
@@ -1155,7 +1297,7 @@ def enrich_offense_result(
 
         if ip_enrich or asset_enrich:
             enrich_offenses_with_assets_and_source_destination_addresses(
-                client, response, ip_enrich, asset_enrich
+                client, response, ip_enrich, asset_enrich, cache
             )
             if asset_enrich:
                 # get assets from offenses that have assets
@@ -1163,22 +1305,40 @@ def enrich_offense_result(
                 for assets in assets_list:
                     domain_ids.update({asset['domain_id'] for asset in assets})
         if domain_ids and DOMAIN_ENRCH_FLG == "True":
-            enrich_offense_res_with_domain_names(client, domain_ids, response)
+            enrich_offense_res_with_domain_names(client, domain_ids, response, cache)
         if rule_ids and RULES_ENRCH_FLG == "True":
-            enrich_offense_res_with_rule_names(client, rule_ids, response)
+            enrich_offense_res_with_rule_names(client, rule_ids, response, cache)
     else:
         enrich_offense_timestamps_and_closing_reason(client, response)
 
     return response
 
 
-def enrich_offense_res_with_domain_names(client, domain_ids, response):
+def get_domain_names(client, domain_ids):
     """
-    Add domain_name to the offense and assets results
+    Returns a dictionary of the domain ids to their names
     """
-    domain_filter = 'id=' + 'or id='.join(str(domain_ids).replace(' ', '').split(','))[1:-1]
+    domain_filter = 'id=' + 'or id='.join(str(set(domain_ids)).replace(' ', '').split(','))[1:-1]
     domains = client.get_devices(_filter=domain_filter)
-    domain_names = {d['id']: d['name'] for d in domains}
+    return {d['id']: d['name'] for d in domains}
+
+
+def get_rule_names(client, rule_ids):
+    """
+    Returns a dictionary of the rule ids to their names
+    """
+    rule_filter = 'id=' + 'or id='.join(str(set(rule_ids)).replace(' ', '').split(','))[1:-1]
+    rules = client.get_rules(_filter=rule_filter)
+    return {r['id']: r['name'] for r in rules}
+
+
+def enrich_offense_res_with_domain_names(client, domain_ids, response, cache: LookupCache = None):
+    """
+    Add domain_name to the offense and assets results
+    """
+    if cache is None:
+        cache = LookupCache(0)
+    domain_names = cache.get_many("domain_names", domain_ids, lambda ids: get_domain_names(client, ids))
     for offense in response:
         if 'domain_id' in offense:
             offense['domain_name'] = domain_names.get(offense['domain_id'], '')
@@ -1188,13 +1348,13 @@ def enrich_offense_res_with_domain_names(client, domain_ids, response):
                     asset['domain_name'] = domain_names.get(asset['domain_id'], '')
 
 
-def enrich_offense_res_with_rule_names(client, rule_ids, response):
+def enrich_offense_res_with_rule_names(client, rule_ids, response, cache: LookupCache = None):
     """
     Add name to the offense rules
     """
-    rule_filter = 'id=' + 'or id='.join(str(rule_ids).replace(' ', '').split(','))[1:-1]
-    rules = client.get_rules(_filter=rule_filter)
-    rule_names = {r['id']: r['name'] for r in rules}
+    if cache is None:
+        cache = LookupCache(0)
+    rule_names = cache.get_many("rule_names", rule_ids, lambda ids: get_rule_names(client, ids))
     for offense in response:
         if 'rules' in offense and isinstance(offense['rules'], list):
             for rule in offense['rules']:
@@ -1220,18 +1380,20 @@ def enrich_offense_timestamps_and_closing_reason(
 
 
 def enrich_offenses_with_assets_and_source_destination_addresses(
-    client: QRadarClient, offenses, ip_enrich=False, asset_enrich=False
+    client: QRadarClient, offenses, ip_enrich=False, asset_enrich=False, cache: LookupCache = None
 ):
     """
     Enriches offense result dictionary with source and destination addresses and assets depending on the ips
     """
+    if cache is None:
+        cache = LookupCache(0)
     src_adrs, dst_adrs = extract_source_and_destination_addresses_ids(offenses)
     # This command might encounter HTML error page in certain cases instead of JSON result. Fallback: cancel operation
     try:
         if src_adrs:
-            client.enrich_source_addresses_dict(src_adrs)
+            src_adrs.update(cache.get_many("source_addresses", src_adrs, client.get_source_addresses))
         if dst_adrs:
-            client.enrich_destination_addresses_dict(dst_adrs)
+            dst_adrs.update(cache.get_many("destination_addresses", dst_adrs, client.get_destination_addresses))
         if isinstance(offenses, list) and (ip_enrich or asset_enrich):
             for offense in offenses:
                 # calling this function changes given offenses IP ids to IP values
@@ -1239,19 +1401,33 @@ def enrich_offenses_with_assets_and_source_destination_addresses(
                     offense, src_adrs, dst_adrs, not ip_enrich
                 )
                 if asset_enrich:
-                    assets = get_assets_for_offense(client, assets_ips)
+                    assets = get_assets_for_offense(client, assets_ips, cache)
                     if assets:
                         offense["assets"] = assets
     finally:
         return offenses
 
 
-def get_assets_for_offense(client: QRadarClient, assets_ips):
+def get_assets_for_offense(client: QRadarClient, assets_ips, cache: LookupCache = None):
     """
     Get the assets that correlate to the given asset_ip_ids in the expected offense result format
     """
-    assets = []
-    for ips_batch in batch(list(assets_ips), batch_size=BATCH_SIZE):
+    if cache is None:
+        cache = LookupCache(0)
+    assets_by_ip = cache.get_many("assets", assets_ips, lambda ips: get_assets_by_ip(client, ips))
+    assets: Dict[str, dict] = {}
+    for ip in assets_ips:
+        for asset in assets_by_ip.get(ip, []):
+            assets.setdefault(str(asset.get('id')), asset)
+    return list(assets.values())
+
+
+def get_assets_by_ip(client: QRadarClient, ips):
+    """
+    Returns a dictionary of the given IPs to the assets that have them, in the expected offense result format
+    """
+    assets_by_ip: Dict[str, list] = {ip: [] for ip in ips}
+    for ips_batch in batch(list(ips), batch_size=BATCH_SIZE):
         query = ""
         for ip in ips_batch:
             query = (f"{query} or " if query else "") + f'interfaces contains ip_addresses contains value="{ip}"'
@@ -1270,7 +1446,12 @@ def get_assets_for_offense(client: QRadarClient, assets_ips):
                     # simplify interfaces
                     if isinstance(asset.get('interfaces'), list):
                         asset['interfaces'] = get_simplified_asset_interfaces(asset['interfaces'])
-    return assets
+                    for interface in asset.get('interfaces') or []:
+                        for ip_adrs in interface.get('ip_addresses', []):
+                            asset_ips = assets_by_ip.get(ip_adrs.get('value'))
+                            if asset_ips is not None and asset not in asset_ips:
+                                asset_ips.append(asset)
+    return assets_by_ip
 
 
 def get_simplified_asset_interfaces(interfaces):
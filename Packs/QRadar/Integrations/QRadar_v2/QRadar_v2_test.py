@@ -18,9 +18,9 @@ from QRadar_v2 import (
     get_note_command,
     fetch_incidents_long_running_no_events,
     fetch_incidents_long_running_events,
-    enrich_offense_with_events,
+    get_offense_events_query,
     try_create_search_with_retry,
-    try_poll_offense_events_with_retry,
+    EventsSearchScheduler,
     enrich_offense_result,
     get_asset_ips_and_enrich_offense_addresses
 )
@@ -119,15 +119,16 @@ def test_fetch_incidents_long_running_events(mocker):
     """
     expected_events = "assert ok"
 
-    def mock_enrich_offense_with_events(client, offense, fetch_mode, events_columns, events_limit):
-        offense['events'] = expected_events
-        return offense
+    def mock_run(offenses_queries):
+        for offense, _ in offenses_queries:
+            offense['events'] = expected_events
+        return [offense for offense, _ in offenses_queries]
 
     client = QRadarClient("", {}, {"identifier": "*", "password": "*"})
     fetch_mode = FetchMode.all_events
     mocker.patch.object(QRadar_v2, "get_integration_context", return_value={})
     mocker.patch.object(QRadar_v2, "fetch_raw_offenses", return_value=[RAW_RESPONSES["fetch-incidents"]])
-    QRadar_v2.enrich_offense_with_events = mock_enrich_offense_with_events
+    mocker.patch.object(EventsSearchScheduler, "run", side_effect=mock_run)
     mocker.patch.object(demisto, "createIncidents")
     mocker.patch.object(demisto, "debug")
     sic_mock = mocker.patch.object(QRadar_v2, "set_integration_context")
@@ -140,48 +141,39 @@ def test_fetch_incidents_long_running_events(mocker):
     assert incident_raw_json['events'] == expected_events
 
 
-def test_enrich_offense_with_events__correlations(mocker):
+def test_get_offense_events_query__correlations():
     """
-    Assert enrich_offense_with_events adds an additional WHERE query when FetchMode.correlations_only
+    Assert get_offense_events_query adds an additional WHERE query when FetchMode.correlations_only
 
     Given:
         - Fetch incidents is set to: FetchMode.correlations_only
     When:
-        - Event fetch query is built via in enrich_offense_with_event
+        - Event fetch query is built via get_offense_events_query
     Then:
-        - Assert search is created with additional WHERE query
+        - Assert the query has the additional WHERE query
     """
-    client = QRadarClient("", {}, {"identifier": "*", "password": "*"})
     offense = RAW_RESPONSES["fetch-incidents"]
-    fetch_mode = FetchMode.correlations_only
-    events_cols = ""
-    events_limit = ""
-
-    poee_mock = mocker.patch.object(QRadar_v2, "perform_offense_events_enrichment", return_value=offense)
-    enrich_offense_with_events(client, offense, fetch_mode, events_cols, events_limit)
-    assert poee_mock.call_args[0][1] == "AND LOGSOURCETYPENAME(devicetype) = 'Custom Rule Engine'"
+    query = get_offense_events_query(offense, FetchMode.correlations_only, "sourceip", "20")
+    assert query == (f'SELECT sourceip FROM events WHERE INOFFENSE({offense["id"]})'
+                     f"AND LOGSOURCETYPENAME(devicetype) = 'Custom Rule Engine' limit 20 "
+                     f"START '{offense['start_time']}'")
 
 
-def test_enrich_offense_with_events__all_events(mocker):
+def test_get_offense_events_query__all_events():
     """
-    Assert enrich_offense_with_events doesn't add an additional WHERE query when FetchMode.all_events
+    Assert get_offense_events_query doesn't add an additional WHERE query when FetchMode.all_events
 
     Given:
         - Fetch incidents is set to: FetchMode.all_events
     When:
-        - Event fetch query is built via in enrich_offense_with_event
+        - Event fetch query is built via get_offense_events_query
     Then:
-        - Assert search is created without additional WHERE query
+        - Assert the query has no additional WHERE query
     """
-    client = QRadarClient("", {}, {"identifier": "*", "password": "*"})
     offense = RAW_RESPONSES["fetch-incidents"]
-    fetch_mode = FetchMode.all_events
-    events_cols = ""
-    events_limit = ""
-
-    poee_mock = mocker.patch.object(QRadar_v2, "perform_offense_events_enrichment", return_value=offense)
-    enrich_offense_with_events(client, offense, fetch_mode, events_cols, events_limit)
-    assert poee_mock.call_args[0][1] == ""
+    query = get_offense_events_query(offense, FetchMode.all_events, "sourceip", "20")
+    assert query == (f'SELECT sourceip FROM events WHERE INOFFENSE({offense["id"]}) limit 20 '
+                     f"START '{offense['start_time']}'")
 
 
 def test_try_create_search_with_retry__semi_happy(mocker):
@@ -234,7 +226,7 @@ def test_try_create_search_with_retry__sad(mocker):
     assert exception_raised
 
 
-def test_try_poll_offense_events_with_retry__semi_happy(mocker):
+def test_events_search_scheduler__semi_happy(mocker):
     """
     Poll event with a failure, recovery and success flow
 
@@ -247,22 +239,22 @@ def test_try_poll_offense_events_with_retry__semi_happy(mocker):
         - Assert events are fetched correctly
     """
     client = QRadarClient("", {}, {"identifier": "*", "password": "*"})
-    offense_id = 450
-    query_status = "EXECUTE"
-    search_id = "1"
-    max_retries = 3
+    offense = {"id": 450, "start_time": 1582830435000}
     expected = [{'MY Source IPs': '8.8.8.8'}]
 
     mocker.patch.object(QRadar_v2, "is_reset_triggered", return_value=False)
+    mocker.patch.object(client, "search", return_value=RAW_RESPONSES["qradar-searches"])
     mocker.patch.object(client, "get_search", side_effect=[ConnectionError, RAW_RESPONSES["qradar-get-search"]])
     mocker.patch.object(client, "get_search_results", return_value=RAW_RESPONSES["qradar-get-search-results"])
     mocker.patch.object(demisto, "debug")
 
-    actual = try_poll_offense_events_with_retry(client, offense_id, query_status, search_id, max_retries)
-    assert actual == expected
+    scheduler = EventsSearchScheduler(client, min_interval=0, max_failures=3)
+    actual = scheduler.run([(offense, "")])
+    assert actual == [offense]
+    assert offense["events"] == expected
 
 
-def test_try_poll_offense_events_with_retry__reset(mocker):
+def test_events_search_scheduler__reset(mocker):
     """
     Poll event with when reset is set
 
@@ -271,47 +263,97 @@ def test_try_poll_offense_events_with_retry__reset(mocker):
     When:
         - Reset trigger is waiting
     Then:
-        - Stop fetch and return empty list
+        - Stop fetch and return the offense without events
     """
     client = QRadarClient("", {}, {"identifier": "*", "password": "*"})
-    offense_id = 450
-    query_status = "EXECUTE"
-    search_id = "1"
-    max_retries = 3
+    offense = {"id": 450, "start_time": 1582830435000}
 
     mocker.patch.object(QRadar_v2, "is_reset_triggered", return_value=True)
-    mocker.patch.object(client, "get_search", side_effect=[ConnectionError, RAW_RESPONSES["qradar-get-search"]])
-    mocker.patch.object(client, "get_search_results", return_value=RAW_RESPONSES["qradar-get-search-results"])
+    search_mock = mocker.patch.object(client, "search", return_value=RAW_RESPONSES["qradar-searches"])
     mocker.patch.object(demisto, "debug")
 
-    actual = try_poll_offense_events_with_retry(client, offense_id, query_status, search_id, max_retries)
-    assert actual == []
+    actual = EventsSearchScheduler(client, min_interval=0).run([(offense, "")])
+    assert actual == [offense]
+    assert "events" not in offense
+    assert not search_mock.called
 
 
-def test_try_poll_offense_events_with_retry__sad(mocker):
+def test_events_search_scheduler__sad(mocker):
     """
     Poll event with a failure
 
     Given:
         - Event fetch is to be polled via the qradar client
     When:
-        - Search first returns ConnectionError
-        - Recovery is set to 0
+        - Search returns ConnectionError
+        - Recovery is set to 1
     Then:
-        - Stop fetch and return empty list
+        - Stop fetch and return the offense without events
     """
     client = QRadarClient("", {}, {"identifier": "*", "password": "*"})
-    offense_id = 450
-    query_status = "EXECUTE"
-    search_id = "1"
-    max_retries = 0
+    offense = {"id": 450, "start_time": 1582830435000}
 
     mocker.patch.object(QRadar_v2, "is_reset_triggered", return_value=False)
+    mocker.patch.object(client, "search", return_value=RAW_RESPONSES["qradar-searches"])
     mocker.patch.object(client, "get_search", side_effect=[ConnectionError, RAW_RESPONSES["qradar-get-search"]])
     mocker.patch.object(demisto, "debug")
 
-    actual = try_poll_offense_events_with_retry(client, offense_id, query_status, search_id, max_retries)
-    assert actual == []
+    actual = EventsSearchScheduler(client, min_interval=0, max_failures=1).run([(offense, "")])
+    assert actual == [offense]
+    assert "events" not in offense
+
+
+def test_events_search_scheduler__many_offenses(mocker):
+    """
+    Fetch the events of many offenses with a cap on the concurrent searches
+
+    Given:
+        - 10 offenses, each search completes on its third poll and has 5 events
+        - At most 3 concurrent searches, and pages of 2 events
+    When:
+        - Running the events search scheduler
+    Then:
+        - Assert no more than 3 searches ran at once
+        - Assert the events of every offense were fetched in pages, in the order of the offenses
+    """
+    client = QRadarClient("", {}, {"identifier": "*", "password": "*"})
+    offenses = [{"id": i, "start_time": 0} for i in range(10)]
+    running = set()
+    peak = []
+    polls = {}
+
+    def search(events_query):
+        search_id = events_query["query_expression"]
+        running.add(search_id)
+        peak.append(len(running))
+        polls[search_id] = 0
+        return {"search_id": search_id, "status": "WAIT"}
+
+    def get_search(search_id):
+        polls[search_id] += 1
+        if polls[search_id] < 3:
+            return {"search_id": search_id, "status": "EXECUTE"}
+        running.discard(search_id)
+        return {"search_id": search_id, "status": "COMPLETED", "record_count": 5}
+
+    def get_search_results(search_id, _range=None):
+        first, last = (int(i) for i in _range.split("-"))
+        return {"events": [{"offense": search_id, "index": i} for i in range(first, min(last + 1, 5))]}
+
+    mocker.patch.object(QRadar_v2, "is_reset_triggered", return_value=False)
+    mocker.patch.object(client, "search", side_effect=search)
+    mocker.patch.object(client, "get_search", side_effect=get_search)
+    results_mock = mocker.patch.object(client, "get_search_results", side_effect=get_search_results)
+    mocker.patch.object(demisto, "debug")
+
+    scheduler = EventsSearchScheduler(client, max_searches=3, min_interval=0, page_size=2)
+    actual = scheduler.run([(offense, str(offense["id"])) for offense in offenses])
+
+    assert actual == offenses
+    assert max(peak) == 3
+    assert results_mock.call_count == 3 * len(offenses)
+    for offense in offenses:
+        assert offense["events"] == [{"offense": str(offense["id"]), "index": i} for i in range(5)]
 
 
 def test_enrich_offense_result(mocker):
@@ -347,6 +389,81 @@ def test_enrich_offense_result(mocker):
     assert 'name' in response[0]['rules'][0]
 
 
+def test_enrich_offense_result__lookup_cache(mocker):
+    """
+    Enrich offense results twice with the same lookup cache
+
+    Given:
+        - Offenses with rule ids, domain ids, addresses ids and assets
+    When:
+        - Enriching the offenses in two fetch cycles with the same lookup cache, the second with a new rule
+    Then:
+        - The second cycle looks up only the new rule
+        - The offenses of both cycles are enriched with the same values
+    """
+    closing_reason_dict = [{'is_deleted': False, 'is_reserved': False, 'text': 'False-Positive, Tuned', 'id': 2}]
+    offense_types = [{'property_name': 'sourceIP', 'custom': False, 'name': 'Source IP', 'id': 0}]
+    domains = [{'name': 'domain', 'tenant_id': 0, 'id': 0, 'log_source_group_ids': []}]
+    client = QRadarClient("", {}, {"identifier": "*", "password": "*"})
+    asset = {'id': 1, 'domain_id': 0, 'interfaces': [{'ip_addresses': [{'type': 'IPV4', 'value': '8.8.8.8'}]}]}
+
+    mocker.patch.object(client, "get_closing_reasons", return_value=closing_reason_dict)
+    mocker.patch.object(client, "get_offense_types", return_value=offense_types)
+    mocker.patch.object(client, "get_devices", return_value=domains)
+    rules_mock = mocker.patch.object(client, "get_rules", side_effect=[
+        [{'name': 'Outbound port scan', 'id': 100452}], [{'name': 'New rule', 'id': 100453}]
+    ])
+    mocker.patch.object(client, "get_source_addresses", return_value={254: '8.8.8.8'})
+    mocker.patch.object(client, "get_destination_addresses", return_value={4: '1.2.3.4'})
+    mocker.patch.object(client, "get_assets", return_value=[deepcopy(asset)])
+    cache = QRadar_v2.LookupCache(3600)
+
+    first = [deepcopy(RAW_RESPONSES["qradar-update-offense"])]
+    enrich_offense_result(client, first, ip_enrich=True, asset_enrich=True, cache=cache)
+    second = [deepcopy(RAW_RESPONSES["qradar-update-offense"])]
+    second[0]['rules'].append({'id': 100453, 'type': 'CRE_RULE'})
+    enrich_offense_result(client, second, ip_enrich=True, asset_enrich=True, cache=cache)
+
+    for mock in (client.get_closing_reasons, client.get_offense_types, client.get_devices,
+                 client.get_source_addresses, client.get_destination_addresses, client.get_assets):
+        assert mock.call_count == 1
+    assert rules_mock.call_args[1]['_filter'] == 'id=100453'
+    assert second[0]['source_address_ids'] == first[0]['source_address_ids'] == ['8.8.8.8']
+    assert second[0]['assets'] == first[0]['assets']
+    assert first[0]['assets'][0]['domain_name'] == 'domain'
+    assert [rule['name'] for rule in second[0]['rules']] == ['Outbound port scan', 'New rule']
+
+
+def test_lookup_cache__ttl_and_context(mocker):
+    """
+    Keep lookups in a TTL cache which is persisted in the integration context
+
+    Given:
+        - A lookup cache with a TTL of 10 seconds
+    When:
+        - Looking up the same keys before and after the TTL, and loading the cache from the fetch context
+    Then:
+        - Only keys which are missing or expired are fetched
+        - The loaded cache has the entries which did not expire
+    """
+    now = [1000.0]
+    mocker.patch.object(QRadar_v2.time, "time", side_effect=lambda: now[0])
+    mocker.patch.object(QRadar_v2, "LOOKUP_CACHE_PERSIST", "True")
+    fetch = mocker.Mock(side_effect=lambda ids: {i: f'name{i}' for i in ids if i != 3})
+    cache = QRadar_v2.LookupCache(10)
+
+    assert cache.get_many("names", [1, 2, 3], fetch) == {1: 'name1', 2: 'name2'}
+    now[0] += 5
+    assert cache.get_many("names", [1, 4], fetch) == {1: 'name1', 4: 'name4'}
+    assert fetch.call_args_list == [mocker.call([1, 2, 3]), mocker.call([4])]
+
+    now[0] += 6
+    context = json.loads(json.dumps(QRadar_v2.create_fetch_context(450, [], cache)))
+    loaded = QRadar_v2.LookupCache.from_context(10, context)
+    assert loaded.get_many("names", [1, 4], fetch) == {1: 'name1', 4: 'name4'}
+    assert fetch.call_args_list[-1] == mocker.call([1])
+
+
 def test_get_asset_ips_and_enrich_offense_addresses__no_enrich():
     """
     Run offense ips enrichment with skip_enrichment=True
@@ -6,8 +6,9 @@ import ssl
 import sys
 import threading
 import traceback
+from contextlib import contextmanager
 from distutils.util import strtobool
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
 import requests
 import slack
@@ -52,7 +53,8 @@ DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
 OBJECTS_TO_KEYS = {
     'mirrors': 'investigation_id',
     'questions': 'entitlement',
-    'users': 'id'
+    'users': 'id',
+    'conversations': 'id'
 }
 SYNC_CONTEXT = True
 
@@ -76,6 +78,7 @@ BOT_NAME: str
 BOT_ICON_URL: str
 MAX_LIMIT_TIME: int
 PAGINATED_COUNT: int
+CACHE: 'SlackCache'
 
 ''' HELPER FUNCTIONS '''
 
@@ -121,6 +124,195 @@ def get_current_utc_time() -> datetime:
     return datetime.utcnow()
 
 
+class SlackCache:
+    """
+    An in-process cache of the slack users and conversations.
+
+    The users are indexed by id, and by lower case name, email and real name, and the conversations by id and lower
+    case name. The indexes are loaded from the integration context, and on a miss are warmed by a single paged sync of
+    the workspace users or conversations, so every page is indexed and not only the one which had a match.
+    The cache is reloaded once the TTL passes, to pick up the changes of other processes and of the workspace.
+
+    Objects which should be persisted are kept pending and written to the integration context in a single update by
+    flush, which is deferred to the end of a batch_writes block.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.loaded_at: Optional[float] = None
+        self.users_synced = False
+        self.conversations_synced = False
+        self.users_by_id: Dict[str, dict] = {}
+        self.users_by_name: Dict[str, dict] = {}
+        self.conversations_by_id: Dict[str, dict] = {}
+        self.conversations_by_name: Dict[str, dict] = {}
+        self.persisted_ids: set = set()
+        self.pending_users: Dict[str, dict] = {}
+        self.pending_conversations: Dict[str, dict] = {}
+        self.batch_depth = 0
+
+    def load(self):
+        """
+        Loads the indexes from the integration context if they were not loaded yet or the TTL has passed.
+        """
+        with self.lock:
+            if self.loaded_at is not None and time.time() - self.loaded_at < self.ttl:
+                return
+            self.loaded_at = time.time()
+            self.users_synced = self.conversations_synced = False
+            self.users_by_id, self.users_by_name = {}, {}
+            self.conversations_by_id, self.conversations_by_name = {}, {}
+            integration_context = get_integration_context(SYNC_CONTEXT)
+            users = json.loads(integration_context.get('users') or '[]')
+            conversations = json.loads(integration_context.get('conversations') or '[]')
+            self.persisted_ids = {obj.get('id') for obj in users + conversations}
+            for user in users:
+                self.index_user(user)
+            for conversation in conversations:
+                self.index_conversation(conversation)
+
+    def index_user(self, user: dict):
+        if not user.get('id'):
+            return
+        self.users_by_id[user['id']] = user
+        for name in (user.get('name'), user.get('profile', {}).get('email'), user.get('real_name')):
+            if name:
+                self.users_by_name.setdefault(name.lower(), user)
+
+    def index_conversation(self, conversation: dict):
+        if not conversation.get('id'):
+            return
+        self.conversations_by_id[conversation['id']] = conversation
+        if conversation.get('name'):
+            self.conversations_by_name.setdefault(conversation['name'].lower(), conversation)
+
+    def get_user(self, user_id: str) -> dict:
+        self.load()
+        return self.users_by_id.get(user_id, {})
+
+    def get_conversation(self, conversation_id: str) -> dict:
+        self.load()
+        return self.conversations_by_id.get(conversation_id, {})
+
+    def find_user(self, user_to_search: str) -> dict:
+        """
+        Finds a user by name, email or real name, syncing the workspace users on a miss.
+
+        Args:
+            user_to_search: The user name, email or real name
+
+        Returns:
+            The slack user, or an empty dict if it was not found
+        """
+        self.load()
+        user_to_search = user_to_search.lower()
+        if user_to_search not in self.users_by_name and not self.users_synced:
+            for users in iter_paginated(CLIENT, 'users.list', 'members'):
+                with self.lock:
+                    for user in users:
+                        self.index_user(user)
+            self.users_synced = True
+        return self.users_by_name.get(user_to_search, {})
+
+    def find_conversation(self, conversation_name: str) -> dict:
+        """
+        Finds a conversation by name, syncing the workspace conversations on a miss.
+
+        Args:
+            conversation_name: The conversation name
+
+        Returns:
+            The slack conversation, or an empty dict if it was not found
+        """
+        self.load()
+        conversation_name = conversation_name.lower()
+        if conversation_name not in self.conversations_by_name and not self.conversations_synced:
+            body = {
+                'types': 'private_channel,public_channel'
+            }
+            for conversations in iter_paginated(CLIENT, 'conversations.list', 'channels', body):
+                with self.lock:
+                    for conversation in conversations:
+                        self.index_conversation(conversation)
+            self.conversations_synced = True
+        return self.conversations_by_name.get(conversation_name, {})
+
+    def is_persisted(self, obj: dict) -> bool:
+        return obj.get('id') in self.persisted_ids
+
+    def add_user(self, user: dict, persist: bool = True):
+        with self.lock:
+            self.index_user(user)
+            if persist and user.get('id'):
+                self.pending_users[user['id']] = user
+
+    def add_conversation(self, conversation: dict, persist: bool = True):
+        with self.lock:
+            self.index_conversation(conversation)
+            if persist and conversation.get('id'):
+                self.pending_conversations[conversation['id']] = conversation
+
+    @contextmanager
+    def batch_writes(self) -> Iterator[None]:
+        """
+        Defers the integration context writes of the block to a single flush at its end.
+        """
+        with self.lock:
+            self.batch_depth += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.batch_depth -= 1
+            self.flush()
+
+    def flush(self, context: Optional[dict] = None):
+        """
+        Writes the pending users and conversations to the integration context, along with other keys to update.
+
+        Args:
+            context: Other keys and values to update in the same write
+        """
+        with self.lock:
+            if self.batch_depth:
+                return
+            context = dict(context or {})
+            if self.pending_users:
+                context['users'] = list(self.pending_users.values())
+            if self.pending_conversations:
+                context['conversations'] = list(self.pending_conversations.values())
+            if not context:
+                return
+            set_to_integration_context_with_retries(context, OBJECTS_TO_KEYS, SYNC_CONTEXT)
+            self.persisted_ids.update(self.pending_users)
+            self.persisted_ids.update(self.pending_conversations)
+            self.pending_users, self.pending_conversations = {}, {}
+
+
+def iter_paginated(client: slack.WebClient, method: str, key: str, body: Optional[dict] = None) -> Iterator[list]:
+    """
+    Iterates over the pages of a paginated slack list method.
+
+    Args:
+        client: The slack client
+        method: The list method, e.g. users.list
+        key: The key of the objects in the response
+        body: Other arguments of the method
+
+    Returns:
+        The objects of each page
+    """
+    body = dict(body or {}, limit=PAGINATED_COUNT)
+    while True:
+        response = send_slack_request_sync(client, method, http_verb='GET', body=body)
+        yield response[key] if response and response.get(key) else []
+        cursor = response.get('response_metadata', {}).get('next_cursor') if response else None
+        if not cursor:
+            break
+        body = dict(body, cursor=cursor)
+
+
 def get_user_by_name(user_to_search: str, add_to_context: bool = True) -> dict:
     """
     Gets a slack user by a user name
@@ -132,45 +324,10 @@ def get_user_by_name(user_to_search: str, add_to_context: bool = True) -> dict:
     Returns:
         A slack user object
     """
-
-    user: dict = {}
-    users: list = []
-    integration_context = get_integration_context(SYNC_CONTEXT)
-
-    user_to_search = user_to_search.lower()
-    if integration_context.get('users'):
-        users = json.loads(integration_context['users'])
-        users_filter = list(filter(lambda u: u.get('name', '').lower() == user_to_search
-                                             or u.get('profile', {}).get('email', '').lower() == user_to_search
-                                             or u.get('real_name', '').lower() == user_to_search, users))
-        if users_filter:
-            user = users_filter[0]
-    if not user:
-        body = {
-            'limit': PAGINATED_COUNT
-        }
-        response = send_slack_request_sync(CLIENT, 'users.list', http_verb='GET', body=body)
-        while True:
-            workspace_users = response['members'] if response and response.get('members', []) else []
-            cursor = response.get('response_metadata', {}).get('next_cursor')
-            users_filter = list(filter(lambda u: u.get('name', '').lower() == user_to_search
-                                                 or u.get('profile', {}).get('email', '').lower() == user_to_search
-                                                 or u.get('real_name', '').lower() == user_to_search, workspace_users))
-            if users_filter:
-                break
-            if not cursor:
-                break
-            body = body.copy()
-            body.update({'cursor': cursor})
-            response = send_slack_request_sync(CLIENT, 'users.list', http_verb='GET', body=body)
-
-        if users_filter:
-            user = users_filter[0]
-            if add_to_context:
-                users.append(user)
-                set_to_integration_context_with_retries({'users': users}, OBJECTS_TO_KEYS, SYNC_CONTEXT)
-        else:
-            return {}
+    user = CACHE.find_user(user_to_search)
+    if user and add_to_context and not CACHE.is_persisted(user):
+        CACHE.add_user(user)
+        CACHE.flush()
 
     return user
 
@@ -190,16 +347,17 @@ def search_slack_users(users: Union[list, str]) -> list:
     if not isinstance(users, list):
         users = [users]
 
-    for user in users:
-        slack_user = get_user_by_name(user)
-        if not slack_user:
-            demisto.results({
-                'Type': WARNING_ENTRY_TYPE,
-                'Contents': f'User {user} not found in Slack',
-                'ContentsFormat': formats['text']
-            })
-        else:
-            slack_users.append(slack_user)
+    with CACHE.batch_writes():
+        for user in users:
+            slack_user = get_user_by_name(user)
+            if not slack_user:
+                demisto.results({
+                    'Type': WARNING_ENTRY_TYPE,
+                    'Contents': f'User {user} not found in Slack',
+                    'ContentsFormat': formats['text']
+                })
+            else:
+                slack_users.append(slack_user)
     return slack_users
 
 
@@ -343,18 +501,12 @@ async def get_slack_name(slack_id: str, client) -> str:
     if not slack_id:
         return ''
 
-    integration_context = get_integration_context(SYNC_CONTEXT)
     prefix = slack_id[0]
     slack_name = ''
 
     if prefix in ['C', 'D', 'G']:
         slack_id = slack_id.split('|')[0]
-        conversation: dict = {}
-        if integration_context.get('conversations'):
-            conversations = list(filter(lambda c: c['id'] == slack_id,
-                                        json.loads(integration_context['conversations'])))
-            if conversations:
-                conversation = conversations[0]
+        conversation = CACHE.get_conversation(slack_id)
         if not conversation:
             body = {
                 'channel': slack_id
@@ -362,19 +514,17 @@ async def get_slack_name(slack_id: str, client) -> str:
 
             conversation = (await send_slack_request_async(client, 'conversations.info', http_verb='GET',
                                                            body=body)).get('channel', {})
+            CACHE.add_conversation(conversation, persist=False)
         slack_name = conversation.get('name', '')
     elif prefix == 'U':
-        user: dict = {}
-        if integration_context.get('users'):
-            users = list(filter(lambda u: u['id'] == slack_id, json.loads(integration_context['users'])))
-            if users:
-                user = users[0]
+        user = CACHE.get_user(slack_id)
         if not user:
             body = {
                 'user': slack_id
             }
             user = (await send_slack_request_async(client, 'users.info', http_verb='GET',
                                                    body=body)).get('user', {})
+            CACHE.add_user(user, persist=False)
 
         slack_name = user.get('name', '')
 
@@ -622,11 +772,8 @@ def check_for_answers():
 
     integration_context = get_integration_context(SYNC_CONTEXT)
     questions = integration_context.get('questions', [])
-    users = integration_context.get('users', [])
     if questions:
         questions = json.loads(questions)
-    if users:
-        users = json.loads(users)
     now = get_current_utc_time()
     now_string = datetime.strftime(now, DATE_FORMAT)
     updated_questions = []
@@ -681,20 +828,18 @@ def check_for_answers():
         if actions:
             demisto.info(f'Slack - received answer from user for entitlement {entitlement}.')
             user_id = payload.get('user', {}).get('id')
-            user_filter = list(filter(lambda u: u['id'] == user_id, users))
-            if user_filter:
-                user = user_filter[0]
-            else:
+            user = CACHE.get_user(user_id)
+            if not user:
                 body = {
                     'user': user_id
                 }
                 user = send_slack_request_sync(CLIENT, 'users.info', http_verb='GET', body=body).get('user', {})
-                users.append(user)
+                CACHE.add_user(user)
 
             answer_question(actions[0].get('text', {}).get('text'), question, user.get('profile', {}).get('email'))
 
     if updated_questions:
-        set_to_integration_context_with_retries({'users': users, 'questions': questions}, OBJECTS_TO_KEYS, SYNC_CONTEXT)
+        CACHE.flush({'questions': questions})
 
 
 def get_poll_minutes(current_time: datetime, sent: Optional[str]) -> float:
@@ -1152,21 +1297,14 @@ async def get_user_by_id_async(client: slack.WebClient, user_id: str) -> dict:
     Returns:
         The slack user.
     """
-    user: dict = {}
-    users: list = []
-    integration_context = get_integration_context(SYNC_CONTEXT)
-    if integration_context.get('users'):
-        users = json.loads(integration_context['users'])
-        user_filter = list(filter(lambda u: u['id'] == user_id, users))
-        if user_filter:
-            user = user_filter[0]
+    user = CACHE.get_user(user_id)
     if not user:
         body = {
             'user': user_id
         }
         user = (await send_slack_request_async(client, 'users.info', http_verb='GET', body=body)).get('user', {})
-        users.append(user)
-        set_to_integration_context_with_retries({'users': users}, OBJECTS_TO_KEYS, SYNC_CONTEXT)
+        CACHE.add_user(user)
+        CACHE.flush()
 
     return user
 
@@ -1245,53 +1383,10 @@ def get_conversation_by_name(conversation_name: str) -> dict:
     Returns:
         The slack conversation
     """
-    integration_context = get_integration_context(SYNC_CONTEXT)
-
-    conversation_to_search = conversation_name.lower()
-    # Find conversation in the cache
-    conversations = integration_context.get('conversations')
-    if conversations:
-        conversations = json.loads(conversations)
-        conversation_filter = list(
-            filter(
-                lambda c: conversation_to_search == c.get('name', '').lower(),
-                conversations
-            )
-        )
-        if conversation_filter:
-            return conversation_filter[0]
-
-    # If not found in cache, search for it
-    body = {
-        'types': 'private_channel,public_channel',
-        'limit': PAGINATED_COUNT
-    }
-    response = send_slack_request_sync(CLIENT, 'conversations.list', http_verb='GET', body=body)
-    conversation: dict = {}
-    while True:
-        conversations = response['channels'] if response and response.get('channels') else []
-        cursor = response.get('response_metadata', {}).get('next_cursor')
-        conversation_filter = list(filter(lambda c: c.get('name') == conversation_name, conversations))
-        if conversation_filter:
-            break
-        if not cursor:
-            break
-        body = body.copy()
-        body.update({'cursor': cursor})
-        response = send_slack_request_sync(CLIENT, 'conversations.list', http_verb='GET', body=body)
-
-    if conversation_filter:
-        conversation = conversation_filter[0]
-
-    # Save conversations to cache
-    if conversation:
-        conversations = integration_context.get('conversations')
-        if conversations:
-            conversations = json.loads(conversations)
-            conversations.append(conversation)
-        else:
-            conversations = [conversation]
-        set_to_integration_context_with_retries({'conversations': conversations}, OBJECTS_TO_KEYS, SYNC_CONTEXT)
+    conversation = CACHE.find_conversation(conversation_name)
+    if conversation and not CACHE.is_persisted(conversation):
+        CACHE.add_conversation(conversation)
+        CACHE.flush()
 
     return conversation
 
@@ -1902,7 +1997,7 @@ def init_globals(command_name: str = ''):
     """
     global BOT_TOKEN, ACCESS_TOKEN, PROXY_URL, PROXIES, DEDICATED_CHANNEL, CLIENT, CHANNEL_CLIENT
     global SEVERITY_THRESHOLD, ALLOW_INCIDENTS, NOTIFY_INCIDENTS, INCIDENT_TYPE, VERIFY_CERT
-    global BOT_NAME, BOT_ICON_URL, MAX_LIMIT_TIME, PAGINATED_COUNT, SSL_CONTEXT
+    global BOT_NAME, BOT_ICON_URL, MAX_LIMIT_TIME, PAGINATED_COUNT, SSL_CONTEXT, CACHE
 
     VERIFY_CERT = not demisto.params().get('unsecure', False)
     if not VERIFY_CERT:
@@ -1935,6 +2030,7 @@ def init_globals(command_name: str = ''):
     BOT_ICON_URL = demisto.params().get('bot_icon')  # Bot default icon url defined by the slack plugin (3-rd party)
     MAX_LIMIT_TIME = int(demisto.params().get('max_limit_time', '60'))
     PAGINATED_COUNT = int(demisto.params().get('paginated_count', '200'))
+    CACHE = SlackCache(int(demisto.params().get('cache_ttl', '300')))
 
 
 def print_thread_dump():
@@ -622,6 +622,7 @@ def test_get_user_by_name(mocker):
     user = get_user_by_name(username)
     assert user['id'] == 'U012B3CUI'
     assert slack.WebClient.api_call.call_count == 1
+    assert 'U012B3CUI' in [u['id'] for u in js.loads(get_integration_context()['users'])]
 
     set_integration_context({
         'mirrors': MIRRORS,
@@ -630,17 +631,17 @@ def test_get_user_by_name(mocker):
         'bot_id': 'W12345678'
     })
 
-    # User email doesn't exist in integration context
+    # User email doesn't exist in integration context, but the synced workspace users are cached
     email = 'perikles@acropoli.com'
     user = get_user_by_name(email)
     assert user['id'] == 'U012B3CUI'
-    assert slack.WebClient.api_call.call_count == 2
+    assert slack.WebClient.api_call.call_count == 1
 
     # User doesn't exist
     username = 'alexios'
     user = get_user_by_name(username)
     assert user == {}
-    assert slack.WebClient.api_call.call_count == 3
+    assert slack.WebClient.api_call.call_count == 1
 
 
 def test_get_user_by_name_paging(mocker):
@@ -679,6 +680,70 @@ def test_get_user_by_name_paging(mocker):
     assert slack.WebClient.api_call.call_count == 2
 
 
+def test_search_slack_users_single_sync_and_write(mocker):
+    """
+    Given:
+    - Users which are not in the integration context, on different pages of the workspace users.
+
+    When:
+    - Searching for the users.
+
+    Then:
+    - Ensure the workspace users are paged once, and the found users are written to the context in a single update.
+    """
+    from Slack import search_slack_users
+
+    def api_call(method: str, http_verb: str = 'POST', file: str = None, params=None, json=None, data=None):
+        if 'cursor' not in params:
+            return {'members': [{'id': 'U1', 'name': 'perikles'}], 'response_metadata': {'next_cursor': 'page2'}}
+        return {'members': [{'id': 'U2', 'name': 'alexios', 'real_name': 'Alexios'}]}
+
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=get_integration_context)
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=set_integration_context)
+    mocker.patch.object(demisto, 'results')
+    mocker.patch.object(slack.WebClient, 'api_call', side_effect=api_call)
+
+    users = search_slack_users(['Perikles', 'alexios', 'spengler', 'nobody'])
+
+    assert [u['id'] for u in users] == ['U1', 'U2', 'U012A3CDE']
+    assert slack.WebClient.api_call.call_count == 2
+    assert demisto.setIntegrationContext.call_count == 1
+    context_users = [u['id'] for u in js.loads(get_integration_context()['users'])]
+    assert 'U1' in context_users and 'U2' in context_users
+    assert demisto.results.call_args[0][0]['Contents'] == 'User nobody not found in Slack'
+
+
+def test_slack_cache_ttl(mocker):
+    """
+    Given:
+    - A cache which was loaded from the integration context and synced with the workspace users.
+
+    When:
+    - Looking up users before and after the TTL passes.
+
+    Then:
+    - Ensure the context and the workspace are read again only after the TTL passes.
+    """
+    from Slack import SlackCache
+
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=get_integration_context)
+    mocker.patch.object(slack.WebClient, 'api_call', return_value={'members': []})
+    now = mocker.patch('time.time', return_value=1000)
+    cache = SlackCache(60)
+
+    assert cache.get_user('U012A3CDE')['name'] == 'spengler'
+    assert cache.find_user('nobody') == {}
+    assert cache.find_user('nobody') == {}
+    assert demisto.getIntegrationContext.call_count == 1
+    assert slack.WebClient.api_call.call_count == 1
+
+    now.return_value = 1060
+    assert cache.find_user('Spengler@Ghostbusters.example.com')['id'] == 'U012A3CDE'
+    assert cache.find_user('nobody') == {}
+    assert demisto.getIntegrationContext.call_count == 2
+    assert slack.WebClient.api_call.call_count == 2
+
+
 def test_mirror_investigation_new_mirror(mocker):
     from Slack import mirror_investigation
 
@@ -1534,7 +1599,7 @@ def test_check_for_mirrors_user_email_not_matching(mocker):
     # Assert
     assert demisto.setIntegrationContext.call_count == 1
     assert error_results[0]['Contents'] == 'User 123 not found in Slack'
-    assert len(users_call) == 2
+    assert len(users_call) == 1
     assert len(invite_call) == 1
     assert invited_users == ['U012A3CDE']
     assert channel == ['new_group']
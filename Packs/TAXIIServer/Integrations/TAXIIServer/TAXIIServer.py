@@ -4,10 +4,11 @@ from flask import Flask, request, make_response, Response, stream_with_context
 from gevent.pywsgi import WSGIServer
 from urllib.parse import urlparse, ParseResult
 from tempfile import NamedTemporaryFile
-from base64 import b64decode
-from typing import Callable, List, Generator
+from base64 import b64decode, urlsafe_b64encode, urlsafe_b64decode
+from typing import Callable, List, Generator, Iterator, Optional, Tuple
 from ssl import SSLContext, SSLError, PROTOCOL_TLSv1_2
 from multiprocessing import Process
+from collections import OrderedDict
 
 from libtaxii.messages_11 import (
     TAXIIMessage,
@@ -17,6 +18,7 @@ from libtaxii.messages_11 import (
     CollectionInformation,
     CollectionInformationResponse,
     PollRequest,
+    PollFulfillmentRequest,
     PollingServiceInstance,
     ServiceInstance,
     ContentBlock,
@@ -26,6 +28,7 @@ from libtaxii.constants import (
     MSG_COLLECTION_INFORMATION_REQUEST,
     MSG_DISCOVERY_REQUEST,
     MSG_POLL_REQUEST,
+    MSG_POLL_FULFILLMENT_REQUEST,
     SVC_DISCOVERY,
     SVC_COLLECTION_MANAGEMENT,
     SVC_POLL,
@@ -35,6 +38,7 @@ from cybox.core import Observable
 
 
 import functools
+import itertools
 import stix.core
 import stix.indicator
 import stix.extensions.marking.ais
@@ -58,6 +62,7 @@ PAGE_SIZE = 200
 APP: Flask = Flask('demisto-taxii')
 NAMESPACE_URI = 'https://www.paloaltonetworks.com/cortex'
 NAMESPACE = 'cortex'
+STIX_CACHE_SIZE = 10000
 
 
 ''' Log Handler '''
@@ -80,7 +85,7 @@ class Handler:
 
 class TAXIIServer:
     def __init__(self, host: str, port: int, collections: dict, certificate: str, private_key: str,
-                 http_server: bool, credentials: dict):
+                 http_server: bool, credentials: dict, poll_response_size: int = 0):
         """
         Class for a TAXII Server configuration.
         Args:
@@ -91,6 +96,7 @@ class TAXIIServer:
             private_key: The private key for SSL.
             http_server: Whether to use HTTP server (not SSL).
             credentials: The user credentials.
+            poll_response_size: The maximal number of indicators in a poll response part, 0 for no limit.
         """
         self.host = host
         self.port = port
@@ -98,6 +104,8 @@ class TAXIIServer:
         self.certificate = certificate
         self.private_key = private_key
         self.http_server = http_server
+        # a poll response part consists of whole indicator search pages
+        self.pages_per_part = -(-poll_response_size // PAGE_SIZE) if poll_response_size > 0 else 0
         self.auth = None
         if credentials:
             self.auth = (credentials.get('identifier', ''), credentials.get('password', ''))
@@ -198,6 +206,9 @@ class TAXIIServer:
         Returns:
             The poll response.
         """
+        if taxii_message.message_type == MSG_POLL_FULFILLMENT_REQUEST:
+            return self.get_poll_fulfillment_response(taxii_message)
+
         if taxii_message.message_type != MSG_POLL_REQUEST:
             raise ValueError('Invalid message, invalid Message Type')
 
@@ -209,8 +220,26 @@ class TAXIIServer:
         return self.stream_stix_data_feed(taxii_feeds, taxii_message.message_id, collection_name,
                                           exclusive_begin_time, inclusive_end_time)
 
+    def get_poll_fulfillment_response(self, taxii_message: PollFulfillmentRequest) -> Response:
+        """
+        Handle poll fulfillment request, for the next parts of a poll response.
+        Args:
+            taxii_message: The poll fulfillment request message.
+
+        Returns:
+            The poll response part.
+        """
+        collection_name, exclusive_begin_time, inclusive_end_time = decode_result_id(taxii_message.result_id)
+        if collection_name != taxii_message.collection_name:
+            raise ValueError('Invalid message, the result ID does not match the collection')
+
+        return self.stream_stix_data_feed(list(self.collections.keys()), taxii_message.message_id, collection_name,
+                                          exclusive_begin_time, inclusive_end_time,
+                                          result_part_number=int(taxii_message.result_part_number))
+
     def stream_stix_data_feed(self, taxii_feeds: list, message_id: str, collection_name: str,
-                              exclusive_begin_time: datetime, inclusive_end_time: datetime) -> Response:
+                              exclusive_begin_time: datetime, inclusive_end_time: datetime,
+                              result_part_number: int = 1) -> Response:
         """
         Get the indicator query results in STIX data feed format.
         Args:
@@ -219,6 +248,7 @@ class TAXIIServer:
             collection_name: The collection name to get the indicator query from.
             exclusive_begin_time: The query exclusive begin time.
             inclusive_end_time: The query inclusive end time.
+            result_part_number: The part of the results to get, when they are split to parts.
 
         Returns:
             Stream of STIX indicator data feed.
@@ -226,24 +256,42 @@ class TAXIIServer:
         if collection_name not in taxii_feeds:
             raise ValueError('Invalid message, unknown feed')
 
+        if result_part_number < 1 or (result_part_number > 1 and not self.pages_per_part):
+            raise ValueError('Invalid message, invalid result part number')
+
         if not inclusive_end_time:
             inclusive_end_time = datetime.utcnow().replace(tzinfo=pytz.utc)
 
+        indicator_query = get_time_frame_query(self.collections[str(collection_name)], exclusive_begin_time,
+                                               inclusive_end_time)
+        first_page = (result_part_number - 1) * self.pages_per_part
+
         def yield_response() -> Generator:
             """
 
             Streams the STIX indicators as XML string.
 
             """
+            pages = search_indicators_pages(indicator_query, first_page, self.pages_per_part)
+            # the first page is searched before the opening tag, to know by its total whether there are more parts
+            first_search_result = next(pages)
+            more = bool(self.pages_per_part) and \
+                first_search_result.get('total', 0) > (first_page + self.pages_per_part) * PAGE_SIZE
+
             # yield the opening tag of the Poll Response
             response = '<taxii_11:Poll_Response xmlns:taxii="http://taxii.mitre.org/messages/taxii_xml_binding-1"' \
                        ' xmlns:taxii_11="http://taxii.mitre.org/messages/taxii_xml_binding-1.1" ' \
                        'xmlns:tdq="http://taxii.mitre.org/query/taxii_default_query-1"' \
                        f' message_id="{generate_message_id()}"' \
                        f' in_response_to="{message_id}"' \
-                       f' collection_name="{collection_name}" more="false" result_part_number="1"> ' \
-                       f'<taxii_11:Inclusive_End_Timestamp>{inclusive_end_time.isoformat()}' \
-                       '</taxii_11:Inclusive_End_Timestamp>'
+                       f' collection_name="{collection_name}" more="{str(more).lower()}"' \
+                       f' result_part_number="{result_part_number}"'
+            if self.pages_per_part:
+                result_id = encode_result_id(collection_name, exclusive_begin_time, inclusive_end_time)
+                response += f' result_id="{result_id}"'
+            response += '> ' \
+                        f'<taxii_11:Inclusive_End_Timestamp>{inclusive_end_time.isoformat()}' \
+                        '</taxii_11:Inclusive_End_Timestamp>'
 
             if exclusive_begin_time is not None:
                 response += (f'<taxii_11:Exclusive_Begin_Timestamp>{exclusive_begin_time.isoformat()}'
@@ -251,21 +299,14 @@ class TAXIIServer:
 
             yield response
 
-            # yield the content blocks
-            indicator_query = self.collections[str(collection_name)]
-
-            for indicator in find_indicators_by_time_frame(indicator_query, exclusive_begin_time, inclusive_end_time):
-                try:
-                    stix_xml_indicator = get_stix_indicator(indicator).to_xml(ns_dict={NAMESPACE_URI: NAMESPACE})
-                    content_block = ContentBlock(
-                        content_binding=CB_STIX_XML_11,
-                        content=stix_xml_indicator
-                    )
-
-                    content_xml = content_block.to_xml().decode('utf-8')
-                    yield f'{content_xml}\n'
-                except Exception as e:
-                    handle_long_running_error(f'Failed parsing indicator to STIX: {e}')
+            # yield the content blocks, page by page
+            for search_result in itertools.chain([first_search_result], pages):
+                for indicator in search_result.get('iocs') or []:
+                    try:
+                        content_xml = get_stix_content_block(indicator)
+                        yield f'{content_xml}\n'
+                    except Exception as e:
+                        handle_long_running_error(f'Failed parsing indicator to STIX: {e}')
 
             # yield the closing tag
 
@@ -492,6 +533,63 @@ TYPE_MAPPING = {
 }
 
 
+''' STIX Cache '''
+
+
+class STIXCache:
+    """
+    LRU cache of the content blocks of indicators, keyed by the indicator value, type and modified time, so polls of
+    indicators which were not modified do not convert them to STIX again.
+    """
+
+    def __init__(self, max_size: int = STIX_CACHE_SIZE):
+        self.max_size = max_size
+        self._content_blocks: OrderedDict = OrderedDict()
+
+    def get(self, key: Tuple) -> Optional[str]:
+        content_block = self._content_blocks.get(key)
+        if content_block is not None:
+            self._content_blocks.move_to_end(key)
+        return content_block
+
+    def set(self, key: Tuple, content_block: str):
+        self._content_blocks[key] = content_block
+        self._content_blocks.move_to_end(key)
+        while len(self._content_blocks) > self.max_size:
+            self._content_blocks.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._content_blocks)
+
+
+STIX_CACHE: STIXCache = STIXCache()
+
+
+def get_stix_content_block(indicator: dict, cache: STIXCache = STIX_CACHE) -> str:
+    """
+    Convert a Demisto indicator to a STIX XML content block, using the cache of the indicators which were converted.
+    Args:
+        indicator: The Demisto indicator.
+        cache: The cache of the converted indicators.
+
+    Returns:
+        The content block as XML string.
+    """
+    modified = indicator.get('modified')
+    key = (indicator.get('value'), indicator.get('indicator_type'), modified)
+    content_xml = cache.get(key) if modified else None
+    if content_xml is None:
+        stix_xml_indicator = get_stix_indicator(indicator).to_xml(ns_dict={NAMESPACE_URI: NAMESPACE})
+        content_block = ContentBlock(
+            content_binding=CB_STIX_XML_11,
+            content=stix_xml_indicator
+        )
+        content_xml = content_block.to_xml().decode('utf-8')
+        if modified:
+            cache.set(key, content_xml)
+    return content_xml
+
+
 def set_id_namespace(uri: str, name: str):
     """
     Set the XML namespace.
@@ -719,7 +817,51 @@ def get_collections(params: dict = demisto.params()) -> dict:
     return collections
 
 
-def find_indicators_by_time_frame(indicator_query: str, begin_time: datetime, end_time: datetime) -> list:
+def get_poll_response_size(params: dict = demisto.params()) -> int:
+    """
+    Gets the maximal number of indicators in a poll response part from the integration parameters.
+    """
+    poll_response_size: str = params.get('poll_response_size', '')
+    try:
+        return int(poll_response_size) if poll_response_size else 0
+    except ValueError:
+        raise ValueError('The maximal number of indicators in a poll response must be a number.')
+
+
+def encode_result_id(collection_name: str, begin_time: Optional[datetime], end_time: datetime) -> str:
+    """
+    Encode the poll request of a poll response which is split to parts as its result ID, so the next parts are
+    searched by the same time frame.
+    Args:
+        collection_name: The collection name.
+        begin_time: The exclusive begin time.
+        end_time: The inclusive end time.
+
+    Returns:
+        The result ID.
+    """
+    result = [collection_name, begin_time.isoformat() if begin_time else None, end_time.isoformat()]
+    return urlsafe_b64encode(json.dumps(result).encode('utf-8')).decode('utf-8')
+
+
+def decode_result_id(result_id: str) -> Tuple[str, Optional[datetime], datetime]:
+    """
+    Decode the poll request of a poll response from its result ID.
+    Args:
+        result_id: The result ID.
+
+    Returns:
+        The collection name, the exclusive begin time and the inclusive end time.
+    """
+    try:
+        collection_name, begin_time, end_time = json.loads(urlsafe_b64decode(result_id.encode('utf-8')))
+        return (collection_name, datetime.fromisoformat(begin_time) if begin_time else None,
+                datetime.fromisoformat(end_time))
+    except Exception:
+        raise ValueError('Invalid message, unknown result ID')
+
+
+def find_indicators_by_time_frame(indicator_query: str, begin_time: datetime, end_time: datetime) -> Iterator[dict]:
     """
     Find indicators according to a query and begin time/end time.
     Args:
@@ -730,7 +872,20 @@ def find_indicators_by_time_frame(indicator_query: str, begin_time: datetime, en
     Returns:
         Indicator query results from Demisto.
     """
+    return find_indicators_loop(get_time_frame_query(indicator_query, begin_time, end_time))
 
+
+def get_time_frame_query(indicator_query: str, begin_time: Optional[datetime], end_time: Optional[datetime]) -> str:
+    """
+    Add the begin time/end time to an indicator query.
+    Args:
+        indicator_query: The indicator query.
+        begin_time: The exclusive begin time.
+        end_time: The inclusive end time.
+
+    Returns:
+        The indicator query of the time frame.
+    """
     if indicator_query:
         indicator_query += ' and '
     else:
@@ -746,29 +901,43 @@ def find_indicators_by_time_frame(indicator_query: str, begin_time: datetime, en
         indicator_query += f'sourcetimestamp:<="{tz_end_time}"'
     demisto.info(f'Querying indicators by: {indicator_query}')
 
-    return find_indicators_loop(indicator_query)
+    return indicator_query
 
 
-def find_indicators_loop(indicator_query: str):
+def find_indicators_loop(indicator_query: str) -> Iterator[dict]:
     """
     Find indicators in a loop according to a query.
     Args:
         indicator_query: The indicator query.
 
     Returns:
-        Indicator query results from Demisto.
+        Indicator query results from Demisto, page by page.
+    """
+    for search_result in search_indicators_pages(indicator_query):
+        yield from search_result.get('iocs') or []
+
+
+def search_indicators_pages(indicator_query: str, first_page: int = 0, max_pages: int = 0) -> Iterator[dict]:
+    """
+    Search the pages of an indicator query, one page at a time.
+    Args:
+        indicator_query: The indicator query.
+        first_page: The first page to search.
+        max_pages: The maximal number of pages to search, 0 for all the pages.
+
+    Returns:
+        The search results of the pages. The first page is returned even if it is empty.
     """
-    iocs: List[dict] = []
-    total_fetched = 0
-    next_page = 0
-    last_found_len = PAGE_SIZE
-    while last_found_len == PAGE_SIZE:
-        fetched_iocs = demisto.searchIndicators(query=indicator_query, page=next_page, size=PAGE_SIZE).get('iocs')
-        iocs.extend(fetched_iocs)
-        last_found_len = len(fetched_iocs)
-        total_fetched += last_found_len
-        next_page += 1
-    return iocs
+    page = first_page
+    while True:
+        search_result = demisto.searchIndicators(query=indicator_query, page=page, size=PAGE_SIZE)
+        yield search_result
+        page += 1
+        total = search_result.get('total')
+        if len(search_result.get('iocs') or []) < PAGE_SIZE or (total is not None and page * PAGE_SIZE >= total):
+            break
+        if max_pages and page - first_page >= max_pages:
+            break
 
 
 def taxii_make_response(taxii_message: TAXIIMessage):
@@ -916,6 +1085,7 @@ def main():
     command = demisto.command()
     port = get_port(params)
     collections = get_collections(params)
+    poll_response_size = get_poll_response_size(params)
     server_links = demisto.demistoUrls()
     server_link_parts: ParseResult = urlparse(server_links.get('server'))
 
@@ -936,7 +1106,7 @@ def main():
         host_name = get_https_hostname(host_name)
 
     SERVER = TAXIIServer(f'{scheme}://{host_name}', port, collections,
-                         certificate, private_key, http_server, credentials)
+                         certificate, private_key, http_server, credentials, poll_response_size)
 
     demisto.debug(f'Command being called is {command}')
     commands = {
@@ -412,7 +412,7 @@ def test_find_indicators_loop(mocker):
     mocker.patch.object(demisto, 'searchIndicators', return_value=json.loads(IP_INDICATORS))
 
     # Arrange
-    indicators = find_indicators_loop('q')
+    indicators = list(find_indicators_loop('q'))
 
     # Assert
     assert len(indicators) == 1
@@ -435,3 +435,62 @@ def test_validate_indicators(indicator):
 
     # Assert
     assert sdv.validate_xml(tree)
+
+
+def test_get_stix_content_block_cache(mocker):
+    import TAXIIServer
+    from TAXIIServer import get_stix_content_block, STIXCache
+
+    # Set
+    get_stix_indicator = mocker.patch.object(TAXIIServer, 'get_stix_indicator',
+                                             wraps=TAXIIServer.get_stix_indicator)
+    cache = STIXCache(max_size=1)
+    indicator = json.loads(IP_INDICATORS)['iocs'][0]
+    modified_indicator = dict(indicator, modified='2020-03-01T00:00:00Z')
+
+    # Arrange
+    content_block = get_stix_content_block(indicator, cache)
+    cached_content_block = get_stix_content_block(indicator, cache)
+    get_stix_content_block(modified_indicator, cache)
+
+    # Assert
+    assert content_block == cached_content_block
+    assert '52.218.100.20' in content_block
+    assert get_stix_indicator.call_count == 2
+    assert len(cache) == 1
+
+
+def test_stream_stix_data_feed_parts(mocker):
+    import datetime
+    import pytz
+    import TAXIIServer
+    from TAXIIServer import TAXIIServer as Server, get_message_from_xml, PollFulfillmentRequest
+
+    # Set
+    mocker.patch.object(TAXIIServer, 'PAGE_SIZE', 1)
+    mocker.patch.object(demisto, 'info')
+    indicators = [dict(json.loads(IP_INDICATORS)['iocs'][0], value=f'1.1.1.{i}') for i in range(3)]
+    search_indicators = mocker.patch.object(
+        demisto, 'searchIndicators',
+        side_effect=lambda query, page, size: {'iocs': indicators[page:page + size], 'total': len(indicators)})
+    server = Server('http://localhost', 1111, {'IPs': 'type:IP'}, '', '', True, {}, poll_response_size=2)
+    begin_time = datetime.datetime(2020, 2, 10, 11, 32, 32, tzinfo=pytz.utc)
+
+    # Arrange
+    with TAXIIServer.APP.test_request_context():
+        first_part = server.stream_stix_data_feed(['IPs'], '1', 'IPs', begin_time, None).get_data().decode('utf-8')
+        poll_response = get_message_from_xml(first_part)
+        fulfillment = PollFulfillmentRequest('2', collection_name='IPs', result_id=poll_response.result_id,
+                                             result_part_number=2)
+        second_part = server.get_poll_response(fulfillment).get_data().decode('utf-8')
+    next_part = get_message_from_xml(second_part)
+
+    # Assert
+    assert poll_response.more
+    assert [block.content.count(b'1.1.1.') > 0 for block in poll_response.content_blocks] == [True, True]
+    assert not next_part.more
+    assert next_part.result_part_number == 2
+    assert len(next_part.content_blocks) == 1
+    assert b'1.1.1.2' in next_part.content_blocks[0].content
+    assert next_part.inclusive_end_timestamp_label == poll_response.inclusive_end_timestamp_label
+    assert [call[1]['page'] for call in search_indicators.call_args_list] == [0, 1, 2]
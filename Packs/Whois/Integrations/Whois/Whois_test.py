@@ -141,3 +141,167 @@ def test_query_result(whois_result, domain, expected):
     from Whois import create_outputs
     md, standard_ec, dbot_score = create_outputs(whois_result, domain)
     assert standard_ec['Whois']['QueryResult'] == expected
+
+
+@pytest.mark.parametrize('domain, expected', [
+    ('google.com', 'whois.verisign-grs.com'),
+    ('google.CO.UK', 'whois.nic.uk'),
+    ('test.uk.com', 'whois.centralnic.com'),
+    ('pizza.org', 'whois.pir.org'),
+    ('foo.example.com', 'whois.verisign-grs.com'),
+    ('bbc.ac.uk', 'whois.ja.net'),
+])
+def test_get_root_query_server(domain, expected):
+    from Whois import get_root_query_server
+    assert get_root_query_server(domain) == expected
+
+
+def test_get_root_server_unknown_tld():
+    from Whois import get_root_server, WhoisException
+    with pytest.raises(WhoisException):
+        get_root_server('google.notatld')
+
+
+def test_whois_cache(mocker):
+    integration_context = {}
+    mocker.patch.object(demisto, 'params', return_value={'cache_ttl': '1'})
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    raw = ['Domain Name: google.com\nName Server: ns1.google.com']
+    get_whois_raw = mocker.patch.object(Whois, 'get_whois_raw', return_value=(raw, ['whois.verisign-grs.com']))
+
+    cache = Whois.get_whois_cache()
+    assert Whois.get_whois('google.com', cache=cache)['nameservers'] == ['ns1.google.com']
+    cache.save()
+    assert list(integration_context['whois_cache']) == ['google.com@whois.verisign-grs.com']
+
+    cache = Whois.get_whois_cache()
+    assert Whois.get_whois('GOOGLE.com', cache=cache)['nameservers'] == ['ns1.google.com']
+    assert get_whois_raw.call_count == 1
+
+    integration_context['whois_cache']['google.com@whois.verisign-grs.com']['time'] -= 3600
+    cache = Whois.get_whois_cache()
+    Whois.get_whois('google.com', cache=cache)
+    assert get_whois_raw.call_count == 2
+
+
+class WhoisStandIn(object):
+    """
+    A local TCP stand-in for WHOIS servers, which answers every query after a delay and records the peak number of
+    concurrent queries.
+    """
+
+    def __init__(self, delay=0.2, silent_domains=()):
+        try:
+            import socketserver
+        except ImportError:
+            import SocketServer as socketserver
+        import threading
+
+        stand_in = self
+        self.delay = delay
+        self.silent_domains = silent_domains
+        self.queries = []
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                domain = self.rfile.readline().decode('utf-8').strip()
+                with stand_in.lock:
+                    stand_in.queries.append((domain, time.time()))
+                    stand_in.active += 1
+                    stand_in.peak = max(stand_in.peak, stand_in.active)
+                time.sleep(stand_in.delay * (10 if domain in stand_in.silent_domains else 1))
+                with stand_in.lock:
+                    stand_in.active -= 1
+                self.wfile.write('Domain Name: {0}\nName Server: ns1.{0}\n'.format(domain).encode('utf-8'))
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def whois_stand_in(mocker, request):
+    stand_in = WhoisStandIn()
+    request.addfinalizer(stand_in.close)
+    mocker.patch.object(Whois, 'WHOIS_PORT', stand_in.port)
+    mocker.patch.object(Whois, 'get_root_query_server', return_value='127.0.0.1')
+    mocker.patch.object(Whois, 'SERVER_BUCKETS', {})
+    return stand_in
+
+
+def test_get_whois_for_domains_concurrently(mocker, whois_stand_in):
+    mocker.patch.object(Whois, 'SERVER_RATE_LIMIT', 0)
+    domains = ['domain{}.com'.format(i) for i in range(8)]
+
+    start = time.time()
+    results = Whois.get_whois_for_domains(domains, concurrency=4)
+
+    assert [result['nameservers'] for result, _ in results] == [['ns1.{}'.format(domain)] for domain in domains]
+    assert whois_stand_in.peak == 4
+    assert time.time() - start < len(domains) * whois_stand_in.delay
+
+
+def test_get_whois_for_domains_rate_limit(mocker, whois_stand_in):
+    mocker.patch.object(Whois, 'SERVER_RATE_LIMIT', 2)
+    domains = ['domain{}.com'.format(i) for i in range(5)]
+
+    results = Whois.get_whois_for_domains(domains, concurrency=5)
+
+    assert all(error is None for _, error in results)
+    query_times = sorted(query_time for _, query_time in whois_stand_in.queries)
+    # a burst of 2 queries, and then 2 queries per second
+    assert query_times[-1] - query_times[0] >= 1.4
+
+
+def test_get_whois_for_domains_timeout(mocker, whois_stand_in):
+    import socket
+    mocker.patch.object(Whois, 'SERVER_RATE_LIMIT', 0)
+    mocker.patch.object(Whois, 'SOCKET_TIMEOUT', 0.5)
+    whois_stand_in.silent_domains = ('slow.com',)
+
+    results = Whois.get_whois_for_domains(['fast.com', 'slow.com'], concurrency=2)
+
+    assert results[0][0]['nameservers'] == ['ns1.fast.com']
+    assert isinstance(results[1][1], socket.timeout)
+
+
+@pytest.mark.parametrize('with_error', [False, True])
+def test_domain_command_query_failure(mocker, whois_stand_in, with_error):
+    """
+    Given
+    - Domains where the second is not supported by the Whois service.
+
+    When
+    - Looking them up concurrently with the domain command.
+
+    Then
+    - Ensure the results of the domains before it are returned in order, and then a single failure entry for it, as
+      an error or as a warning according to the with_error parameter.
+    """
+    mocker.patch.object(Whois, 'SERVER_RATE_LIMIT', 0)
+    mocker.patch.object(Whois, 'SHOULD_ERROR', with_error)
+    Whois.get_root_query_server.side_effect = \
+        lambda domain: Whois.get_root_server(domain) if domain.endswith('.aaa') else '127.0.0.1'
+    mocker.patch.object(demisto, 'args', return_value={'domain': 'first.com,unsupported.aaa,last.com'})
+    mocker.patch.object(demisto, 'results')
+
+    with pytest.raises(SystemExit):
+        Whois.domain_command()
+
+    results = [call[0][0] for call in demisto.results.call_args_list]
+    assert len(results) == 2
+    assert results[0]['EntryContext']['Domain(val.Name && val.Name == obj.Name)']['Name'] == 'first.com'
+    assert results[1]['Type'] == (Whois.entryTypes['error'] if with_error else Whois.entryTypes['warning'])
+    assert 'unsupported.aaa - is not supported' in results[1]['Contents']
+    assert results[1]['EntryContext'][Whois.outputPaths['domain']] == {
+        'Name': 'unsupported.aaa', 'Whois': {'QueryStatus': 'Failed'}}
@@ -2,7 +2,10 @@ import os
 import threading
 import sys
 import json
+import time
 import traceback
+import hashlib
+import collections
 
 if sys.version_info[0] < 3:
     import Queue as queue
@@ -394,8 +397,11 @@ print = demisto_print
 
 # notifies demisto server that the current executed script is completed
 # and the process is ready to execute the next script
-def send_script_completed():
-    json.dump({'type': 'completed'}, sys.stdout)
+def send_script_completed(compile_stats=None):
+    completed = {'type': 'completed'}
+    if compile_stats:
+        completed['args'] = compile_stats
+    json.dump(completed, sys.stdout)
     sys.stdout.write('\\n')
     sys.stdout.flush()
 
@@ -438,6 +444,34 @@ def rollback_system():
         os.environ[key] = backup_env_vars[key]
 
 
+# compiled code objects of the recently executed scripts, so a script which is executed again by this process
+# is not compiled again
+COMPILED_CODE_CACHE_SIZE = 16
+compiled_code_cache = collections.OrderedDict()
+compile_cache_hits = 0
+compile_cache_misses = 0
+
+
+def get_compiled_code(code_string, is_integ_script):
+    global compile_cache_hits
+    global compile_cache_misses
+    key = (bool(is_integ_script), hashlib.sha256(code_string.encode('utf-8')).hexdigest())
+    code = compiled_code_cache.pop(key, None)
+    if code is not None:
+        compile_cache_hits += 1
+    else:
+        compile_cache_misses += 1
+        if is_integ_script:
+            complete_code = integ_template_code.replace('###CODE_HERE###', code_string)
+        else:
+            complete_code = template_code.replace('###CODE_HERE###', code_string)
+        code = compile(complete_code, '<string>', 'exec')
+        if len(compiled_code_cache) >= COMPILED_CODE_CACHE_SIZE:
+            compiled_code_cache.popitem(last=False)
+    compiled_code_cache[key] = code
+    return code
+
+
 while True:
     contextString = do_ping_pong()
     if contextString == '':
@@ -450,14 +484,11 @@ while True:
     contextJSON.pop('script', None)
 
     is_integ_script = contextJSON['integration']
-    complete_code = ''
-    if is_integ_script:
-        complete_code = integ_template_code.replace('###CODE_HERE###', code_string)
-    else:
-        complete_code = template_code.replace('###CODE_HERE###', code_string)
-
+    compile_time = 0
+    compile_start = time.time()
     try:
-        code = compile(complete_code, '<string>', 'exec')
+        code = get_compiled_code(code_string, is_integ_script)
+        compile_time = time.time() - compile_start
 
         sub_globals = {
             '__readWhileAvailable': __readWhileAvailable,
@@ -476,8 +507,12 @@ while True:
 
     rollback_system()
 
-    # ping back to Demisto server that script is completed
-    send_script_completed()
+    # ping back to Demisto server that script is completed, with the compiled code cache statistics
+    send_script_completed({
+        'compileCacheHits': compile_cache_hits,
+        'compileCacheMisses': compile_cache_misses,
+        'compileTime': compile_time
+    })
 
     # if the script running on native python then terminate the process after finished the script
     is_python_native = contextJSON['native']